@@ -0,0 +1,255 @@
+import asyncio
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Union
+
+from ytb2audiobot import config
+from ytb2audiobot.logger import logger
+from ytb2audiobot.utils import get_data_dir
+
+INDEX_FILENAME = '.cache-index.json'
+
+KIND_MASTER = 'master'
+KIND_AUDIO = 'audio'
+KIND_THUMBNAIL = 'thumbnail'
+KIND_SUMMARY = 'summary'
+KIND_INFO = 'info'
+KIND_SEGMENT = 'segment'
+KIND_OTHER = 'other'
+
+_SEGMENT_NAME_PATTERN = re.compile(r'-p\d+-of\d+\.\w+$')
+
+
+def get_artifact_kind(name: str) -> str:
+    """Classify a data dir file by its name, e.g. `{movie_id}-48k.m4a` is audio."""
+    if _SEGMENT_NAME_PATTERN.search(name):
+        return KIND_SEGMENT
+    if name.endswith('-thumbnail.jpg'):
+        return KIND_THUMBNAIL
+    if name.endswith('-summary.json'):
+        return KIND_SUMMARY
+    if name.endswith('-info.json'):
+        return KIND_INFO
+    if '-master.' in name:
+        return KIND_MASTER
+    if name.endswith('.m4a'):
+        return KIND_AUDIO
+    return KIND_OTHER
+
+
+class DataCache:
+    """Size-bounded cache of the data dir: downloaded audio, thumbnails, summaries and split segments.
+
+    Files are named after the movie id and the parameters they were made with, so a file name is its cache key.
+    The in-memory index keeps size and hit count of every file. When the data dir grows over the byte budget
+    the least valuable files are removed using LFU with dynamic aging: the priority of a file is the number of
+    its hits plus the cache "age" at the moment of the last hit, and the age grows to the priority of every
+    evicted file. Hot videos stay, one-off ones leave first, and once-popular files cannot stay forever.
+
+    Files of a movie are pinned while a job works with them and are never evicted (see `pinned`).
+    The index is persisted into the data dir and restored on startup, so the warm cache survives restarts.
+    """
+
+    def __init__(self, dir_path: Union[Path, str], max_bytes: int = config.DATA_CACHE_MAX_BYTES):
+        """
+        Initialize the cache.
+
+        Args:
+            dir_path (Union[Path, str]): Data dir with cached files.
+            max_bytes (int): Disk budget in bytes. 0 disables eviction.
+        """
+        self.dir_path = Path(dir_path)
+        self.max_bytes = max_bytes
+
+        # name -> {'kind', 'size', 'hits', 'priority', 'last_access'}
+        self.entries: Dict[str, dict] = {}
+        # Prefix (usually movie id) -> number of jobs using files with this prefix
+        self._pins: Dict[str, int] = {}
+        self._age = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+
+    @property
+    def index_path(self) -> Path:
+        return self.dir_path / INDEX_FILENAME
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(entry.get('size', 0) for entry in self.entries.values())
+
+    def _new_entry(self, name: str, size: int, hits: int = 0) -> dict:
+        return {
+            'kind': get_artifact_kind(name),
+            'size': size,
+            'hits': hits,
+            'priority': self._age + hits,
+            'last_access': time.time()}
+
+    def restore(self) -> None:
+        """Load the persisted index and reconcile it with files actually present in the data dir."""
+        if self.index_path.exists():
+            try:
+                with self.index_path.open('r', encoding='utf-8') as file:
+                    data = json.load(file)
+                self._age = float(data.get('age', 0.0))
+                self.entries = data.get('entries', {})
+            except Exception as e:
+                logger.error(f'❌🗂 Unable to restore cache index {self.index_path}: {e}')
+                self.entries = {}
+
+        self.scan(self._list_files())
+        logger.info(f'🗂 Cache index restored: {len(self.entries)} files, {self.total_bytes} bytes.')
+
+    def save(self) -> None:
+        """Persist the index into the data dir."""
+        tmp_path = self.index_path.with_suffix('.tmp')
+        try:
+            with tmp_path.open('w', encoding='utf-8') as file:
+                json.dump({'age': self._age, 'entries': self.entries}, file)
+            os.replace(tmp_path, self.index_path)
+        except Exception as e:
+            logger.error(f'❌🗂 Unable to save cache index {self.index_path}: {e}')
+
+    def _list_files(self) -> Dict[str, int]:
+        """Return sizes of files in the data dir by name."""
+        present = {}
+        if not self.dir_path.exists():
+            return present
+
+        with os.scandir(self.dir_path) as it:
+            for item in it:
+                if item.name.startswith(INDEX_FILENAME) or not item.is_file():
+                    continue
+                present[item.name] = item.stat().st_size
+        return present
+
+    def scan(self, present: Dict[str, int]) -> None:
+        """
+        Add files which appeared in the data dir since the last scan and drop entries of vanished ones.
+
+        Args:
+            present (Dict[str, int]): Sizes of files currently in the data dir, see `_list_files`.
+        """
+        for name in list(self.entries):
+            if name not in present:
+                del self.entries[name]
+
+        for name, size in present.items():
+            entry = self.entries.get(name)
+            if entry is None:
+                self.entries[name] = self._new_entry(name, size)
+            else:
+                # File may still be growing while it is downloaded
+                entry['size'] = size
+
+    def touch(self, *paths: Union[Path, str]) -> None:
+        """Count a hit for every existing file and a miss for every absent one."""
+        for path in paths:
+            if path is None:
+                continue
+            path = Path(path)
+            if not path.exists():
+                self.misses += 1
+                continue
+
+            self.hits += 1
+            entry = self.entries.get(path.name)
+            if entry is None:
+                entry = self.entries[path.name] = self._new_entry(path.name, path.stat().st_size)
+            entry['hits'] += 1
+            entry['priority'] = self._age + entry['hits']
+            entry['last_access'] = time.time()
+
+    def is_pinned(self, name: str) -> bool:
+        return any(name.startswith(prefix) for prefix in self._pins)
+
+    @contextmanager
+    def pinned(self, prefix: str):
+        """
+        Context manager that protects files starting with `prefix` from eviction.
+
+        Args:
+            prefix (str): Usually the movie id, which prefixes every file of a movie.
+        """
+        if not prefix:
+            yield
+            return
+
+        self._pins[prefix] = self._pins.get(prefix, 0) + 1
+        try:
+            yield
+        finally:
+            self._pins[prefix] -= 1
+            if self._pins[prefix] <= 0:
+                del self._pins[prefix]
+
+    def _select_victims(self) -> list:
+        overflow = self.total_bytes - self.max_bytes
+        if overflow <= 0:
+            return []
+
+        victims = []
+        candidates = sorted(
+            ((name, entry) for name, entry in self.entries.items() if not self.is_pinned(name)),
+            key=lambda item: (item[1].get('priority', 0), item[1].get('last_access', 0)))
+        for name, entry in candidates:
+            if overflow <= 0:
+                break
+            victims.append(name)
+            overflow -= entry.get('size', 0)
+            self._age = max(self._age, entry.get('priority', 0))
+
+        return victims
+
+    async def enforce_budget(self, _params=None) -> None:
+        """Rescan the data dir and evict files over the byte budget. Signature fits `run_periodically`."""
+        if not self.max_bytes or config.KEEP_DATA_FILES or config.DEBUG_MODE:
+            return
+
+        # Listing runs in a thread, the index itself is changed only in the event loop
+        self.scan(await asyncio.to_thread(self._list_files))
+
+        victims = self._select_victims()
+        for name in victims:
+            entry = self.entries.pop(name, {})
+            try:
+                await asyncio.to_thread((self.dir_path / name).unlink, True)
+            except Exception as e:
+                logger.error(f'❌🗂 Unable to evict {name}: {e}')
+                continue
+            self.evicted_files += 1
+            self.evicted_bytes += entry.get('size', 0)
+
+        if victims:
+            logger.debug(f'🗂 Evicted {len(victims)} files. Cache: {self.total_bytes} of {self.max_bytes} bytes.')
+            await asyncio.to_thread(self.save)
+
+    def stats(self) -> dict:
+        """Return a snapshot of cache usage."""
+        by_kind = {}
+        for entry in self.entries.values():
+            by_kind[entry.get('kind')] = by_kind.get(entry.get('kind'), 0) + entry.get('size', 0)
+        return {
+            'files': len(self.entries),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'bytes_by_kind': by_kind,
+            'pinned_prefixes': len(self._pins),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evicted_files': self.evicted_files,
+            'evicted_bytes': self.evicted_bytes}
+
+    async def log_stats(self, _params=None) -> None:
+        """Log cache stats. Signature fits `run_periodically`."""
+        logger.info(f'🗂 Data cache stats: {self.stats()}')
+
+
+data_cache = DataCache(dir_path=get_data_dir())
@@ -6,9 +6,17 @@ BUTTON_CHANNEL_WAITING_DOWNLOADING_TIMEOUT_SEC = int(os.getenv('Y2A_BUTTON_CHANN
 
 KILL_JOB_DOWNLOAD_TIMEOUT_SEC = int(os.getenv('Y2A_KILL_JOB_DOWNLOAD_TIMEOUT_SEC', 42 * 60))
 
+# Self-hosted Telegram Bot API server, e.g. http://localhost:8081. It accepts files up to 2000 MB instead of 50 MB.
+TELEGRAM_API_SERVER_URL = os.getenv('Y2A_TELEGRAM_API_SERVER_URL', '')
+
+# The server runs with --local on the same host and reads uploaded files by path
+TELEGRAM_API_SERVER_LOCAL_FILES = bool(os.getenv('Y2A_TELEGRAM_API_SERVER_LOCAL_FILES', 'false').lower() == 'true')
+
 SEGMENT_AUDIO_DURATION_SEC = int(os.getenv('Y2A_SEGMENT_AUDIO_DURATION_SEC', 39 * 60))
 
-SEGMENT_AUDIO_DURATION_SPLIT_THRESHOLD_SEC = int(os.getenv('Y2A_SEGMENT_AUDIO_DURATION_SPLIT_THRESHOLD_SEC', 101 * 60))
+# With a local Bot API server audio is split only when it does not fit the file size limit
+SEGMENT_AUDIO_DURATION_SPLIT_THRESHOLD_SEC = int(os.getenv(
+    'Y2A_SEGMENT_AUDIO_DURATION_SPLIT_THRESHOLD_SEC', 24 * 60 * 60 if TELEGRAM_API_SERVER_URL else 101 * 60))
 
 SEGMENT_DURATION_PADDING_SEC = int(os.getenv('Y2A_SEGMENT_DURATION_PADDING_SEC', 6))
 
@@ -25,12 +33,99 @@ DEBUG_MODE = bool(os.getenv('Y2A_DEBUG_MODE', 'false').lower() == 'true')
 
 KEEP_DATA_FILES = bool(os.getenv('Y2A_KEEP_DATA_FILES', 'false').lower() == 'true')
 
-REMOVE_AGED_DATA_FILES_SEC = int(os.getenv('Y2A_REMOVE_AGED_DATA_FILES_SEC', 60 * 60))
+DATA_CACHE_MAX_BYTES = int(os.getenv('Y2A_DATA_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
 
 AUTO_DOWNLOAD_CHAT_IDS_STORAGE_FILENAME = os.getenv('Y2A_AUTO_DOWNLOAD_CHAT_IDS_STORAGE_FILENAME', 'autodownload-hashed-chat-ids.yaml')
 
 REPLY_TO_ORIGINAL = bool(os.getenv('Y2A_REPLY_TO_ORIGINAL', 'true').lower() == 'true')
 
+SCHEDULER_MAX_CONCURRENT_JOBS = int(os.getenv('Y2A_SCHEDULER_MAX_CONCURRENT_JOBS', 4))
+
+SCHEDULER_MAX_CPU_STAGES = int(os.getenv('Y2A_SCHEDULER_MAX_CPU_STAGES', os.cpu_count() or 2))
+
+SCHEDULER_MAX_NETWORK_STAGES = int(os.getenv('Y2A_SCHEDULER_MAX_NETWORK_STAGES', 3))
+
+SCHEDULER_STATS_LOG_INTERVAL_SEC = int(os.getenv('Y2A_SCHEDULER_STATS_LOG_INTERVAL_SEC', 10 * 60))
+
+JOB_STORE_FILENAME = os.getenv('Y2A_JOB_STORE_FILENAME', 'jobs.sqlite3')
+
+JOB_MAX_ATTEMPTS = int(os.getenv('Y2A_JOB_MAX_ATTEMPTS', 3))
+
+SHUTDOWN_DRAIN_TIMEOUT_SEC = int(os.getenv('Y2A_SHUTDOWN_DRAIN_TIMEOUT_SEC', 60))
+
+FILE_ID_CACHE_FILENAME = os.getenv('Y2A_FILE_ID_CACHE_FILENAME', 'telegram-file-ids.sqlite3')
+
+FILE_ID_CACHE_ENABLED = bool(os.getenv('Y2A_FILE_ID_CACHE_ENABLED', 'true').lower() == 'true')
+
+TELEGRAM_GLOBAL_MESSAGES_PER_SEC = float(os.getenv('Y2A_TELEGRAM_GLOBAL_MESSAGES_PER_SEC', 30))
+
+TELEGRAM_CHAT_MESSAGES_PER_MIN = float(os.getenv('Y2A_TELEGRAM_CHAT_MESSAGES_PER_MIN', 20))
+
+TELEGRAM_SEND_MAX_ATTEMPTS = int(os.getenv('Y2A_TELEGRAM_SEND_MAX_ATTEMPTS', 5))
+
+UPLOAD_STORAGE_CHAT_ID = os.getenv('Y2A_UPLOAD_STORAGE_CHAT_ID', '')
+
+UPLOAD_AS_MEDIA_GROUP = bool(os.getenv('Y2A_UPLOAD_AS_MEDIA_GROUP', 'false').lower() == 'true')
+
+METADATA_CACHE_MAX_ITEMS = int(os.getenv('Y2A_METADATA_CACHE_MAX_ITEMS', 1000))
+
+METADATA_CACHE_TTL_SEC = int(os.getenv('Y2A_METADATA_CACHE_TTL_SEC', 60 * 60))
+
+METADATA_CACHE_NEGATIVE_TTL_SEC = int(os.getenv('Y2A_METADATA_CACHE_NEGATIVE_TTL_SEC', 2 * 60))
+
+METADATA_CACHE_FILENAME = os.getenv('Y2A_METADATA_CACHE_FILENAME', 'metadata-cache.json')
+
+# Download the best audio once per movie and encode bitrates locally instead of downloading per bitrate
+TRANSCODE_FROM_MASTER = bool(os.getenv('Y2A_TRANSCODE_FROM_MASTER', 'true').lower() == 'true')
+
+# Audio stream of the movie is copied without encoding if its bitrate differs from the requested one by at most this share
+REMUX_BITRATE_TOLERANCE = float(os.getenv('Y2A_REMUX_BITRATE_TOLERANCE', 0.2))
+
+# Long audio is encoded in this many time chunks at once, each in its own ffmpeg process
+TRANSCODE_PARALLEL_CHUNKS = int(os.getenv('Y2A_TRANSCODE_PARALLEL_CHUNKS', os.cpu_count() or 2))
+
+TRANSCODE_CHUNK_MIN_SEC = int(os.getenv('Y2A_TRANSCODE_CHUNK_MIN_SEC', 20 * 60))
+
+# Comma separated bitrates encoded in the same ffmpeg run as the requested one, e.g. '48k,320k'
+TRANSCODE_PREPARE_BITRATES = os.getenv('Y2A_TRANSCODE_PREPARE_BITRATES', '')
+
+# Long audio is downloaded, encoded and cut in one pipe, every part is sent as soon as it is complete
+STREAMING_PIPELINE = bool(os.getenv('Y2A_STREAMING_PIPELINE', 'false').lower() == 'true')
+
+# Audio expected to be smaller is downloaded and encoded through pipes into memory and uploaded from there. 0 disables.
+IN_MEMORY_MAX_BYTES = int(os.getenv('Y2A_IN_MEMORY_MAX_BYTES', 20 * 1024 * 1024))
+
+# Save audio uploaded from memory into the data dir afterwards
+IN_MEMORY_SAVE_TO_CACHE = bool(os.getenv('Y2A_IN_MEMORY_SAVE_TO_CACHE', 'true').lower() == 'true')
+
+# Download the audio format by its URL from the info-json with resume, instead of by yt-dlp
+DIRECT_DOWNLOAD = bool(os.getenv('Y2A_DIRECT_DOWNLOAD', 'true').lower() == 'true')
+
+DOWNLOAD_MAX_ATTEMPTS = int(os.getenv('Y2A_DOWNLOAD_MAX_ATTEMPTS', 5))
+
+DOWNLOAD_TIMEOUT_SEC = float(os.getenv('Y2A_DOWNLOAD_TIMEOUT_SEC', 30))
+
+# Size of one range request of a direct download, if the format does not set its own
+DOWNLOAD_CHUNK_SIZE = int(os.getenv('Y2A_DOWNLOAD_CHUNK_SIZE', 10 * 1024 * 1024))
+
+# Parallel connections of one direct download. The number actually used is tuned by the measured throughput.
+DOWNLOAD_MAX_CONNECTIONS = int(os.getenv('Y2A_DOWNLOAD_MAX_CONNECTIONS', 8))
+
+# Connections of all direct downloads together, split equally between them
+DOWNLOAD_MAX_CONNECTIONS_TOTAL = int(os.getenv('Y2A_DOWNLOAD_MAX_CONNECTIONS_TOTAL', 16))
+
+# Bandwidth of all direct downloads together, split equally between them. 0 is unlimited.
+DOWNLOAD_BANDWIDTH_BYTES_PER_SEC = int(os.getenv('Y2A_DOWNLOAD_BANDWIDTH_BYTES_PER_SEC', 0))
+
+EXTRACTOR_POOL_MAX_WORKERS = int(os.getenv('Y2A_EXTRACTOR_POOL_MAX_WORKERS', 4))
+
+PROGRESS_EDIT_MIN_INTERVAL_SEC = float(os.getenv('Y2A_PROGRESS_EDIT_MIN_INTERVAL_SEC', 3))
+
+# Values: 'native' (in-process MP4 remux, ffmpeg as fallback), 'ffmpeg'
+SPLIT_ENGINE = os.getenv('Y2A_SPLIT_ENGINE', 'native')
+
+SPLIT_FALLBACK_MAX_PARALLEL = int(os.getenv('Y2A_SPLIT_FALLBACK_MAX_PARALLEL', 2))
+
 # RETRY_JOB_ENABLED = os.getenv('Y2A_RETRY_JOB_ENABLED', 'true').lower() == 'true'
 # RETRY_JOB_ATTEMPT_INTERVAL = os.getenv('Y2A_RETRY_JOB_ATTEMPT_INTERVAL', 5 * 60)
 # RETRY_JOB_MAX_RETRY_DURATION = os.getenv('Y2A_RETRY_JOB_MAX_RETRY_DURATION', 2 * 60 * 60)
@@ -49,9 +144,11 @@ DATA_DIR_NAME = 'data'
 
 TELEGRAM_MAX_CAPTION_TEXT_SIZE = 1024 - 2
 
+TELEGRAM_MEDIA_GROUP_MAX_SIZE = 10
+
 TELEGRAM_MAX_MESSAGE_TEXT_SIZE = 4096 - 4
 
-TELEGRAM_MAX_FILE_SIZE_BYTES = 47000000
+TELEGRAM_MAX_FILE_SIZE_BYTES = 1950000000 if TELEGRAM_API_SERVER_URL else 47000000
 
 TELEGRAM_VALID_TOKEN_IMAGINARY_DEFAULT = '123456789:AAE_O0RiWZRJOeOB8Nn8JWia_uUTqa2bXGU'
 
@@ -1,15 +1,49 @@
 
+import asyncio
+import json
+import os
 import pathlib
-from typing import Optional, List, Dict
+import re
+import shlex
+import tempfile
+import time
+from concurrent.futures.process import BrokenProcessPool
+from string import Template
+from typing import Callable, Optional, List, Dict, Tuple
 
 from audio2splitted.audio2splitted import time_format
-from audio2splitted.utils import run_cmds
 from ytbtimecodes.timecodes import standardize_time_format
 
+from ytb2audiobot import config
+
 from ytb2audiobot.utils import capital2lower, get_short_youtube_url_with_http, timedelta_from_seconds
 from ytb2audiobot.utils import run_command
 
 from ytb2audiobot.logger import logger
+from ytb2audiobot.extractor_pool import extractor_pool
+from ytb2audiobot.download_manager import download_manager, get_existing_artifact, get_staging_path, publish_artifact
+from ytb2audiobot.mp4_index import Mp4AudioIndex
+from ytb2audiobot.mp4_split import split_m4a_natively
+from ytb2audiobot.scheduler import job_scheduler, STAGE_CPU
+from ytb2audiobot.transcode import get_metadata_args, run_ffmpeg
+
+SPLIT_ENGINE_NATIVE = 'native'
+SPLIT_ENGINE_FFMPEG = 'ffmpeg'
+
+# Format URLs in yt-dlp info expire after about 6 hours
+INFO_JSON_MAX_AGE_SEC = 3 * 60 * 60
+
+# Extensions of audio containers yt-dlp may save the best audio format into
+MASTER_AUDIO_SUFFIXES = {'.webm', '.m4a', '.mp4', '.opus', '.ogg', '.mka', '.mp3', '.aac'}
+
+# Best audio format as is: no re-encoding, so any bitrate can be derived from it later
+YT_DLP_MASTER_OPTIONS = '--format bestaudio/best --embed-metadata --newline'
+
+# One native audio-only format of the movie, copied into .m4a as is
+YT_DLP_NATIVE_AUDIO_OPTIONS = Template('--format $format_id --embed-metadata --newline')
+
+# yt-dlp progress line, e.g. "[download]  42.3% of   12.34MiB at    1.23MiB/s ETA 00:08"
+YT_DLP_PROGRESS_PATTERN = re.compile(r'^\[download\]\s+(\d+(?:\.\d+)?)%')
 
 
 def get_timecodes_formatted_text(timecodes_dict: Dict[int, Dict], start_time: int = 0) -> str:
@@ -29,22 +63,26 @@ def get_timecodes_formatted_text(timecodes_dict: Dict[int, Dict], start_time: in
         return ''
 
     formatted_timecodes = []
-    for time, value in timecodes_dict.items():
+    for ts, value in timecodes_dict.items():
         # Adjust the time relative to the start_time, ensuring it remains positive
-        adjusted_time = max(0, time - start_time)
+        adjusted_time = max(0, ts - start_time)
 
         try:
             _time = standardize_time_format(timedelta_from_seconds(adjusted_time))
             title = capital2lower(value.get('title', 'Untitled'))
             formatted_timecodes.append(f"{_time} - {title}")
         except Exception as e:
-            logger.error(f"❌ Error processing timecode at {time}: {e}")
+            logger.error(f"❌ Error processing timecode at {ts}: {e}")
             continue
 
     return '\n'.join(formatted_timecodes)
 
 
-async def make_split_audio_second(audio_path: pathlib.Path, segments: list) -> list:
+async def make_split_audio_second(
+        audio_path: pathlib.Path,
+        segments: list,
+        reuse_existing: bool = False,
+        audio_index: Optional[Mp4AudioIndex] = None) -> list:
     if segments is None:
         segments = []
 
@@ -52,26 +90,69 @@ async def make_split_audio_second(audio_path: pathlib.Path, segments: list) -> l
         segments[0]['path'] = audio_path
         return segments
 
-    convert_option = '-c copy'
-    if audio_path.suffix == '.mp3':
-        pass
-
-    cmds_list = []
     for idx, segment in enumerate(segments):
-        segment_file = audio_path.with_stem(f'{audio_path.stem}-p{idx + 1}-of{len(segments)}')
-        segments[idx]['path'] = segment_file
-        cmd = (
-            f'ffmpeg -i {audio_path.as_posix()} -ss {time_format(segment['start'])} -to {time_format(segment['end'])} {convert_option} -y {segment_file.as_posix()}')
-        cmds_list.append(cmd)
+        segments[idx]['path'] = audio_path.with_stem(f'{audio_path.stem}-p{idx + 1}-of{len(segments)}')
 
-    logger.debug(f'💜 split_audio: {cmds_list}')
+    if reuse_existing and all(segment['path'].exists() for segment in segments):
+        logger.debug('💜 split_audio: Reuse existing segment files')
+        return segments
+
+    # Plain AAC in MP4 is cut in-process by copying sample ranges. Anything else goes to ffmpeg.
+    if config.SPLIT_ENGINE == SPLIT_ENGINE_NATIVE and audio_path.suffix in ('.m4a', '.mp4'):
+        if await asyncio.to_thread(split_m4a_natively, audio_path, segments, audio_index):
+            logger.debug("💜💜 split_audio: Done natively")
+            return segments
+
+    # All segments in one demux pass: one input, one output per segment with its own output-side cut.
+    # Segment muxer is not used because paddings make neighbour segments overlap.
+    outputs = ' '.join(
+        f'-map 0:a -ss {time_format(segment["start"])} -to {time_format(segment["end"])} -c copy {segment["path"].as_posix()}'
+        for segment in segments)
+    cmd = f'ffmpeg -hide_banner -loglevel error -y -i {audio_path.as_posix()} {outputs}'
+    logger.debug(f'💜 split_audio: {cmd}')
+
+    _stdout, stderr, return_code = await run_command(cmd)
+
+    if return_code != 0 or not all(segment['path'].exists() for segment in segments):
+        logger.error(f'💜❌ split_audio: Single pass failed. Fallback to one process per segment.\n{stderr}')
+        if not await split_audio_by_segment_processes(audio_path, segments):
+            logger.error('💜❌ split_audio: Fallback split failed.')
+            # Partial parts must not be reused or uploaded later
+            for segment in segments:
+                segment['path'].unlink(missing_ok=True)
+            return []
 
-    results, all_success = await run_cmds(cmds_list)
     logger.debug("💜💜 split_audio: Done")
 
     return segments
 
 
+async def split_audio_by_segment_processes(audio_path: pathlib.Path, segments: list) -> bool:
+    """
+    Cuts every segment by its own ffmpeg process with bounded parallelism.
+
+    Args:
+        audio_path (pathlib.Path): Source audio.
+        segments (list): Segments with 'start', 'end' and target 'path'.
+
+    Returns:
+        bool: True if all processes succeeded.
+    """
+    semaphore = asyncio.Semaphore(max(1, config.SPLIT_FALLBACK_MAX_PARALLEL))
+
+    async def split_one(segment: dict):
+        # Input-side seek: ffmpeg jumps to the start instead of demuxing everything before it
+        cmd = (
+            f'ffmpeg -hide_banner -loglevel error -y -ss {time_format(segment["start"])} -to {time_format(segment["end"])} '
+            f'-i {audio_path.as_posix()} -map 0:a -c copy {segment["path"].as_posix()}')
+        async with semaphore:
+            _stdout, _stderr, return_code = await run_command(cmd)
+        return return_code == 0
+
+    results = await asyncio.gather(*(split_one(segment) for segment in segments))
+    return all(results)
+
+
 def get_chapters(chapters_yt_info: List[Dict]) -> Dict[int, Dict]:
     """
     Extracts chapters with start times and titles from YouTube chapter information.
@@ -95,8 +176,8 @@ def get_chapters(chapters_yt_info: List[Dict]) -> Dict[int, Dict]:
             continue
 
         try:
-            time = int(start_time)
-            chapters[time] = {'title': title, 'type': 'chapter'}
+            ts = int(start_time)
+            chapters[ts] = {'title': title, 'type': 'chapter'}
         except ValueError:
             continue  # Skip entries where start_time is not a valid integer
 
@@ -118,11 +199,11 @@ def get_timecodes_dict(timecodes: Optional[List]) -> Dict:
 
     timecodes_dict = {}
     for timecode in timecodes:
-        time = timecode.get('time')
+        ts = timecode.get('time')
         title = timecode.get('title')
 
-        if time is not None:  # Ensure the 'time' key exists and is not None
-            timecodes_dict[time] = {
+        if ts is not None:  # Ensure the 'time' key exists and is not None
+            timecodes_dict[ts] = {
                 'title': title if title else 'Untitled',  # Default to 'Untitled' if no title is provided
                 'type': 'timecode'
             }
@@ -139,9 +220,221 @@ def filter_timecodes_within_bounds(timecodes: dict, start_time: int, end_time: i
 async def empty() -> Optional[pathlib.Path]:
     return
 
+async def run_yt_dlp(
+        args: str,
+        on_progress: Optional[Callable[[float], None]] = None) -> Tuple[str, str, Optional[int]]:
+    """
+    Runs yt-dlp with command line arguments in the extractor pool, or as a `yt-dlp` command if the pool is off.
+
+    Args:
+        args (str): Arguments of the `yt-dlp` command, URL included.
+        on_progress (Optional[Callable[[float], None]]): Called with the download percent.
+
+    Returns:
+        Tuple[str, str, Optional[int]]: stdout, stderr and return code as from `run_command`.
+    """
+    if extractor_pool.enabled:
+        try:
+            return_code, error_text = await extractor_pool.run(shlex.split(args), on_progress=on_progress)
+            return '', error_text, return_code
+        except BrokenProcessPool:
+            logger.error('❌ Extractor pool is broken. Run yt-dlp command instead.')
+
+    def parse_progress(line: str):
+        if on_progress is not None and (match := YT_DLP_PROGRESS_PATTERN.match(line)):
+            on_progress(float(match.group(1)))
+
+    return await run_command(f'yt-dlp {args}', on_line=parse_progress)
+
+
+def get_info_json_path(movie_id: str, dir_path: pathlib.Path) -> pathlib.Path:
+    return pathlib.Path(dir_path) / f'{movie_id}-info.json'
+
+
+def write_info_json(yt_info: dict, output_path: pathlib.Path) -> Optional[pathlib.Path]:
+    """
+    Saves already extracted movie info, so yt-dlp can download with `--load-info-json` instead of
+    fetching the watch page, player JS and formats again.
+
+    Format URLs expire after a few hours, so older files are not used, see `INFO_JSON_MAX_AGE_SEC`.
+
+    Args:
+        yt_info (dict): Sanitized info from `extract_info`.
+        output_path (pathlib.Path): Path of the info-json file.
+
+    Returns:
+        Optional[pathlib.Path]: Path to the file, or None if it could not be written.
+    """
+    output_path = pathlib.Path(output_path)
+    # Jobs of the same movie may write it at the same time, so every writer has its own temporary file
+    fd, tmp_name = tempfile.mkstemp(dir=output_path.parent, prefix=output_path.name, suffix='.part')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            json.dump(yt_info, file)
+        os.replace(tmp_name, output_path)
+    except (OSError, TypeError, ValueError) as e:
+        logger.error(f'❌ Unable to write info json {output_path}: {e}')
+        pathlib.Path(tmp_name).unlink(missing_ok=True)
+        return None
+
+    return output_path
+
+
+def is_info_json_fresh(info_json_path: pathlib.Path) -> bool:
+    try:
+        return time.time() - pathlib.Path(info_json_path).stat().st_mtime < INFO_JSON_MAX_AGE_SEC
+    except OSError:
+        return False
+
+
+async def run_yt_dlp_for_movie(
+        movie_id: str,
+        args: str,
+        info_json_path: Optional[pathlib.Path] = None,
+        on_progress: Optional[Callable[[float], None]] = None) -> Tuple[str, str, Optional[int]]:
+    """
+    Runs yt-dlp for a movie from its info-json if given, otherwise or if that fails from its URL.
+
+    Args:
+        movie_id (str): The YouTube video ID.
+        args (str): Arguments of the `yt-dlp` command without URL.
+        info_json_path (Optional[pathlib.Path]): Info-json written by `write_info_json`.
+        on_progress (Optional[Callable[[float], None]]): Called with the download percent.
+
+    Returns:
+        Tuple[str, str, Optional[int]]: stdout, stderr and return code as from `run_command`.
+    """
+    if info_json_path is not None and is_info_json_fresh(info_json_path):
+        stdout, stderr, return_code = await run_yt_dlp(
+            f'{args} --load-info-json "{pathlib.Path(info_json_path).as_posix()}"', on_progress=on_progress)
+        if return_code == 0:
+            return stdout, stderr, return_code
+        logger.info(f'🪭 Download from info json failed for {movie_id}, fetch the movie page again: {stderr}')
+
+    return await run_yt_dlp(f'{args} {get_short_youtube_url_with_http(movie_id)}', on_progress=on_progress)
+
+
+def find_master_audio(movie_id: str, dir_path: pathlib.Path) -> Optional[pathlib.Path]:
+    """Return the master audio of the movie if it is in the data dir."""
+    for path in pathlib.Path(dir_path).glob(f'{movie_id}-master.*'):
+        # Staging files of a running download have longer names
+        if path.suffix in MASTER_AUDIO_SUFFIXES and path.name == f'{movie_id}-master{path.suffix}':
+            if (path := get_existing_artifact(path)) is not None:
+                return path
+    return None
+
+
+def load_info_json(info_json_path: Optional[pathlib.Path]) -> Optional[dict]:
+    """Info written by `write_info_json` if it is fresh enough for its format URLs to work."""
+    if info_json_path is None or not is_info_json_fresh(info_json_path):
+        return None
+    try:
+        with pathlib.Path(info_json_path).open('r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError) as e:
+        logger.error(f'❌🪭 Unable to read info json {info_json_path}: {e}')
+        return None
+
+
+def select_direct_audio_format(yt_info: dict) -> Optional[dict]:
+    """
+    Best audio-only format which is a single file over HTTP, as `bestaudio` of yt-dlp: formats in info
+    are sorted from worst to best. None if the best audio needs fragments or another protocol.
+    """
+    audio_formats = [
+        item for item in yt_info.get('formats') or []
+        if item.get('vcodec') == 'none' and item.get('acodec') not in (None, 'none')]
+    if not audio_formats:
+        return None
+
+    best = audio_formats[-1]
+    if best.get('protocol') not in ('http', 'https') or not best.get('url'):
+        return None
+    if f'.{best.get("ext")}' not in MASTER_AUDIO_SUFFIXES:
+        return None
+    return best
+
+
+async def download_master_audio_directly(
+        movie_id: str,
+        dir_path: pathlib.Path,
+        info_json_path: Optional[pathlib.Path] = None,
+        on_progress: Optional[Callable[[float], None]] = None) -> Optional[pathlib.Path]:
+    """Download the best audio format by its URL from the info-json with `download_manager`."""
+    yt_info = await asyncio.to_thread(load_info_json, info_json_path)
+    if yt_info is None or (audio_format := select_direct_audio_format(yt_info)) is None:
+        return None
+
+    output_path = pathlib.Path(dir_path) / f'{movie_id}-master.{audio_format.get("ext")}'
+    logger.info(f'🪭 Master direct download: format {audio_format.get("format_id")} into {output_path.name}')
+    return await download_manager.download(
+        url=audio_format.get('url'),
+        output_path=output_path,
+        headers=audio_format.get('http_headers'),
+        expected_size=audio_format.get('filesize'),
+        # YouTube throttles long requests, yt-dlp asks for ranges of this size
+        chunk_size=(audio_format.get('downloader_options') or {}).get('http_chunk_size'),
+        key=f'{movie_id}-{audio_format.get("format_id")}',
+        on_progress=on_progress)
+
+
+async def download_master_audio(
+        movie_id: str,
+        dir_path: pathlib.Path,
+        info_json_path: Optional[pathlib.Path] = None,
+        on_progress: Optional[Callable[[float], None]] = None) -> Optional[pathlib.Path]:
+    """
+    Downloads the best audio format of the movie once, as `{movie_id}-master.{ext}`, without re-encoding.
+
+    Args:
+        movie_id (str): The YouTube video ID.
+        dir_path (pathlib.Path): Data dir.
+        info_json_path (Optional[pathlib.Path]): Already extracted movie info, see `write_info_json`.
+        on_progress (Optional[Callable[[float], None]]): Called with the download percent.
+
+    Returns:
+        Optional[pathlib.Path]: Path to the master audio, or None if download failed.
+    """
+    if (master_path := find_master_audio(movie_id, dir_path)) is not None:
+        return master_path
+
+    if config.DIRECT_DOWNLOAD:
+        if (master_path := await download_master_audio_directly(movie_id, dir_path, info_json_path, on_progress)):
+            logger.info(f"📣✅ Master audio successfully downloaded {master_path}")
+            return master_path
+
+    # Fixed staging name: yt-dlp continues its own .part of a previous attempt.
+    # It differs from the part of the direct download, which yt-dlp would take for a complete file.
+    staging_name = f'{movie_id}-master.dl'
+    output_template = pathlib.Path(dir_path) / f'{staging_name}.%(ext)s'
+    args = f'{YT_DLP_MASTER_OPTIONS} --continue --output "{output_template.as_posix()}"'
+    logger.info(f'🪭 Master download command: yt-dlp {args}')
+    stdout, stderr, return_code = await run_yt_dlp_for_movie(movie_id, args, info_json_path, on_progress)
+
+    if stderr:
+        for line in stderr.splitlines():
+            logger.error(f'📣 {line}')
+
+    if return_code != 0:
+        logger.error(f"❌📣 Master download failed with return code: {return_code}")
+        return None
+
+    staging_paths = [
+        path for path in pathlib.Path(dir_path).glob(f'{staging_name}.*')
+        if path.suffix in MASTER_AUDIO_SUFFIXES and path.name == f'{staging_name}{path.suffix}']
+    if not staging_paths or (master_path := publish_artifact(
+            staging_paths[0], pathlib.Path(dir_path) / f'{movie_id}-master{staging_paths[0].suffix}')) is None:
+        logger.error(f"❌📣 Master audio file not found for: {movie_id}")
+        return None
+
+    logger.info(f"📣✅ Master audio successfully downloaded {master_path}")
+    return master_path
+
+
 async def download_thumbnail_from_download(
     movie_id: str,
-    output_path: pathlib.Path
+    output_path: pathlib.Path,
+    info_json_path: Optional[pathlib.Path] = None
 ) -> Optional[pathlib.Path]:
     """
     Downloads a thumbnail for the given movie ID using yt-dlp and saves it as a JPEG image.
@@ -149,21 +442,21 @@ async def download_thumbnail_from_download(
     Args:
         movie_id (str): The ID of the movie/video for which to download the thumbnail.
         output_path (pathlib.Path): Path where the thumbnail should be saved.
+        info_json_path (Optional[pathlib.Path]): Already extracted movie info, see `write_info_json`.
 
     Returns:
         Optional[pathlib.Path]: Path to the downloaded thumbnail if successful, None otherwise.
     """
-    output_path = pathlib.Path(output_path)
-    if output_path.exists():
-        return output_path
+    output_path = pathlib.Path(output_path).with_suffix(".jpg")
+    if (existing_path := get_existing_artifact(output_path)) is not None:
+        return existing_path
 
-    url = get_short_youtube_url_with_http(movie_id)
-    output_path = output_path.with_suffix(".jpg")
-    command = (
-        f'yt-dlp --write-thumbnail --skip-download --convert-thumbnails jpg '
-        f'--output "{output_path.with_suffix('').as_posix()}" {url}')
+    staging_path = get_staging_path(output_path)
+    args = (
+        f'--write-thumbnail --skip-download --convert-thumbnails jpg '
+        f'--output "{staging_path.with_suffix("").as_posix()}"')
 
-    stdout, stderr, return_code = await run_command(command)
+    stdout, stderr, return_code = await run_yt_dlp_for_movie(movie_id, args, info_json_path)
 
     # Log output from command
     if stdout:
@@ -178,8 +471,8 @@ async def download_thumbnail_from_download(
         logger.error(f"❌🌅 Thumbnail download failed for Movie ID: {movie_id}. Return code: {return_code}")
         return None
 
-    if not output_path.exists():
-        logger.error(f"❌🌅 Thumbnail file not found at: {output_path.with_suffix('.jpg')}")
+    if publish_artifact(staging_path, output_path) is None:
+        logger.error(f"❌🌅 Thumbnail file not found at: {staging_path}")
         return None
 
     return output_path
@@ -188,7 +481,9 @@ async def download_thumbnail_from_download(
 async def download_audio_from_download(
         movie_id: str,
         output_path: pathlib.Path,
-        options: str = '') -> Optional[pathlib.Path]:
+        options: str = '',
+        on_progress: Optional[Callable[[float], None]] = None,
+        info_json_path: Optional[pathlib.Path] = None) -> Optional[pathlib.Path]:
     """
     Downloads audio from a YouTube video using yt-dlp if the audio file does not already exist.
 
@@ -196,18 +491,21 @@ async def download_audio_from_download(
         movie_id (str): The YouTube video ID.
         output_path (pathlib.Path): The desired output path for the audio file.
         options (str): Additional yt-dlp options for customization.
+        on_progress (Optional[Callable[[float], None]]): Called with the download percent.
+        info_json_path (Optional[pathlib.Path]): Already extracted movie info, see `write_info_json`.
 
     Returns:
         Optional[pathlib.Path]: The path to the downloaded audio file, or None if download failed.
     """
     output_path = pathlib.Path(output_path)
-    if output_path.exists():
-        return output_path
+    if (existing_path := get_existing_artifact(output_path)) is not None:
+        return existing_path
 
-    url = get_short_youtube_url_with_http(movie_id)
-    command = f'yt-dlp {options} --output "{output_path.as_posix()}" {url}'
-    logger.info(f'🪭 Download command: {command}')
-    stdout, stderr, return_code = await run_command(command)
+    # Fixed staging name: yt-dlp continues its own .part of a previous attempt, the result is published when valid
+    staging_path = get_staging_path(output_path)
+    args = f'{options} --continue --output "{staging_path.as_posix()}"'
+    logger.info(f'🪭 Download command: yt-dlp {args}')
+    stdout, stderr, return_code = await run_yt_dlp_for_movie(movie_id, args, info_json_path, on_progress)
 
     if stdout:
         for line in stdout.splitlines():
@@ -221,10 +519,124 @@ async def download_audio_from_download(
     if return_code != 0:
         logger.error(f"❌📣 Download failed with return code: {return_code}")
         return None
-    if not output_path.exists():
-        logger.error(f"❌📣 Expected audio file not found at: {output_path}")
+    if publish_artifact(staging_path, output_path) is None:
+        logger.error(f"❌📣 Expected audio file not found at: {staging_path}")
         return None
 
     logger.info(f"📣✅ Audio successfully downloaded {output_path}")
     return output_path
 
+
+
+def get_slice_path(movie_id: str, bitrate: str, start: int, end: int, dir_path: pathlib.Path) -> pathlib.Path:
+    """Slices are kept apart from the whole audio of the same bitrate and from each other."""
+    return pathlib.Path(dir_path) / f'{movie_id}-{bitrate}-slice{start}-{end}.m4a'
+
+
+async def cut_audio_slice(
+        source_path: pathlib.Path,
+        output_path: pathlib.Path,
+        start: int,
+        end: int,
+        bitrate: Optional[str] = None,
+        tags: Optional[Dict[str, str]] = None) -> Optional[pathlib.Path]:
+    """
+    Cuts seconds `start`-`end` of a local audio into an .m4a. The input is seeked, so only the slice is read.
+
+    Args:
+        source_path (pathlib.Path): Audio in the data dir, e.g. the master or a rendition.
+        output_path (pathlib.Path): Path of the slice.
+        start (int): Start of the slice in seconds.
+        end (int): End of the slice in seconds.
+        bitrate (Optional[str]): AAC bitrate to encode at. None copies the audio, which must be AAC already.
+        tags (Optional[Dict[str, str]]): Tags of the slice, e.g. {'title': ...}.
+
+    Returns:
+        Optional[pathlib.Path]: Path to the slice, or None if ffmpeg failed.
+    """
+    source_path = pathlib.Path(source_path)
+    output_path = pathlib.Path(output_path)
+    staging_path = get_staging_path(output_path)
+    codec_args = '-c:a copy' if bitrate is None else f'-c:a aac -b:a {bitrate}'
+
+    async with job_scheduler.stage(STAGE_CPU):
+        if not await run_ffmpeg(
+                f'ffmpeg -hide_banner -loglevel error -y -ss {start} -t {end - start} -i "{source_path.as_posix()}" '
+                f'-vn -map 0:a:0 {codec_args} {get_metadata_args(tags)}"{staging_path.as_posix()}"'):
+            staging_path.unlink(missing_ok=True)
+            return None
+
+    return publish_artifact(staging_path, output_path)
+
+
+async def cut_audio_slice_from_data_dir(
+        movie_id: str,
+        output_path: pathlib.Path,
+        start: int,
+        end: int,
+        bitrate: str,
+        dir_path: pathlib.Path,
+        tags: Optional[Dict[str, str]] = None) -> Optional[pathlib.Path]:
+    """
+    Makes seconds `start`-`end` of the movie's audio from audio already in the data dir, without network:
+    copied from the whole audio of the same bitrate, or encoded from the master.
+
+    Args:
+        movie_id (str): The YouTube video ID.
+        output_path (pathlib.Path): Path of the slice, see `get_slice_path`.
+        start (int): Start of the slice in seconds.
+        end (int): End of the slice in seconds.
+        bitrate (str): AAC bitrate, e.g. '48k'.
+        dir_path (pathlib.Path): Data dir.
+        tags (Optional[Dict[str, str]]): Tags of a slice cut from the master, which has none of its own.
+
+    Returns:
+        Optional[pathlib.Path]: Path to the slice, or None if there is no audio to cut it from or cutting failed.
+    """
+    output_path = pathlib.Path(output_path)
+    if (existing_path := get_existing_artifact(output_path)) is not None:
+        return existing_path
+
+    if (audio_path := get_existing_artifact(pathlib.Path(dir_path) / f'{movie_id}-{bitrate}.m4a')) is not None:
+        logger.info(f'🍰 Slice {start}-{end} is copied from {audio_path.name}')
+        if (slice_path := await cut_audio_slice(audio_path, output_path, start, end)) is not None:
+            return slice_path
+
+    if (master_path := find_master_audio(movie_id, dir_path)) is not None:
+        logger.info(f'🍰 Slice {start}-{end} is encoded from {master_path.name}')
+        return await cut_audio_slice(master_path, output_path, start, end, bitrate, tags)
+
+    return None
+
+
+async def download_audio_slice(
+        movie_id: str,
+        output_path: pathlib.Path,
+        start: int,
+        end: int,
+        options: str = '',
+        on_progress: Optional[Callable[[float], None]] = None,
+        info_json_path: Optional[pathlib.Path] = None) -> Optional[pathlib.Path]:
+    """
+    Downloads only seconds `start`-`end` of the movie's audio: yt-dlp passes the section to ffmpeg, which seeks
+    in the audio format by its index with range requests instead of reading it from the beginning.
+    No CPU stage is taken, so it may run within the network one. See `cut_audio_slice_from_data_dir` first.
+
+    Args:
+        movie_id (str): The YouTube video ID.
+        output_path (pathlib.Path): Path of the slice, see `get_slice_path`.
+        start (int): Start of the slice in seconds.
+        end (int): End of the slice in seconds.
+        options (str): yt-dlp options of a whole audio download.
+        on_progress (Optional[Callable[[float], None]]): Called with the download percent.
+        info_json_path (Optional[pathlib.Path]): Already extracted movie info, see `write_info_json`.
+
+    Returns:
+        Optional[pathlib.Path]: Path to the slice, or None if download failed.
+    """
+    return await download_audio_from_download(
+        movie_id=movie_id,
+        output_path=output_path,
+        options=f'{options} --download-sections "*{start}-{end}"',
+        on_progress=on_progress,
+        info_json_path=info_json_path)
@@ -0,0 +1,518 @@
+import asyncio
+import itertools
+import json
+import os
+import pathlib
+import re
+import struct
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Set, Tuple
+
+import aiofiles
+import aiohttp
+
+from ytb2audiobot import config
+from ytb2audiobot.logger import logger
+
+MP4_SUFFIXES = ('.m4a', '.mp4')
+JPEG_SUFFIXES = ('.jpg', '.jpeg')
+
+CONTENT_RANGE_PATTERN = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+# Bytes read from the response before they are written to the part file
+DOWNLOAD_READ_SIZE = 1 << 16
+
+
+class DownloadError(Exception):
+    pass
+
+
+def get_staging_path(path: pathlib.Path) -> pathlib.Path:
+    """Name an artifact is produced under before it is published. The extension is kept for ffmpeg and yt-dlp."""
+    path = pathlib.Path(path)
+    return path.with_name(f'{path.stem}.part{path.suffix}')
+
+
+def get_state_path(path: pathlib.Path) -> pathlib.Path:
+    """Sidecar of a part file with what is being downloaded into it."""
+    path = pathlib.Path(path)
+    return path.with_name(f'{path.name}.json')
+
+
+def is_valid_mp4(path: pathlib.Path) -> bool:
+    """
+    Quick structure check: top-level boxes follow each other up to the exact end of the file,
+    and there are `ftyp`, `moov` and media data. A file cut short by a crash fails it.
+    """
+    path = pathlib.Path(path)
+    try:
+        file_size = path.stat().st_size
+        box_types = set()
+        with path.open('rb') as file:
+            offset = 0
+            while offset < file_size:
+                file.seek(offset)
+                header = file.read(16)
+                if len(header) < 8:
+                    return False
+                size, box_type = struct.unpack_from('>I4s', header)
+                if size == 1:
+                    if len(header) < 16:
+                        return False
+                    size = struct.unpack_from('>Q', header, 8)[0]
+                elif size == 0:
+                    # Box extends to the end of the file
+                    size = file_size - offset
+                if size < 8:
+                    return False
+                box_types.add(box_type)
+                offset += size
+    except OSError:
+        return False
+
+    return offset == file_size and {b'ftyp', b'moov'} <= box_types and bool({b'mdat', b'moof'} & box_types)
+
+
+def is_valid_jpeg(path: pathlib.Path) -> bool:
+    try:
+        with pathlib.Path(path).open('rb') as file:
+            return file.read(2) == b'\xff\xd8'
+    except OSError:
+        return False
+
+
+def is_valid_artifact(path: pathlib.Path, expected_size: Optional[int] = None) -> bool:
+    """Whether a finished file may be published or used: size and, for MP4 and JPEG, the structure."""
+    path = pathlib.Path(path)
+    try:
+        size = path.stat().st_size
+    except OSError:
+        return False
+
+    if not size or (expected_size and size != expected_size):
+        return False
+    if path.suffix in MP4_SUFFIXES:
+        return is_valid_mp4(path)
+    if path.suffix in JPEG_SUFFIXES:
+        return is_valid_jpeg(path)
+    return True
+
+
+def get_existing_artifact(path: pathlib.Path) -> Optional[pathlib.Path]:
+    """
+    Return the file if it is a valid artifact. An invalid one, e.g. left by an older version
+    which wrote in place, is removed so it is produced again instead of being uploaded corrupt.
+    """
+    path = pathlib.Path(path)
+    if not path.exists():
+        return None
+    if is_valid_artifact(path):
+        return path
+
+    logger.error(f'❌📦 Broken file is removed: {path}')
+    path.unlink(missing_ok=True)
+    return None
+
+
+def publish_artifact(
+        staging_path: pathlib.Path,
+        output_path: pathlib.Path,
+        expected_size: Optional[int] = None) -> Optional[pathlib.Path]:
+    """
+    Validate a finished staging file and rename it to its final name in one step, so the final name
+    never points to a partial file.
+
+    Returns:
+        Optional[pathlib.Path]: The published path, or None if the file is invalid. An invalid file is removed.
+    """
+    staging_path = pathlib.Path(staging_path)
+    output_path = pathlib.Path(output_path)
+    if not is_valid_artifact(staging_path, expected_size):
+        logger.error(f'❌📦 File is incomplete or broken, not published: {staging_path}')
+        staging_path.unlink(missing_ok=True)
+        return None
+
+    os.replace(staging_path, output_path)
+    return output_path
+
+
+class BandwidthBudget:
+    """Process-wide download budget split equally between active downloads.
+
+    Connections: every download may open up to `max_connections / active downloads` of them. Bytes, if
+    `bytes_per_sec` is set: every download is paced to `bytes_per_sec / active downloads`. A huge download
+    therefore cannot take the whole link from short ones started after it.
+    """
+
+    def __init__(
+            self,
+            bytes_per_sec: float = config.DOWNLOAD_BANDWIDTH_BYTES_PER_SEC,
+            max_connections: int = config.DOWNLOAD_MAX_CONNECTIONS_TOTAL):
+        self.bytes_per_sec = bytes_per_sec
+        self.max_connections = max(1, max_connections)
+        # Download id -> moment before which its next bytes should not be read
+        self._paced_until: Dict[int, float] = {}
+        self._ids = itertools.count()
+
+    @property
+    def active(self) -> int:
+        return len(self._paced_until)
+
+    @contextmanager
+    def register(self):
+        """Count a download as active while inside. Yields its id for `consume`."""
+        download_id = next(self._ids)
+        self._paced_until[download_id] = time.monotonic()
+        try:
+            yield download_id
+        finally:
+            self._paced_until.pop(download_id, None)
+
+    def connections_share(self) -> int:
+        return max(1, self.max_connections // max(1, self.active))
+
+    async def consume(self, download_id: int, size: int) -> None:
+        """Account `size` bytes just read by the download and sleep if it is ahead of its share."""
+        if not self.bytes_per_sec or download_id not in self._paced_until:
+            return
+        now = time.monotonic()
+        share = self.bytes_per_sec / max(1, self.active)
+        paced_until = max(self._paced_until[download_id], now) + size / share
+        self._paced_until[download_id] = paced_until
+        if paced_until > now:
+            await asyncio.sleep(paced_until - now)
+
+
+bandwidth_budget = BandwidthBudget()
+
+
+class ConnectionTuner:
+    """Number of parallel connections of one download, tuned by hill climbing on measured throughput.
+
+    Starts with one connection and adds one while the throughput over the last window (one chunk per
+    connection) grows by more than `gain`. When it stops growing, one connection is taken back and the
+    number is kept till the end of the download.
+    """
+
+    def __init__(self, max_connections: int, gain: float = 0.1):
+        self.max_connections = max(1, max_connections)
+        self.gain = gain
+        self.connections = 1
+        self.settled = self.max_connections == 1
+        self._best_throughput = 0.0
+        self._window_bytes = 0
+        self._window_chunks = 0
+        self._window_started_at = time.monotonic()
+
+    def record(self, size: int) -> None:
+        """Account a completed chunk."""
+        if self.settled:
+            return
+        self._window_bytes += size
+        self._window_chunks += 1
+        if self._window_chunks < self.connections:
+            return
+
+        throughput = self._window_bytes / max(time.monotonic() - self._window_started_at, 1e-6)
+        if throughput > self._best_throughput * (1 + self.gain):
+            self._best_throughput = throughput
+            if self.connections < self.max_connections:
+                self.connections += 1
+            else:
+                self.settled = True
+        else:
+            self.connections = max(1, self.connections - 1)
+            self.settled = True
+
+        self._window_bytes = 0
+        self._window_chunks = 0
+        self._window_started_at = time.monotonic()
+
+
+class DownloadManager:
+    """Downloads files by URL into the data dir in parallel ranges, with resume and atomic publish.
+
+    The file is fetched in chunks by range requests over several connections; their number is tuned per
+    download by the measured throughput (see `ConnectionTuner`) and bounded by the process-wide
+    `BandwidthBudget`. Bytes go into a `.part` file next to the target at their offsets. A JSON sidecar
+    records what is being downloaded (a caller key, size and chunk size) and which chunks are complete,
+    so another attempt, also after a restart, fetches only the missing chunks, while a part of something
+    else is started over. A finished file is validated and renamed to the target.
+    """
+
+    def __init__(
+            self,
+            max_attempts: int = config.DOWNLOAD_MAX_ATTEMPTS,
+            timeout: float = config.DOWNLOAD_TIMEOUT_SEC,
+            chunk_size: int = config.DOWNLOAD_CHUNK_SIZE,
+            max_connections: int = config.DOWNLOAD_MAX_CONNECTIONS,
+            budget: Optional[BandwidthBudget] = None):
+        """
+        Initialize the manager.
+
+        Args:
+            max_attempts (int): Failed requests of one chunk before the download fails.
+            timeout (float): Seconds without any bytes received before a request is considered stalled.
+            chunk_size (int): Size of one range request if the caller does not ask for another one.
+            max_connections (int): Parallel connections of one download.
+            budget (Optional[BandwidthBudget]): Budget to share. The process-wide `bandwidth_budget` by default.
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.timeout = timeout
+        self.chunk_size = max(1, chunk_size)
+        self.max_connections = max(1, max_connections)
+        self.budget = budget if budget is not None else bandwidth_budget
+
+        self.total_downloads = 0
+        self.total_bytes = 0
+        # Bytes already on disk when a download was started again
+        self.total_resumed_bytes = 0
+
+    @staticmethod
+    def _read_state(state_path: pathlib.Path) -> dict:
+        try:
+            with state_path.open('r', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _write_state(state_path: pathlib.Path, state: dict) -> None:
+        with state_path.open('w', encoding='utf-8') as file:
+            json.dump(state, file)
+
+    async def _fetch_range(
+            self,
+            session: aiohttp.ClientSession,
+            url: str,
+            headers: Dict[str, str],
+            part_path: pathlib.Path,
+            start: int,
+            end: int,
+            download_id: int) -> Tuple[int, Optional[int], bool]:
+        """
+        Request bytes `start`-`end` and write them at their offset in the part file.
+
+        Returns:
+            Tuple[int, Optional[int], bool]: Bytes written, total size if the server told it,
+            and whether the server ignored the range and sent the whole file.
+        """
+        async with session.get(url, headers=dict(headers, Range=f'bytes={start}-{end}')) as response:
+            total = None
+            if response.status == 200:
+                # Range is ignored: the whole file comes from zero
+                start = 0
+                total = response.content_length
+            elif response.status == 206:
+                if match := CONTENT_RANGE_PATTERN.match(response.headers.get('Content-Range', '')):
+                    if int(match.group(1)) != start:
+                        raise DownloadError(f'Server returned range from {match.group(1)} instead of {start}')
+                    if match.group(3) != '*':
+                        total = int(match.group(3))
+            else:
+                raise DownloadError(f'HTTP {response.status} for range {start}-{end}')
+
+            written = 0
+            async with aiofiles.open(part_path, 'r+b') as file:
+                await file.seek(start)
+                async for data in response.content.iter_chunked(DOWNLOAD_READ_SIZE):
+                    await file.write(data)
+                    written += len(data)
+                    self.total_bytes += len(data)
+                    await self.budget.consume(download_id, len(data))
+
+        return written, total, response.status == 200
+
+    async def download(
+            self,
+            url: str,
+            output_path: pathlib.Path,
+            headers: Optional[Dict[str, str]] = None,
+            expected_size: Optional[int] = None,
+            chunk_size: Optional[int] = None,
+            key: str = '',
+            on_progress: Optional[Callable[[float], None]] = None) -> Optional[pathlib.Path]:
+        """
+        Download `url` into `output_path`, fetching only chunks missing after an earlier attempt.
+
+        Args:
+            url (str): File URL.
+            output_path (pathlib.Path): Final path. It appears only when the file is complete and valid.
+            headers (Optional[Dict[str, str]]): Request headers, e.g. `http_headers` of a yt-dlp format.
+            expected_size (Optional[int]): Size of the file if known in advance.
+            chunk_size (Optional[int]): Size of one range request. Some servers throttle longer requests.
+            key (str): Identity of the content, e.g. movie and format id. URLs may change between attempts.
+            on_progress (Optional[Callable[[float], None]]): Called with the download percent.
+
+        Returns:
+            Optional[pathlib.Path]: The output path, or None if the download failed. The part is kept for a retry.
+        """
+        output_path = pathlib.Path(output_path)
+        if (existing := get_existing_artifact(output_path)) is not None:
+            return existing
+
+        headers = headers or {}
+        chunk_size = chunk_size or self.chunk_size
+        part_path = get_staging_path(output_path)
+        state_path = get_state_path(part_path)
+
+        identity = {'key': key or url, 'size': expected_size, 'chunk_size': chunk_size}
+        state = self._read_state(state_path)
+        if all(state.get(name) == value for name, value in identity.items()) and part_path.exists():
+            state['done'] = set(state.get('done') or [])
+            self.total_resumed_bytes += len(state['done']) * chunk_size
+            logger.info(f'📦 Resume {output_path.name}: {len(state["done"])} chunks are on disk.')
+        else:
+            state = dict(identity, total=expected_size, done=set())
+            part_path.unlink(missing_ok=True)
+            part_path.touch()
+
+        def save_state():
+            self._write_state(state_path, dict(state, done=sorted(state['done'])))
+
+        save_state()
+        self.total_downloads += 1
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout)
+        try:
+            with self.budget.register() as download_id:
+                async with aiohttp.ClientSession(timeout=timeout) as session:
+                    if state['total'] is None:
+                        # Size is learnt from the first chunk
+                        written, total, whole = await self._fetch_with_retries(
+                            session, url, headers, part_path, 0, chunk_size - 1, download_id)
+                        state['total'] = total if total is not None else written
+                        if whole or state['total'] <= chunk_size:
+                            state['total'] = written
+                            state['done'] = set(range(self._chunk_count(state['total'], chunk_size)))
+                        else:
+                            state['done'].add(0)
+                        save_state()
+
+                    await self._download_chunks(
+                        session, url, headers, part_path, state, save_state, download_id, on_progress)
+        except DownloadError as e:
+            logger.error(f'❌📦 Download of {output_path.name} failed: {e}')
+            return None
+
+        # Bytes of a whole file sent instead of a range may have gone past the end
+        os.truncate(part_path, state['total'])
+        published = publish_artifact(part_path, output_path, state['total'])
+        state_path.unlink(missing_ok=True)
+        return published
+
+    @staticmethod
+    def _chunk_count(total: int, chunk_size: int) -> int:
+        return max(1, -(-total // chunk_size))
+
+    async def _fetch_with_retries(
+            self,
+            session: aiohttp.ClientSession,
+            url: str,
+            headers: Dict[str, str],
+            part_path: pathlib.Path,
+            start: int,
+            end: int,
+            download_id: int) -> Tuple[int, Optional[int], bool]:
+        for attempt in range(self.max_attempts):
+            try:
+                written, total, whole = await self._fetch_range(
+                    session, url, headers, part_path, start, end, download_id)
+                # Without the total in the response the whole requested range must come
+                expected = end - start + 1 if total is None else min(end, total - 1) - start + 1
+                if whole or written == expected:
+                    return written, total, whole
+                error = f'Got {written} bytes of range {start}-{end}'
+            except (aiohttp.ClientError, asyncio.TimeoutError, DownloadError) as e:
+                error = str(e)
+
+            if attempt == self.max_attempts - 1:
+                raise DownloadError(f'Range {start}-{end} after {self.max_attempts} attempts: {error}')
+            logger.info(f'📦 Range {start}-{end} of {part_path.name} failed, retry: {error}')
+            await asyncio.sleep(attempt + 1)
+
+    async def _download_chunks(
+            self,
+            session: aiohttp.ClientSession,
+            url: str,
+            headers: Dict[str, str],
+            part_path: pathlib.Path,
+            state: dict,
+            save_state: Callable[[], None],
+            download_id: int,
+            on_progress: Optional[Callable[[float], None]] = None) -> None:
+        total = state['total']
+        chunk_size = state['chunk_size']
+        chunk_count = self._chunk_count(total, chunk_size)
+        pending = deque(idx for idx in range(chunk_count) if idx not in state['done'])
+        if not pending:
+            return
+
+        tuner = ConnectionTuner(self.max_connections)
+        workers: Set[asyncio.Task] = set()
+
+        def report_progress():
+            if on_progress is not None:
+                on_progress(100 * min(len(state['done']) * chunk_size, total) / total)
+
+        async def worker():
+            while pending:
+                # Connections over the tuned number or over the fair share of the budget are closed
+                if len(workers) > min(tuner.connections, self.budget.connections_share()):
+                    break
+                idx = pending.popleft()
+                start = idx * chunk_size
+                end = min(start + chunk_size, total) - 1
+                try:
+                    written, _total, whole = await self._fetch_with_retries(
+                        session, url, headers, part_path, start, end, download_id)
+                except DownloadError:
+                    pending.appendleft(idx)
+                    raise
+                if whole:
+                    raise DownloadError('Server ignored the range of a chunk')
+
+                state['done'].add(idx)
+                save_state()
+                report_progress()
+
+                tuner.record(written)
+                spawn_workers()
+            workers.discard(asyncio.current_task())
+
+        def spawn_workers():
+            target = min(tuner.connections, self.budget.connections_share(), len(pending))
+            while len(workers) < target:
+                task = asyncio.create_task(worker())
+                workers.add(task)
+
+        spawn_workers()
+        try:
+            while workers:
+                done, _pending = await asyncio.wait(set(workers), return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    workers.discard(task)
+                    if task.exception() is not None:
+                        raise task.exception()
+                if not workers and pending:
+                    spawn_workers()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        if pending or len(state['done']) < chunk_count:
+            raise DownloadError(f'{chunk_count - len(state["done"])} chunks are missing')
+
+        logger.debug(f'📦 {part_path.name}: {chunk_count} chunks with up to {tuner.connections} connections.')
+
+    def stats(self) -> dict:
+        return {
+            'total_downloads': self.total_downloads,
+            'total_bytes': self.total_bytes,
+            'total_resumed_bytes': self.total_resumed_bytes,
+            'active_downloads': self.budget.active}
+
+
+download_manager = DownloadManager()
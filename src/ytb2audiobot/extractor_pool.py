@@ -0,0 +1,200 @@
+import asyncio
+import itertools
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ytb2audiobot import config
+from ytb2audiobot.logger import logger
+
+# Progress queue shared by all workers. Set in every worker process by `_init_worker`.
+_worker_progress_queue = None
+
+
+def _init_worker(progress_queue):
+    global _worker_progress_queue
+    _worker_progress_queue = progress_queue
+
+    # Preload yt-dlp with all extractors once per worker instead of once per request
+    import yt_dlp
+    import yt_dlp.extractor
+    yt_dlp.extractor.import_extractors()
+
+
+def _ping() -> bool:
+    return True
+
+
+def _worker_extract_info(url: str, ydl_opts: dict) -> dict:
+    import yt_dlp
+
+    try:
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=False)
+            # Plain data only, so it can be sent back to the bot process
+            return ydl.sanitize_info(info)
+    except Exception as e:
+        # yt-dlp errors keep tracebacks and cannot always be pickled
+        raise RuntimeError(f'{type(e).__name__}: {e}') from None
+
+
+def _worker_run(task_id: int, argv: List[str], report_progress: bool) -> Tuple[int, str]:
+    """Run yt-dlp with command line arguments inside the worker. Returns return code and error text."""
+    import yt_dlp
+
+    last_percent = [-1]
+
+    def progress_hook(status: dict):
+        if status.get('status') != 'downloading':
+            return
+        total = status.get('total_bytes') or status.get('total_bytes_estimate')
+        if not total:
+            return
+        percent = int(100 * status.get('downloaded_bytes', 0) / total)
+        if percent != last_percent[0]:
+            last_percent[0] = percent
+            _worker_progress_queue.put_nowait((task_id, percent))
+
+    try:
+        parsed = yt_dlp.parse_options(argv)
+        ydl_opts = parsed.ydl_opts
+        ydl_opts.update({'quiet': True, 'noprogress': True, 'consoletitle': False})
+        if report_progress:
+            ydl_opts['progress_hooks'] = [progress_hook]
+
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            if parsed.options.load_info_filename is not None:
+                # Formats are taken from an info-json written by the bot, no page is fetched
+                return ydl.download_with_info_file(parsed.options.load_info_filename), ''
+            return ydl.download(parsed.urls), ''
+    except SystemExit as e:
+        # Option parser exits on invalid arguments
+        return e.code if isinstance(e.code, int) else 2, f'Invalid yt-dlp arguments: {argv}'
+    except Exception as e:
+        return 1, f'{type(e).__name__}: {e}'
+
+
+class ExtractorPool:
+    """Long-lived worker processes with yt-dlp preloaded.
+
+    Info extraction, audio and thumbnail downloads run in these workers instead of a new `yt-dlp`
+    interpreter per request or a thread of the bot process, so neither the startup and extractor import cost
+    nor the CPU-heavy extraction lands on the event loop and its GIL. Download percent is sent back
+    through a queue shared by all workers.
+    """
+
+    def __init__(self, max_workers: int = config.EXTRACTOR_POOL_MAX_WORKERS):
+        """
+        Initialize the pool. Processes are started on `start` or on the first call.
+
+        Args:
+            max_workers (int): Number of worker processes. 0 disables the pool.
+        """
+        self.max_workers = max_workers
+        self._context = multiprocessing.get_context('spawn')
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._progress_queue = None
+        self._progress_thread: Optional[threading.Thread] = None
+        # Task id -> (event loop, progress callback)
+        self._progress_callbacks: Dict[int, Tuple[asyncio.AbstractEventLoop, Callable[[float], None]]] = {}
+        self._task_ids = itertools.count()
+
+        self.total_calls = 0
+        self.total_restarts = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_workers > 0
+
+    def _read_progress(self, progress_queue):
+        while (item := progress_queue.get()) is not None:
+            task_id, percent = item
+            if (entry := self._progress_callbacks.get(task_id)) is not None:
+                loop, callback = entry
+                loop.call_soon_threadsafe(callback, percent)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            if self._progress_queue is None:
+                self._progress_queue = self._context.Queue()
+                self._progress_thread = threading.Thread(
+                    target=self._read_progress, args=(self._progress_queue,), name='extractor-progress', daemon=True)
+                self._progress_thread.start()
+
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=self._context,
+                initializer=_init_worker,
+                initargs=(self._progress_queue,))
+        return self._executor
+
+    async def _submit(self, func, *args):
+        self.total_calls += 1
+        executor = self._get_executor()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+        except BrokenProcessPool:
+            # A worker died, e.g. killed by OOM. The next call gets a fresh pool.
+            logger.error('❌🏭 Extractor pool is broken. It will be recreated.')
+            if self._executor is executor:
+                self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    async def start(self) -> None:
+        """Start all workers now, so the first request does not wait for yt-dlp import."""
+        if not self.enabled:
+            return
+        await asyncio.gather(*(self._submit(_ping) for _ in range(self.max_workers)))
+        logger.info(f'🏭 Extractor pool started: {self.max_workers} workers.')
+
+    async def extract_info(self, url: str, ydl_opts: dict) -> dict:
+        """Same as `YoutubeDL(ydl_opts).extract_info(url, download=False)`, but in a worker."""
+        return await self._submit(_worker_extract_info, url, ydl_opts)
+
+    async def run(self, argv: List[str], on_progress: Optional[Callable[[float], None]] = None) -> Tuple[int, str]:
+        """
+        Run yt-dlp with command line arguments in a worker.
+
+        Args:
+            argv (List[str]): Arguments as for the `yt-dlp` command, URL included.
+            on_progress (Optional[Callable[[float], None]]): Called in the event loop with the download percent.
+
+        Returns:
+            Tuple[int, str]: Return code and error text.
+        """
+        task_id = next(self._task_ids)
+        if on_progress is not None:
+            self._progress_callbacks[task_id] = (asyncio.get_running_loop(), on_progress)
+        try:
+            return await self._submit(_worker_run, task_id, argv, on_progress is not None)
+        finally:
+            self._progress_callbacks.pop(task_id, None)
+
+    def restart(self) -> None:
+        """Replace workers, e.g. after yt-dlp was upgraded. Running calls finish in the old workers."""
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=False)
+        self._executor = None
+        self.total_restarts += 1
+        logger.info('🏭 Extractor pool restarted.')
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._progress_queue is not None:
+            self._progress_queue.put(None)
+            self._progress_queue = None
+
+    def stats(self) -> dict:
+        return {
+            'max_workers': self.max_workers,
+            'total_calls': self.total_calls,
+            'total_restarts': self.total_restarts}
+
+
+extractor_pool = ExtractorPool()
@@ -0,0 +1,135 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Union
+
+from ytb2audiobot import config
+from ytb2audiobot.logger import logger
+from ytb2audiobot.utils import get_data_dir
+
+DEFAULT_PATH_NAME = 'telegram-file-ids.sqlite3'
+
+_CREATE_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS file_ids (
+    movie_id TEXT NOT NULL,
+    bitrate TEXT NOT NULL,
+    plan TEXT NOT NULL,
+    segment_index INTEGER NOT NULL,
+    segments_total INTEGER NOT NULL,
+    file_id TEXT NOT NULL,
+    duration INTEGER,
+    start_time INTEGER NOT NULL,
+    end_time INTEGER NOT NULL,
+    title TEXT NOT NULL DEFAULT '',
+    created_at REAL NOT NULL,
+    PRIMARY KEY (movie_id, bitrate, plan, segment_index)
+)'''
+
+
+class FileIdCache:
+    """Persistent index from (movie_id, bitrate, segmentation plan, segment index) to Telegram `file_id`.
+
+    A repeat request for an already delivered video is served by re-sending the stored `file_id`s
+    instead of downloading, splitting and uploading the audio again.
+    """
+
+    def __init__(self, path: Union[Path, str] = DEFAULT_PATH_NAME):
+        """
+        Initialize the cache. The SQLite file is opened and the table is created on first use,
+        so importing the module creates no files.
+
+        Args:
+            path (Union[Path, str]): Path to the SQLite file. A relative one is taken inside the data dir.
+        """
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the SQLite file if not yet. Called under the lock."""
+        if self._connection is None:
+            # Resolved once, so the file does not move if the working directory changes later
+            data_dir = get_data_dir().resolve()
+            if not self.path.is_absolute():
+                self.path = data_dir / self.path
+            if not self.path.parent.exists():
+                self.path = data_dir / DEFAULT_PATH_NAME
+
+            self._connection = sqlite3.connect(self.path.as_posix(), check_same_thread=False)
+            self._connection.row_factory = sqlite3.Row
+            with self._connection:
+                self._connection.execute('PRAGMA journal_mode=WAL')
+                self._connection.execute(_CREATE_TABLE_SQL)
+        return self._connection
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[dict]:
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                cursor = connection.execute(sql, params)
+                return [dict(row) for row in cursor.fetchall()] if cursor.description else []
+
+    async def _execute_async(self, sql: str, params: tuple = ()) -> List[dict]:
+        return await asyncio.to_thread(self._execute, sql, params)
+
+    async def get_segments(self, movie_id: str, bitrate: str, plan: str) -> Optional[List[dict]]:
+        """
+        Return cached segments of a delivered audio ordered by index.
+
+        Returns:
+            Optional[List[dict]]: Segments with 'file_id', 'duration', 'start', 'end' and 'title',
+                or None if the plan is not cached completely.
+        """
+        rows = await self._execute_async(
+            'SELECT * FROM file_ids WHERE movie_id = ? AND bitrate = ? AND plan = ? ORDER BY segment_index',
+            (movie_id, bitrate, plan))
+
+        if not rows:
+            return None
+
+        total = rows[0].get('segments_total')
+        if len(rows) != total or [row.get('segment_index') for row in rows] != list(range(total)):
+            return None
+
+        return [
+            {
+                'file_id': row.get('file_id'),
+                'duration': row.get('duration'),
+                'start': row.get('start_time'),
+                'end': row.get('end_time'),
+                'title': row.get('title', '')}
+            for row in rows]
+
+    async def put_segment(
+            self,
+            movie_id: str,
+            bitrate: str,
+            plan: str,
+            segment_index: int,
+            segments_total: int,
+            file_id: str,
+            duration: Optional[int],
+            start: int,
+            end: int,
+            title: str = '') -> None:
+        """Remember the `file_id` Telegram returned for an uploaded segment."""
+        await self._execute_async(
+            'INSERT OR REPLACE INTO file_ids '
+            '(movie_id, bitrate, plan, segment_index, segments_total, file_id, duration, start_time, end_time, title, created_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (movie_id, bitrate, plan, segment_index, segments_total, file_id, duration, start, end, title or '',
+             time.time()))
+
+    async def invalidate(self, movie_id: str, bitrate: Optional[str] = None, plan: Optional[str] = None) -> None:
+        """Forget cached `file_id`s of a movie, optionally only for one bitrate and plan."""
+        if bitrate is not None and plan is not None:
+            await self._execute_async(
+                'DELETE FROM file_ids WHERE movie_id = ? AND bitrate = ? AND plan = ?', (movie_id, bitrate, plan))
+        else:
+            await self._execute_async('DELETE FROM file_ids WHERE movie_id = ?', (movie_id,))
+        logger.debug(f'🗃 Cached file_ids invalidated: {movie_id} {bitrate} {plan}')
+
+
+file_id_cache = FileIdCache(path=config.FILE_ID_CACHE_FILENAME)
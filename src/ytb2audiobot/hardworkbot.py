@@ -1,35 +1,54 @@
 import asyncio
 import inspect
-import math
 import pathlib
 import pprint
 import re
+from concurrent.futures.process import BrokenProcessPool
 from itertools import islice
 from string import Template
 
 import yt_dlp
 from aiogram import Bot
-from aiogram.exceptions import TelegramNetworkError
-from aiogram.types import FSInputFile, BufferedInputFile, Message
+from aiogram.exceptions import TelegramBadRequest, TelegramEntityTooLarge
+from aiogram.types import FSInputFile, BufferedInputFile, Message, InputMediaAudio
 from ytbtimecodes.timecodes import extract_timecodes, timedelta_from_seconds, standardize_time_format
 
 from ytb2audiobot import config
 from ytb2audiobot.audio_duration import get_duration
 from ytb2audiobot.audio_mixer import mix_audio_m4a
-from ytb2audiobot.config import YT_DLP_OPTIONS_DEFAULT, SEGMENT_REBALANCE_TO_FIT_TIMECODES
+from ytb2audiobot.config import YT_DLP_OPTIONS_DEFAULT
 from ytb2audiobot.segmentation import segments_verification, get_segments_by_duration, \
-    add_paddings_to_segments, make_magic_tail, get_segments_by_timecodes_from_dict, rebalance_segments_long_timecodes
+    add_paddings_to_segments, get_segments_by_timecodes_from_dict, plan_segments
 from ytb2audiobot.subtitles import get_subtitles_here, highlight_words_file_text
 from ytb2audiobot.logger import logger
+from ytb2audiobot.scheduler import job_scheduler, STAGE_CPU, STAGE_NETWORK
+from ytb2audiobot.singleflight import single_flight
+from ytb2audiobot.file_id_cache import file_id_cache
+from ytb2audiobot.cache_manager import data_cache
+from ytb2audiobot.mp4_index import Mp4AudioIndex
+from ytb2audiobot.timecode_index import TimecodeIndex
+from ytb2audiobot.telegram_sender import telegram_sender
+from ytb2audiobot.progress import ProgressReporter
+from ytb2audiobot.extractor_pool import extractor_pool
+from ytb2audiobot.metadata_cache import metadata_cache, MovieMetadata, ERROR_UNAVAILABLE
+from ytb2audiobot.job_store import job_store, is_stage_reached, JOB_STAGE_STARTED, JOB_STAGE_DOWNLOADED, \
+    JOB_STAGE_SPLIT, JOB_STAGE_UPLOADING
 from ytb2audiobot.download import download_thumbnail_from_download, \
-    make_split_audio_second, get_chapters, get_timecodes_dict, filter_timecodes_within_bounds, \
-    get_timecodes_formatted_text, download_audio_from_download, empty
-from ytb2audiobot.summarize import download_summary, get_summary_txt_or_html
+    make_split_audio_second, get_chapters, get_timecodes_dict, download_audio_from_download, empty, write_info_json, \
+    get_info_json_path, download_master_audio, find_master_audio, YT_DLP_NATIVE_AUDIO_OPTIONS, get_slice_path, \
+    download_audio_slice, cut_audio_slice_from_data_dir
+from ytb2audiobot.summarize import download_summary, get_summary_txt_or_html, get_summary_path
+from ytb2audiobot.streaming import stream_audio_segments, get_streamed_segment, get_streaming_max_segment_duration, \
+    download_audio_to_memory, save_memory_audio
 from ytb2audiobot.translate import make_translate
+from ytb2audiobot.transcode import transcode_renditions, get_renditions, select_native_audio_format, parse_bitrate
 from ytb2audiobot.utils import seconds2humanview, capital2lower, \
     predict_downloading_time, get_data_dir, get_big_youtube_move_id, trim_caption_to_telegram_send, get_file_size, \
     get_short_youtube_url, remove_files_starting_with_async, split_big_text_pretty
 
+# Share of a segment file taken by audio samples. The rest is the moov box and other container data.
+MP4_SAMPLES_SHARE_OF_FILE_SIZE = 0.97
+
 
 async def make_subtitles(
         bot: Bot,
@@ -47,10 +66,11 @@ async def make_subtitles(
         reply_to_message_id=reply_message_id,
         text = '⏳ Preparing…')
 
-    info_message = await info_message.edit_text('⏳ Fetching subtitles…')
+    progress = ProgressReporter(info_message)
+    progress.update('⏳ Fetching subtitles…')
 
     if not (movie_id := get_big_youtube_move_id(url)):
-        await info_message.edit_text('❌ Unable to extract a valid YouTube movie ID from the provided URL.')
+        await progress.finish('❌ Unable to extract a valid YouTube movie ID from the provided URL.')
         return
 
     text = await get_subtitles_here(url, word)
@@ -71,7 +91,7 @@ async def make_subtitles(
             document=BufferedInputFile(
                 filename=f'subtitles-{movie_id}.txt',
                 file=highlight_words_file_text(text, word).encode('utf-8')))
-    await info_message.delete()
+    await progress.delete()
 
 
 def get_yt_dlp_options(override_options=None):
@@ -126,15 +146,447 @@ async def fetch_yt_info(movie_id: str, ydl_opts = None):
     # Use provided ydl_opts or fall back to default options
     ydl_opts = ydl_opts or default_ydl_opts
 
+    url = f"https://www.youtube.com/watch?v={movie_id}"
+    if extractor_pool.enabled:
+        try:
+            return await extractor_pool.extract_info(url, ydl_opts)
+        except BrokenProcessPool:
+            logger.error('❌ Extractor pool is broken. Extract info in a thread instead.')
+
     ydl = yt_dlp.YoutubeDL(ydl_opts)
-    yt_info = await asyncio.to_thread(ydl.extract_info, f"https://www.youtube.com/watch?v={movie_id}", download=False)
-    return yt_info
+    yt_info = await asyncio.to_thread(ydl.extract_info, url, download=False)
+    return ydl.sanitize_info(yt_info)
+
+
+async def extract_movie_metadata(movie_id: str) -> MovieMetadata:
+    """
+    Extracts movie info with yt-dlp and keeps only the fields the bot uses.
+
+    The full info is saved as an info-json next to other files of the movie, so downloads start
+    from known formats, and is dropped from memory after that.
+    """
+    try:
+        yt_info = await fetch_yt_info(movie_id=movie_id, ydl_opts={
+            'logtostderr': False,  # Avoids logging to stderr, logs to the logger instead
+            'quiet': True,  # Suppresses default output,
+            'nocheckcertificate': True,
+            'no_warnings': True,
+            'skip_download': True,})
+    except Exception as e:
+        logger.error(f'❌ {movie_id} Unable to extract YT-DLP info. \n\n{e}')
+        return metadata_cache.put_error(movie_id, ERROR_UNAVAILABLE)
+
+    await asyncio.to_thread(write_info_json, yt_info, get_info_json_path(movie_id, get_data_dir()))
+
+    metadata = MovieMetadata.from_yt_info(movie_id, yt_info)
+    metadata_cache.put(metadata)
+    return metadata
+
+
+async def get_movie_metadata(movie_id: str) -> MovieMetadata:
+    """Returns cached metadata of the movie or extracts it once for all simultaneous requests."""
+    if (metadata := metadata_cache.get(movie_id)) is not None:
+        logger.debug(f'📇 {movie_id} Metadata from cache.')
+        return metadata
+    return await single_flight.run(('metadata', movie_id), extract_movie_metadata, movie_id=movie_id)
+
+
+def get_segmentation_plan_key(action: str, configurations: dict) -> str:
+    """
+    Builds a key describing how the audio is cut into parts for the given action and current settings.
+    Together with movie_id and bitrate it identifies uploaded segments in the file_id cache.
+    """
+    settings = '-'.join(str(item) for item in [
+        config.SEGMENT_AUDIO_DURATION_SEC,
+        config.SEGMENT_AUDIO_DURATION_SPLIT_THRESHOLD_SEC,
+        config.SEGMENT_DURATION_PADDING_SEC,
+        int(config.SEGMENT_REBALANCE_TO_FIT_TIMECODES),
+        config.TELEGRAM_MAX_FILE_SIZE_BYTES])
+
+    if action == config.ACTION_NAME_SPLIT_BY_DURATION:
+        plan = f'duration{configurations.get("split_duration_minutes", 0)}'
+    elif action == config.ACTION_NAME_SPLIT_BY_TIMECODES:
+        plan = 'timecodes'
+    elif action == config.ACTION_NAME_SLICE:
+        plan = f'slice{configurations.get("slice_start_time")}-{configurations.get("slice_end_time")}'
+    elif action == config.ACTION_NAME_TRANSLATE:
+        plan = f'translate{configurations.get("overlay")}'
+    else:
+        plan = 'auto'
+
+    return f'{plan}:{settings}'
+
+
+def get_streaming_plan_key(plan_key: str) -> str:
+    """
+    Builds the key of parts sent by `job_streaming`. They are planned by their own size limit and without paddings,
+    so they never mix with parts of the full pipeline for the same plan.
+    """
+    return f'stream:{plan_key}'
+
+
+def get_segment_caption(
+        caption_head: str,
+        segment: dict,
+        index: int,
+        total: int,
+        timecodes: TimecodeIndex,
+        duration: int,
+        additional: str = '') -> str:
+    """
+    Renders the Telegram caption of one audio part: head, part number, duration and timecodes within the part.
+
+    Args:
+        caption_head (str): Caption template with movie title, link and author filled in.
+        segment (dict): Segment with 'start', 'end' and optional 'title'.
+        index (int): Index of the segment.
+        total (int): Total number of segments.
+        timecodes (TimecodeIndex): All timecodes of the movie.
+        duration (int): Duration of the segment in seconds.
+        additional (str): Additional block, e.g. slice information.
+
+    Returns:
+        str: Caption trimmed to fit Telegram's caption limit.
+    """
+    segment_start = segment.get('start')
+    segment_end = segment.get('end')
+    timecodes_text = timecodes.formatted_text(
+        start_time=segment_start + config.SEGMENT_DURATION_PADDING_SEC,
+        end_time=segment_end - config.SEGMENT_DURATION_PADDING_SEC - 1,
+        shift=segment_start)
+
+    if segment.get('title'):
+        additional += config.ADDITIONAL_CHAPTER_BLOCK.substitute(
+            time_shift=standardize_time_format(timedelta_from_seconds(segment_start)),
+            title=segment.get('title'))
+        timecodes_text = ''
+
+    caption = Template(caption_head).safe_substitute(
+        partition='' if total == 1 else f'[Part {index + 1} of {total}]',
+        duration=standardize_time_format(timedelta_from_seconds(duration + 1)),
+        content=timecodes_text,
+        additional=additional)
+
+    return caption if len(caption) < config.TELEGRAM_MAX_CAPTION_TEXT_SIZE else trim_caption_to_telegram_send(caption)
+
+
+def get_segment_filename(title: str, segment_path: pathlib.Path, index: int, total: int) -> str:
+    """Upload filename of a part: part number, title cut to fit the Telegram limit and the file name."""
+    # todo English filename EX https://www.youtube.com/watch?v=gYeyOZTgf2g
+    fname_suffix = pathlib.Path(segment_path).name
+    fname_prefix = '' if total == 1 else f'p{index + 1}_of{total}-'
+    fname_title_size = config.TG_MAX_FILENAME_LEN - len(fname_prefix) - len(fname_suffix)
+    fname_title = title[:fname_title_size]+'-' if fname_title_size > 6 else ''
+    return fname_prefix + fname_title + fname_suffix
+
+
+def get_audio_input_file(path: pathlib.Path | str, filename: str) -> FSInputFile | str:
+    """
+    Audio file to pass to send_audio / InputMediaAudio.
+
+    A local Bot API server started with --local reads the file by its path, so nothing is streamed over HTTP.
+    Telegram then names the file after the path, `filename` is used for multipart uploads only.
+    """
+    if config.TELEGRAM_API_SERVER_URL and config.TELEGRAM_API_SERVER_LOCAL_FILES:
+        return pathlib.Path(path).resolve().as_uri()
+    return FSInputFile(path=path, filename=filename)
+
+
+async def job_downloading_stored(bot: Bot, job_id: int):
+    """
+    Runs `job_downloading` for a job recorded in the job store and forgets the job once it is finished.
+
+    If the job is cancelled (e.g. on shutdown) it stays in the store and is resumed on the next start
+    from its last completed stage. A job failed with an error is removed as a finished one.
+
+    Args:
+        bot (Bot): The bot instance.
+        job_id (int): Job ID in the job store.
+    """
+    job = await job_store.get_job(job_id)
+    if job is None:
+        return
+
+    if job.get('attempts', 0) >= config.JOB_MAX_ATTEMPTS:
+        logger.error(f'❌ Job {job_id} exceeded {config.JOB_MAX_ATTEMPTS} attempts. Dropping it.')
+        await job_store.remove_job(job_id)
+        return
+
+    await job_store.mark_started(job_id)
+
+    try:
+        # Files of the movie must not be evicted from the data cache while the job uses them
+        with data_cache.pinned(get_big_youtube_move_id(job.get('message_text', ''))):
+            await job_downloading(
+                bot=bot,
+                sender_id=job.get('sender_id'),
+                reply_to_message_id=job.get('reply_to_message_id'),
+                message_text=job.get('message_text'),
+                info_message_id=job.get('info_message_id'),
+                configurations=job.get('configurations'),
+                job=job)
+    except asyncio.CancelledError:
+        logger.info(f'🗄 Job {job_id} interrupted at stage [{job.get("stage")}]. It will be resumed on next start.')
+        raise
+    except Exception as e:
+        # Not a transient interruption: running it again after restart would only repeat parts and errors
+        logger.error(f'❌🗄 Job {job_id} failed at stage [{job.get("stage")}]. Dropping it: {e}')
+        await job_store.remove_job(job_id)
+        raise
+
+    await job_store.remove_job(job_id)
+
+
+async def job_in_memory(
+        bot: Bot,
+        sender_id: int,
+        reply_to_message_id: int | None,
+        progress: ProgressReporter,
+        metadata: MovieMetadata,
+        bitrate: str,
+        native_format: dict | None,
+        timecodes: dict,
+        summary_skip_download: bool,
+        caption_head: str,
+        plan_key: str,
+        data_dir: pathlib.Path,
+        info_json_path: pathlib.Path) -> bool:
+    """
+    Sends short audio without the data dir round trips: it is downloaded and encoded through pipes
+    into memory and uploaded from there, see `download_audio_to_memory`. Saved into the data dir afterwards
+    if Y2A_IN_MEMORY_SAVE_TO_CACHE is on.
+
+    Args:
+        bot (Bot): The bot instance.
+        sender_id (int): Chat to send the audio to.
+        reply_to_message_id (int | None): Message the audio replies to.
+        progress (ProgressReporter): Progress message of the job.
+        metadata (MovieMetadata): Metadata of the movie.
+        bitrate (str): AAC bitrate, e.g. '48k'.
+        native_format (dict | None): AAC format of the movie to copy without encoding.
+        timecodes (dict): Timecodes and chapters by time in seconds.
+        summary_skip_download (bool): Whether the summary is not needed for timecodes.
+        caption_head (str): Caption template with movie title, link and author filled in.
+        plan_key (str): Segmentation plan key for the file_id cache.
+        data_dir (pathlib.Path): Data dir.
+        info_json_path (pathlib.Path): Already extracted movie info, see `write_info_json`.
+
+    Returns:
+        bool: True if the audio is sent. False if it is expected to be too big for memory or the in-memory
+        download failed, so the full pipeline should run.
+    """
+    movie_id = metadata.movie_id
+    mid = movie_id + ' 🔹'
+    duration = metadata.duration
+
+    # One part only: longer audio would be split
+    if duration > config.SEGMENT_AUDIO_DURATION_SPLIT_THRESHOLD_SEC:
+        return False
+    kbit_per_sec = native_format.get('abr') if native_format is not None else parse_bitrate(bitrate)
+    if not kbit_per_sec or duration * kbit_per_sec * 1000 / 8 > config.IN_MEMORY_MAX_BYTES:
+        return False
+
+    logger.info(f'🧠 {mid} Downloading into memory.')
+    progress.update('⏳ Downloading…')
+    audio_path = data_dir / f'{movie_id}-{bitrate}.m4a'
+    format_id = native_format.get('format_id') if native_format is not None else None
+
+    async def download_thumbnail_and_summary():
+        async with job_scheduler.stage(STAGE_NETWORK):
+            return await asyncio.gather(
+                single_flight.run(
+                    ('thumbnail', movie_id), download_thumbnail_from_download,
+                    movie_id=movie_id, output_path=data_dir / f'{movie_id}-thumbnail.jpg',
+                    info_json_path=info_json_path),
+                single_flight.run(
+                    ('summary', movie_id, metadata.language, summary_skip_download), download_summary,
+                    movie_id=movie_id, language=metadata.language, dir_path=data_dir,
+                    skip=summary_skip_download))
+
+    try:
+        # The pipe download holds the CPU stage inside, so it runs beside the network stage, not within it
+        audio, (thumbnail_path, summary) = await asyncio.wait_for(
+            timeout=config.KILL_JOB_DOWNLOAD_TIMEOUT_SEC,
+            fut=asyncio.gather(
+                single_flight.run(
+                    ('memory', movie_id, bitrate, format_id), download_audio_to_memory,
+                    movie_id=movie_id, bitrate=bitrate,
+                    # Encoder may exceed the bitrate a bit, the Telegram limit may not be exceeded at all
+                    max_bytes=min(2 * config.IN_MEMORY_MAX_BYTES, config.TELEGRAM_MAX_FILE_SIZE_BYTES),
+                    info_json_path=info_json_path, format_id=format_id,
+                    title=metadata.title, author=metadata.uploader),
+                download_thumbnail_and_summary()))
+    except Exception as e:
+        logger.error(f'❌🧠 {mid} Error occurred during in-memory download: {e}')
+        return False
+
+    if audio is None:
+        return False
+
+    if summary:
+        timecodes = summary
+    segment = {'start': 0, 'end': duration, 'title': ''}
+
+    logger.info(f'💚 {mid} Uploading audio from memory to {sender_id}: {len(audio)} bytes')
+    try:
+        async with job_scheduler.stage(STAGE_NETWORK):
+            sent_message = await telegram_sender.call(
+                sender_id,
+                bot.send_audio,
+                chat_id=sender_id,
+                audio=BufferedInputFile(file=audio, filename=get_segment_filename(metadata.title, audio_path, 0, 1)),
+                duration=duration,
+                thumbnail=FSInputFile(path=thumbnail_path) if thumbnail_path is not None else None,
+                caption=get_segment_caption(caption_head, segment, 0, 1, TimecodeIndex(timecodes), duration),
+                reply_to_message_id=reply_to_message_id if config.REPLY_TO_ORIGINAL else None,
+                parse_mode='HTML',
+                request_timeout=600)
+    except Exception as e:
+        logger.error(f'❌🧠 {mid} Unable to upload audio from memory: {e}')
+        return False
+
+    if config.FILE_ID_CACHE_ENABLED and sent_message.audio:
+        await file_id_cache.put_segment(
+            movie_id=movie_id, bitrate=bitrate, plan=plan_key, segment_index=0, segments_total=1,
+            file_id=sent_message.audio.file_id, duration=duration, start=0, end=duration, title='')
+
+    await progress.delete()
+    logger.info(f'💚✅🧠 {mid} Done from memory!')
+
+    # The user has the audio already, the file is only for later requests
+    # Concurrent jobs of the same movie got the same bytes, so one of them saves the file
+    if config.IN_MEMORY_SAVE_TO_CACHE and not audio_path.exists() and await single_flight.run(
+            ('memory-save', audio_path.as_posix()), save_memory_audio, audio=audio, output_path=audio_path) is not None:
+        data_cache.touch(audio_path, thumbnail_path)
+    return True
+
+
+async def job_streaming(
+        bot: Bot,
+        sender_id: int,
+        reply_to_message_id: int | None,
+        progress: ProgressReporter,
+        metadata: MovieMetadata,
+        bitrate: str,
+        timecodes: dict,
+        caption_head: str,
+        plan_key: str,
+        data_dir: pathlib.Path,
+        info_json_path: pathlib.Path) -> bool:
+    """
+    Sends parts of long audio while the rest is still downloading, see `stream_audio_segments`.
+
+    Parts are planned before download by duration: the file size limit is estimated from the bitrate,
+    timecodes come from description and chapters, a summary is used only if it is on disk already.
+
+    Args:
+        bot (Bot): The bot instance.
+        sender_id (int): Chat to send parts to.
+        reply_to_message_id (int | None): Message the first part replies to.
+        progress (ProgressReporter): Progress message of the job.
+        metadata (MovieMetadata): Metadata of the movie.
+        bitrate (str): AAC bitrate, e.g. '48k'.
+        timecodes (dict): Timecodes and chapters by time in seconds.
+        caption_head (str): Caption template with movie title, link and author filled in.
+        plan_key (str): Segmentation plan key of the request. Parts are cached under `get_streaming_plan_key`.
+        data_dir (pathlib.Path): Data dir.
+        info_json_path (pathlib.Path): Already extracted movie info, see `write_info_json`.
+
+    Returns:
+        bool: True if the job is finished: all parts are sent or the error is shown. False if the audio
+        is not split into parts or streaming failed before the first part, so the full pipeline should run.
+    """
+    movie_id = metadata.movie_id
+    mid = movie_id + ' 🔹'
+
+    if not (max_segment_duration := get_streaming_max_segment_duration(bitrate)):
+        return False
+
+    if not timecodes and get_summary_path(movie_id, data_dir).exists():
+        timecodes = await download_summary(movie_id=movie_id, language=metadata.language, dir_path=data_dir)
+    timecode_index = TimecodeIndex(timecodes)
+
+    # Parts are cut in the stream exactly at their starts, so they have no paddings
+    segments = plan_segments(
+        total_duration=metadata.duration,
+        timecodes=timecode_index,
+        max_segment_duration=max_segment_duration,
+        available_caption_size=config.TELEGRAM_MAX_CAPTION_TEXT_SIZE - len(caption_head),
+        padding=0)
+    if len(segments) < 2:
+        return False
+    logger.info(f'📡 {mid} Streaming {len(segments)} parts. Planned: {segments}')
+
+    async with job_scheduler.stage(STAGE_NETWORK):
+        thumbnail_path = await single_flight.run(
+            ('thumbnail', movie_id), download_thumbnail_from_download,
+            movie_id=movie_id, output_path=data_dir / f'{movie_id}-thumbnail.jpg', info_json_path=info_json_path)
+
+    progress.update(f'⏳📡 Downloading and sending {len(segments)} parts…')
+    reply_output = reply_to_message_id if config.REPLY_TO_ORIGINAL else None
+    sent_count = 0
+
+    async def send_parts():
+        nonlocal reply_output, sent_count
+        # Parts come from a task of their own through a queue: it holds the CPU stage, uploads take the network one
+        queue = asyncio.Queue()
+        producer = asyncio.create_task(stream_audio_segments(
+            movie_id=movie_id, audio_path=data_dir / f'{movie_id}-{bitrate}.m4a', segments=segments,
+            bitrate=bitrate, queue=queue, info_json_path=info_json_path, title=metadata.title,
+            author=metadata.uploader))
+        try:
+            for _ in range(len(segments)):
+                idx, segment = await get_streamed_segment(queue, producer)
+                segment_path = segment.get('path')
+                duration_measure = await get_duration(segment_path)
+                segment_duration = duration_measure if duration_measure is not None else segment.get('end') - segment.get('start')
+
+                logger.info(f'💚 {mid} Uploading audio file to {sender_id}: {segment_path}')
+                async with job_scheduler.stage(STAGE_NETWORK):
+                    sent_message = await telegram_sender.call(
+                        sender_id,
+                        bot.send_audio,
+                        chat_id=sender_id,
+                        audio=get_audio_input_file(
+                            segment_path, get_segment_filename(metadata.title, segment_path, idx, len(segments))),
+                        duration=segment_duration,
+                        thumbnail=FSInputFile(path=thumbnail_path) if thumbnail_path is not None else None,
+                        caption=get_segment_caption(
+                            caption_head, segment, idx, len(segments), timecode_index, segment_duration),
+                        reply_to_message_id=reply_output,
+                        parse_mode='HTML',
+                        request_timeout=600)
+                reply_output = None
+                sent_count += 1
+                logger.info(f'💚 {mid} [{idx + 1} of {len(segments)}] Audio sent successfully')
+                progress.update(f'⏳📡 Sent {sent_count} of {len(segments)} parts. Downloading the rest…')
+
+                # Uploads are not recorded in the job store: a resumed job runs the full pipeline with its own plan
+                if config.FILE_ID_CACHE_ENABLED and sent_message.audio:
+                    await file_id_cache.put_segment(
+                        movie_id=movie_id, bitrate=bitrate, plan=get_streaming_plan_key(plan_key), segment_index=idx,
+                        segments_total=len(segments), file_id=sent_message.audio.file_id, duration=segment_duration,
+                        start=segment.get('start'), end=segment.get('end'), title=segment.get('title', ''))
+
+            await producer
+        finally:
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+
+    try:
+        await asyncio.wait_for(send_parts(), timeout=config.KILL_JOB_DOWNLOAD_TIMEOUT_SEC)
+    except Exception as e:
+        logger.error(f'❌📡 {mid} Streaming failed after {sent_count} of {len(segments)} parts: {e}')
+        if not sent_count:
+            return False
+        await progress.finish(
+            f'❌ Error: Failed to download the rest after part {sent_count} of {len(segments)}. Please try again later.')
+        return True
+
+    await progress.delete()
+    logger.info(f'💚✅📡 {mid} Done by streaming!')
+    return True
 
-async def magic_sleep_against_flood(index: int, total_item_count: int):
-    if index != 0 and index != total_item_count - 1:
-        sleep_duration = math.floor(8 * math.log10(total_item_count+ 1))
-        logger.debug(f'💤😴 Sleeping for {sleep_duration} seconds.')
-        await asyncio.sleep(sleep_duration)
 
 async def job_downloading(
         bot: Bot,
@@ -142,10 +594,16 @@ async def job_downloading(
         reply_to_message_id: int | None = None,
         message_text: str = '',
         info_message_id: int | None = None,
-        configurations=None):
+        configurations=None,
+        job: dict | None = None):
     if configurations is None:
         configurations = {}
 
+    # Job record from the job store. Used to report stages and to resume from the last completed one.
+    job_id = job.get('id') if job else None
+    resume_stage = job.get('stage', '') if job else ''
+    uploaded_segments = job.get('uploaded_segments', 0) if job else 0
+
     movie_id = get_big_youtube_move_id(message_text)
     if not movie_id:
         return
@@ -154,64 +612,64 @@ async def job_downloading(
     logger.debug(f'🌀 {mid} START-JOB: configurations: {configurations}')
 
     # Inverted logic refactor
-    info_message = await bot.edit_message_text(
-        chat_id=sender_id,
-        message_id=info_message_id,
-        text='⏳ Preparing…'
-    ) if info_message_id else await bot.send_message(
-        chat_id=sender_id,
-        text='⏳ Preparing…',
-        reply_to_message_id=reply_to_message_id
-    )
+    info_message = None
+    if info_message_id:
+        try:
+            info_message = await bot.edit_message_text(chat_id=sender_id, message_id=info_message_id, text='⏳ Preparing…')
+        except TelegramBadRequest as e:
+            # Message may be deleted or unchanged when a job is resumed after restart
+            logger.debug(f'🔹 {mid} Unable to edit info message {info_message_id}: {e}')
 
-    try:
-        yt_info = await fetch_yt_info(movie_id,  {
-            'logtostderr': False,  # Avoids logging to stderr, logs to the logger instead
-            'quiet': True,  # Suppresses default output,
-            'nocheckcertificate': True,
-            'no_warnings': True,
-            'skip_download': True,})
-    except Exception as e:
-        logger.error(f'❌ {mid} Unable to extract YT-DLP info. \n\n{e}')
-        await info_message.edit_text('❌ Unable to extract YT-DLP info for this movie.')
-        return
+    if not isinstance(info_message, Message):
+        info_message = await bot.send_message(
+            chat_id=sender_id,
+            text='⏳ Preparing…',
+            reply_to_message_id=reply_to_message_id)
+
+    if job_id is not None:
+        await job_store.set_info_message_id(job_id, info_message.message_id)
+        if not is_stage_reached(resume_stage, JOB_STAGE_STARTED):
+            await job_store.set_stage(job_id, JOB_STAGE_STARTED)
+
+    # Stages only report their state, the message is edited in the background
+    progress = ProgressReporter(info_message)
 
-    #logger.info(yt_info)
+    metadata = await get_movie_metadata(movie_id)
 
-    if yt_info.get('is_live'):
+    if metadata.error == ERROR_UNAVAILABLE:
+        await progress.finish('❌ Unable to extract YT-DLP info for this movie.')
+        return
+
+    if metadata.is_live:
         logger.info('❌🎬💃 This movie is now live and unavailable for download. Try...')
         #return
 
-    if not yt_info.get('title') or not yt_info.get('duration'):
-        await info_message.edit_text('❌🎬💔 No title or duration information available for this video. Please try again later.  Exit.')
+    if metadata.error:
+        await progress.finish('❌🎬💔 No title or duration information available for this video. Please try again later.  Exit.')
         return
 
 
-    if not yt_info.get('filesize_approx', ''):
+    if not metadata.filesize_approx:
         logger.info('❌🛰 This movie is currently live, but it may be in the process of being updated. Try...')
         #return
 
-    if not any(format_item.get('filesize') is not None for format_item in yt_info.get('formats', [])):
+    if not metadata.has_format_filesize:
         logger.info('❌🎬🤔 The audio file for this video is unavailable due to an unknown reason. Try...')
         #return
 
     action = configurations.get('action', '')
 
-    title = yt_info.get('title', '')
-    description = yt_info.get('description', '')
-    author = yt_info.get('uploader', '')
-    duration = yt_info.get('duration')
-    language = yt_info.get('language', '')
+    title = metadata.title
+    description = metadata.description
+    author = metadata.uploader
+    duration = metadata.duration
+    language = metadata.language
 
     yt_dlp_options = get_yt_dlp_options()
 
     bitrate = config.AUDIO_QUALITY_BITRATE
 
     data_dir = get_data_dir()
-    audio_path = data_dir / f'{movie_id}-{bitrate}.m4a'
-    thumbnail_path = data_dir / f'{movie_id}-thumbnail.jpg'
-    audio_path_translate_original = data_dir / f'{movie_id}-transl-ru-{bitrate}-original.m4a'
-    audio_path_translate_final = data_dir / f'{movie_id}-transl-ru-{bitrate}.m4a'
 
     # Output items
     reply_output = reply_to_message_id if config.REPLY_TO_ORIGINAL else None
@@ -222,7 +680,7 @@ async def job_downloading(
         author=capital2lower(author))
     caption_head_additional_output = ''
 
-    predict_time_text = seconds2humanview(predict_downloading_time(yt_info.get('duration')))
+    predict_time_text = seconds2humanview(predict_downloading_time(duration))
 
     summary_skip_download = True
 
@@ -236,22 +694,23 @@ async def job_downloading(
         yt_dlp_options = get_yt_dlp_options({'audio-quality': bitrate})
 
     elif action == config.ACTION_NAME_SLICE:
-        start_time = str(configurations.get('slice_start_time'))
-        end_time = str(configurations.get('slice_end_time'))
-
-        start_time_hhmmss = standardize_time_format(timedelta_from_seconds(start_time))
-        end_time_hhmmss = standardize_time_format(timedelta_from_seconds(end_time))
+        slice_start = int(float(configurations.get('slice_start_time', 0)))
+        slice_end = min(int(float(configurations.get('slice_end_time', duration))), duration)
+        if slice_end <= slice_start:
+            await progress.finish('❌🍰 The end of the slice must be after its start and within the movie.')
+            return
 
-        yt_dlp_options += f' --postprocessor-args \"-ss {start_time_hhmmss} -t {end_time_hhmmss}\"'
+        # Only the slice is fetched or cut, so it takes time by its own length
+        predict_time_text = seconds2humanview(predict_downloading_time(slice_end - slice_start))
 
         caption_head_additional_output += '\n\n'
         caption_head_additional_output += config.CAPTION_SLICE.substitute(
-            start_time=standardize_time_format(timedelta_from_seconds(str(configurations.get('slice_start_time')))),
-            end_time=standardize_time_format(timedelta_from_seconds(str(configurations.get('slice_end_time')))))
+            start_time=standardize_time_format(timedelta_from_seconds(str(slice_start))),
+            end_time=standardize_time_format(timedelta_from_seconds(str(slice_end))))
 
     elif action == config.ACTION_NAME_TRANSLATE:
         if language == 'ru':
-            await info_message.edit_text('⏳🌎 This movie is still in Russian. Standard download…')
+            progress.update('⏳🌎 This movie is still in Russian. Standard download…')
             action = ''
         else:
             caption_head_output = f'🌎 Translation\n\n{caption_head_output}'
@@ -261,30 +720,32 @@ async def job_downloading(
     elif action == config.ACTION_NAME_SUMMARIZE:
         logger.debug(f'🧬 {mid} Action == SUMMARIZE!')
 
-        info_message = await info_message.edit_text(f'⏳🧬 Summarize processing…')
-        await asyncio.sleep(config.DELAY_LESSE_SECOND)
+        progress.update('⏳🧬 Summarize processing…')
 
         try:
             tasks = [
                 asyncio.create_task(
-                    download_summary(movie_id=movie_id, language=language, dir_path=data_dir))]
-
-            result = await asyncio.wait_for(
-                timeout=config.KILL_JOB_DOWNLOAD_TIMEOUT_SEC,
-                fut=asyncio.gather(*tasks))
+                    single_flight.run(
+                        ('summary', movie_id, language), download_summary,
+                        movie_id=movie_id, language=language, dir_path=data_dir))]
+
+            async with job_scheduler.stage(STAGE_NETWORK):
+                result = await asyncio.wait_for(
+                    timeout=config.KILL_JOB_DOWNLOAD_TIMEOUT_SEC,
+                    fut=asyncio.gather(*tasks))
         except asyncio.TimeoutError:
             logger.error(f'❌🧬 {mid} TimeoutError occurred during Single Summery().')
-            await info_message.edit_text('❌🧬 TimeoutError occurred during Single Summery().')
+            await progress.finish('❌🧬 TimeoutError occurred during Single Summery().')
             return
         except Exception as err:
             logger.error(f'❌🧬 {mid} Error occurred during Single Summery().\n\n{err}')
-            await info_message.edit_text('❌🧬 Error occurred during Single Summery().')
+            await progress.finish('❌🧬 Error occurred during Single Summery().')
             return
 
         timecodes_with_summary = result[0]
 
         if not timecodes_with_summary:
-            await info_message.edit_text('🧬💔 Failed to create the summary. Please try again later.')
+            await progress.finish('🧬💔 Failed to create the summary. Please try again later.')
             return
 
         caption_summary = Template(caption_head_output).safe_substitute(
@@ -311,64 +772,215 @@ async def job_downloading(
                 caption=caption_summary,
                 document=BufferedInputFile(filename=f'summary-{movie_id}.txt', file=file_text.encode('utf-8')))
 
-        await info_message.delete()
+        await progress.delete()
         return
 
-    info_message = await info_message.edit_text(f'⏳ Downloading ~ {predict_time_text}…')
+    # Paths depend on the bitrate, which may be changed by the action above
+    audio_path = data_dir / f'{movie_id}-{bitrate}.m4a'
+    thumbnail_path = data_dir / f'{movie_id}-thumbnail.jpg'
+    # Saved with the metadata, so audio and thumbnail are downloaded without fetching the movie page again
+    info_json_path = get_info_json_path(movie_id, data_dir)
+    audio_path_translate_original = data_dir / f'{movie_id}-transl-ru-{bitrate}-original.m4a'
+    audio_path_translate_final = data_dir / f'{movie_id}-transl-ru-{bitrate}.m4a'
+    if action == config.ACTION_NAME_SLICE:
+        audio_path = get_slice_path(movie_id, bitrate, slice_start, slice_end, data_dir)
+
+    # The movie's own AAC stream close to the bitrate is copied as is. Otherwise any bitrate is encoded locally
+    # from one master download. Slices are cut from audio on disk or downloaded as a section.
+    native_format = None
+    if action != config.ACTION_NAME_SLICE and not audio_path.exists():
+        native_format = select_native_audio_format(metadata.audio_formats, bitrate)
+    if native_format is not None:
+        logger.info(f'🎚 {mid} Native format {native_format.get("format_id")} '
+                    f'({native_format.get("abr")}k) is copied without encoding.')
+        yt_dlp_options = YT_DLP_NATIVE_AUDIO_OPTIONS.substitute(format_id=native_format.get('format_id'))
+
+    use_master = (config.TRANSCODE_FROM_MASTER and native_format is None
+                  and action != config.ACTION_NAME_SLICE and not audio_path.exists())
 
     timecodes_raw = extract_timecodes(description)
 
     timecodes = get_timecodes_dict(timecodes_raw)
 
-    chapters = get_chapters(yt_info.get('chapters', []))
+    chapters = get_chapters(metadata.chapters)
     timecodes.update(chapters)
 
     if not timecodes:
         summary_skip_download = False
 
+    # Already delivered with the same bitrate and segmentation plan: re-send Telegram file_ids
+    plan_key = get_segmentation_plan_key(action, configurations)
+    cached_plan_keys = [plan_key]
+    if action in ('', config.ACTION_NAME_BITRATE_CHANGE):
+        # A plain request may also be served by parts sent while streaming
+        cached_plan_keys.append(get_streaming_plan_key(plan_key))
+
+    cached_segments = None
+    if config.FILE_ID_CACHE_ENABLED and action == config.ACTION_NAME_FORCE_REDOWNLOAD:
+        await file_id_cache.invalidate(movie_id)
+
+    elif config.FILE_ID_CACHE_ENABLED:
+        for cached_plan_key in cached_plan_keys:
+            if cached_segments := await file_id_cache.get_segments(movie_id, bitrate, cached_plan_key):
+                break
+
+    if cached_segments:
+        logger.info(f'🗃 {mid} Found {len(cached_segments)} cached Telegram file_ids. Re-sending.')
+
+        # Summary timecodes are used only if already on disk: the cached path must stay instant
+        if not timecodes and get_summary_path(movie_id, data_dir).exists():
+            timecodes = await download_summary(movie_id=movie_id, language=language, dir_path=data_dir)
+        timecode_index = TimecodeIndex(timecodes)
+
+        try:
+            for idx, segment in enumerate(cached_segments):
+                if idx < uploaded_segments:
+                    reply_output = None
+                    continue
+
+                await telegram_sender.call(
+                    sender_id,
+                    bot.send_audio,
+                    chat_id=sender_id,
+                    audio=segment.get('file_id'),
+                    duration=segment.get('duration'),
+                    caption=get_segment_caption(
+                        caption_head_output, segment, idx, len(cached_segments), timecode_index,
+                        segment.get('duration') or segment.get('end') - segment.get('start'),
+                        caption_head_additional_output),
+                    reply_to_message_id=reply_output,
+                    parse_mode='HTML')
+
+                reply_output = None
+                uploaded_segments = idx + 1
+
+                if job_id is not None:
+                    await job_store.set_stage(job_id, JOB_STAGE_UPLOADING, uploaded_segments=uploaded_segments)
+
+            await progress.delete()
+            logger.info(f'💚✅🗃 {mid} Done from file_id cache!')
+            return
+
+        except TelegramBadRequest as e:
+            # File id is not valid anymore. The full pipeline below plans parts anew and their bounds may differ
+            # from the cached ones, so it starts from the first part and does not reuse split files.
+            logger.error(f'❌🗃 {mid} Telegram rejected cached file_id. Invalidate and upload again: {e}')
+            await file_id_cache.invalidate(movie_id, bitrate, cached_plan_key)
+            uploaded_segments = 0
+            resume_stage = JOB_STAGE_STARTED
+            if job_id is not None:
+                await job_store.set_stage(job_id, JOB_STAGE_STARTED, uploaded_segments=0)
+
+    # Audio of a plain request which is not on disk yet: short one is downloaded into memory, long one is sent
+    # part by part while downloading. Other actions need the whole file.
+    if (action in ('', config.ACTION_NAME_BITRATE_CHANGE) and not uploaded_segments
+            and not audio_path.exists() and find_master_audio(movie_id, data_dir) is None):
+        if config.IN_MEMORY_MAX_BYTES and await job_in_memory(
+                bot=bot, sender_id=sender_id, reply_to_message_id=reply_to_message_id, progress=progress,
+                metadata=metadata, bitrate=bitrate, native_format=native_format, timecodes=timecodes,
+                summary_skip_download=summary_skip_download, caption_head=caption_head_output,
+                plan_key=plan_key, data_dir=data_dir, info_json_path=info_json_path):
+            return
+
+        if config.STREAMING_PIPELINE and await job_streaming(
+                bot=bot, sender_id=sender_id, reply_to_message_id=reply_to_message_id, progress=progress,
+                metadata=metadata, bitrate=bitrate, timecodes=timecodes, caption_head=caption_head_output,
+                plan_key=plan_key, data_dir=data_dir, info_json_path=info_json_path):
+            return
+
+    if action == config.ACTION_NAME_SLICE:
+        # Cut outside of the network stage: the cut takes the CPU one
+        await single_flight.run(
+            ('slice-cut', audio_path.as_posix()), cut_audio_slice_from_data_dir,
+            movie_id=movie_id, output_path=audio_path, start=slice_start, end=slice_end, bitrate=bitrate,
+            dir_path=data_dir, tags={'title': title, 'artist': author})
+
+    progress.update(f'⏳ Downloading ~ {predict_time_text}…')
+
     # todo add depend on predict
 
     # Run tasks with timeout
     async def handle_download():
         try:
+            if use_master:
+                audio_download = single_flight.run(
+                    ('master', movie_id), download_master_audio,
+                    movie_id=movie_id, dir_path=data_dir,
+                    on_progress=progress.update_percent, info_json_path=info_json_path)
+            elif action == config.ACTION_NAME_SLICE:
+                # Returns at once if the slice was cut from the data dir before
+                audio_download = single_flight.run(
+                    ('slice', audio_path.as_posix()), download_audio_slice,
+                    movie_id=movie_id, output_path=audio_path, start=slice_start, end=slice_end,
+                    options=yt_dlp_options, on_progress=progress.update_percent, info_json_path=info_json_path)
+            else:
+                audio_download = single_flight.run(
+                    ('audio', movie_id, bitrate, yt_dlp_options), download_audio_from_download,
+                    movie_id=movie_id, output_path=audio_path, options=yt_dlp_options,
+                    on_progress=progress.update_percent, info_json_path=info_json_path)
+
             _tasks = [
                 asyncio.create_task(
-                    download_audio_from_download(movie_id=movie_id, output_path=audio_path, options=yt_dlp_options)),
+                    audio_download),
                 asyncio.create_task(
-                    download_thumbnail_from_download(movie_id=movie_id, output_path=thumbnail_path)),
+                    single_flight.run(
+                        ('thumbnail', movie_id), download_thumbnail_from_download,
+                        movie_id=movie_id, output_path=thumbnail_path, info_json_path=info_json_path)),
                 asyncio.create_task(
                     empty()),
                 asyncio.create_task(
-                    download_summary(movie_id=movie_id, language=language, dir_path=data_dir, skip=summary_skip_download))]
+                    single_flight.run(
+                        ('summary', movie_id, language, summary_skip_download), download_summary,
+                        movie_id=movie_id, language=language, dir_path=data_dir, skip=summary_skip_download))]
 
             if action == config.ACTION_NAME_TRANSLATE:
                 _tasks[2] = (asyncio.create_task(
-                    make_translate(movie_id=movie_id, output_path=audio_path_translate_original,
-                                   timeout=config.KILL_JOB_DOWNLOAD_TIMEOUT_SEC)))
+                    single_flight.run(
+                        ('translate', movie_id), make_translate,
+                        movie_id=movie_id, output_path=audio_path_translate_original,
+                        timeout=config.KILL_JOB_DOWNLOAD_TIMEOUT_SEC)))
             _result = await asyncio.wait_for(
                 timeout=config.KILL_JOB_DOWNLOAD_TIMEOUT_SEC,
                 fut=asyncio.gather(*_tasks))
             return _result
         except asyncio.TimeoutError:
             logger.error(f'❌ {mid} TimeoutError occurred during download_processing().')
-            await info_message.edit_text('❌ TimeoutError occurred during download_processing().')
-            return None, None
+            await progress.finish('❌ TimeoutError occurred during download_processing().')
+            return None, None, None, None
         except Exception as err:
             logger.error(f'❌ {mid} Error occurred during download_processing().\n\n{err}')
-            await info_message.edit_text('❌ Error occurred during download_processing().')
-            return None, None
-
-    audio_path, thumbnail_path, audio_path_translate_original, summary = await handle_download()
-
+            await progress.finish('❌ Error occurred during download_processing().')
+            return None, None, None, None
+
+    async with job_scheduler.stage(STAGE_NETWORK):
+        downloaded_path, thumbnail_path, audio_path_translate_original, summary = await handle_download()
+
+    if use_master and downloaded_path is not None:
+        master_path = pathlib.Path(downloaded_path)
+        data_cache.touch(master_path)
+        renditions = get_renditions(movie_id, bitrate, data_dir)
+
+        progress.update('⏳🎚 Encoding audio…')
+        # CPU stages are taken inside, one per ffmpeg process
+        renditions = await asyncio.wait_for(
+            single_flight.run(
+                ('transcode', master_path.as_posix(), tuple(sorted(renditions))), transcode_renditions,
+                master_path=master_path, renditions=renditions, duration=duration,
+                # A master downloaded directly has no tags embedded by yt-dlp
+                tags={'title': title, 'artist': author}),
+            timeout=config.KILL_JOB_DOWNLOAD_TIMEOUT_SEC)
+        downloaded_path = renditions.get(bitrate)
+
+    audio_path = downloaded_path
     if audio_path is None:
         logger.error(f'❌ {mid} audio_path is None after downloading. Exiting.')
-        await info_message.edit_text('❌ Error: audio_path is None after downloading. Exiting.')
+        await progress.finish('❌ Error: audio_path is None after downloading. Exiting.')
         return
 
     audio_path = pathlib.Path(audio_path)
     if not audio_path.exists():
         logger.error(f'❌ {mid} audio_path does not exist after downloading. Exiting.')
-        await info_message.edit_text('❌ Error: audio_path does not exist after downloading. Exiting.')
+        await progress.finish('❌ Error: audio_path does not exist after downloading. Exiting.')
         return
 
     if thumbnail_path is not None:
@@ -376,22 +988,34 @@ async def job_downloading(
         if not thumbnail_path.exists():
             thumbnail_path = None
 
+    data_cache.touch(audio_path, thumbnail_path)
+    if summary:
+        data_cache.touch(get_summary_path(movie_id, data_dir))
+
+    if job_id is not None and not is_stage_reached(resume_stage, JOB_STAGE_DOWNLOADED):
+        await job_store.set_stage(job_id, JOB_STAGE_DOWNLOADED)
+
     if action == config.ACTION_NAME_TRANSLATE:
         if audio_path_translate_original is None:
             logger.error(f'❌ {mid} audio_path_translate_original is None after downloading. Exiting.')
-            await info_message.edit_text('❌ Error: audio_path_translate_original is None after downloading. Exiting.')
+            await progress.finish('❌ Error: audio_path_translate_original is None after downloading. Exiting.')
             return
 
         if configurations.get('overlay') == 0.0:
             audio_path = audio_path_translate_original
         else:
-            audio_path_translate_final = await asyncio.wait_for(
-                mix_audio_m4a(audio_path, audio_path_translate_original, audio_path_translate_final, configurations.get('overlay'), bitrate),
-                timeout=config.KILL_JOB_DOWNLOAD_TIMEOUT_SEC)
+            async with job_scheduler.stage(STAGE_CPU):
+                audio_path_translate_final = await asyncio.wait_for(
+                    single_flight.run(
+                        ('mix', audio_path_translate_final.as_posix(), configurations.get('overlay')), mix_audio_m4a,
+                        original_path=audio_path, translated_path=audio_path_translate_original,
+                        output_path=audio_path_translate_final, overlay_volume=configurations.get('overlay'),
+                        bitrate=bitrate),
+                    timeout=config.KILL_JOB_DOWNLOAD_TIMEOUT_SEC)
 
             if not audio_path_translate_final or not audio_path_translate_final.exists():
                 logger.error(f'❌ {mid} audio_path_translate_final does not exist after downloading. Exiting.')
-                await info_message.edit_text('❌ Error: audio_path_translate_final does not exist after downloading. Exiting.')
+                await progress.finish('❌ Error: audio_path_translate_final does not exist after downloading. Exiting.')
                 return
 
             audio_path = audio_path_translate_final
@@ -399,8 +1023,34 @@ async def job_downloading(
     if summary:
         timecodes = summary
 
-    segments = [{'path': audio_path, 'start': 0, 'end': duration, 'title': ''}]
+    if action == config.ACTION_NAME_SLICE:
+        # The slice is planned as a movie of its own: from zero, with timecodes inside it
+        duration = slice_end - slice_start
+        timecodes = {
+            time - slice_start: timecode
+            for time, timecode in TimecodeIndex(timecodes).within(slice_start, slice_end - 1).items()}
+
+    # Sorted once, then queried by every planning step and caption
+    timecode_index = TimecodeIndex(timecodes)
+
+    audio_index = await asyncio.to_thread(Mp4AudioIndex.from_file, audio_path)
+    # Exact size check of a planned part, only possible with the sample index
+    segment_fits = None
+    if audio_index is not None:
+        # Real sample sizes, so VBR audio is planned exactly. The rest of the limit is left for container overhead.
+        max_segment_bytes = int(MP4_SAMPLES_SHARE_OF_FILE_SIZE * config.TELEGRAM_MAX_FILE_SIZE_BYTES)
+        max_segment_duration = max(1, int(audio_index.max_duration_within_bytes(max_segment_bytes)))
+
+        def fits_file_size_limit(start: int, end: int) -> bool:
+            return audio_index.bytes_between(start, end) <= max_segment_bytes
+
+        segment_fits = fits_file_size_limit
+    else:
+        audio_file_size = await get_file_size(audio_path)
+        max_segment_duration = int(0.89 * duration * config.TELEGRAM_MAX_FILE_SIZE_BYTES / audio_file_size)
+    logger.debug(f'🎛 {mid} Max segment duration: {max_segment_duration}')
 
+    segments = []
     if action == config.ACTION_NAME_SPLIT_BY_DURATION:
         split_duration_minutes = int(configurations.get('split_duration_minutes', 0))
         if split_duration_minutes > 0:
@@ -409,139 +1059,177 @@ async def job_downloading(
                 segment_duration=60 * split_duration_minutes)
 
     elif action == config.ACTION_NAME_SPLIT_BY_TIMECODES:
-        segments = get_segments_by_timecodes_from_dict(timecodes=timecodes, total_duration=duration)
-
-    elif duration > config.SEGMENT_AUDIO_DURATION_SPLIT_THRESHOLD_SEC:
-        segments = get_segments_by_duration(
-            total_duration=duration,
-            segment_duration=config.SEGMENT_AUDIO_DURATION_SEC)
-
-    segments = add_paddings_to_segments(segments, config.SEGMENT_DURATION_PADDING_SEC)
-    logger.info(f'🎛 Segments. Add Paddings: {segments}')
-
-    audio_file_size = await get_file_size(audio_path)
-
-    max_segment_duration = int(0.89 * duration * config.TELEGRAM_MAX_FILE_SIZE_BYTES / audio_file_size)
-
-    segments = make_magic_tail(segments, max_segment_duration)
-    logger.info(f'🦖 Segments. Make Magic Tail: {segments}')
-
-    segments = segments_verification(segments, max_segment_duration)
-    logger.info(f'🌈 Segments. Verification: {segments}')
-
-    # Check Rebalance by Timecodes
-    if SEGMENT_REBALANCE_TO_FIT_TIMECODES:
-        segments = rebalance_segments_long_timecodes(
-            segments,
-            config.TELEGRAM_MAX_CAPTION_TEXT_SIZE - len(caption_head_output),
-            timecodes,
-            config.SEGMENT_AUDIO_DURATION_SEC)
+        segments = get_segments_by_timecodes_from_dict(timecodes=timecode_index, total_duration=duration)
 
+    if segments:
+        # Parts requested explicitly are kept, only too big ones are divided
         segments = add_paddings_to_segments(segments, config.SEGMENT_DURATION_PADDING_SEC)
-
-        logger.info(f'🎭 Segments. Rebalanced Fit Timecodes: {segments}')
+        segments = segments_verification(segments, max_segment_duration)
+    else:
+        segments = plan_segments(
+            total_duration=duration,
+            timecodes=timecode_index,
+            max_segment_duration=max_segment_duration,
+            available_caption_size=config.TELEGRAM_MAX_CAPTION_TEXT_SIZE - len(caption_head_output),
+            fits=segment_fits)
+    logger.info(f'🎛 Segments. Planned: {segments}')
 
     if not segments:
         logger.error(f'❌ {mid} No audio segments found after processing. This could be an internal error.')
-        await info_message.edit_text(f'❌ Error: No audio segments found after processing. This could be an internal error.')
+        await progress.finish(f'❌ Error: No audio segments found after processing. This could be an internal error.')
         return
 
 
 
     try:
-        segments = await make_split_audio_second(audio_path, segments)
+        # Segment files of a resumed job which has already passed the split stage are complete, so reuse them
+        reuse_existing = is_stage_reached(resume_stage, JOB_STAGE_SPLIT)
+
+        async def split_in_cpu_stage():
+            async with job_scheduler.stage(STAGE_CPU):
+                return await make_split_audio_second(
+                    audio_path, segments, reuse_existing=reuse_existing, audio_index=audio_index)
+
+        segments = await single_flight.run(
+            ('split', audio_path.as_posix(), tuple((item['start'], item['end']) for item in segments)),
+            split_in_cpu_stage)
     except Exception as e:
         logger.error(f'❌ {mid} Error occurred while splitting audio into segments: {e}')
-        await info_message.edit_text(f'❌ Error: Failed to split audio into segments.')
+        await progress.finish(f'❌ Error: Failed to split audio into segments.')
     if not segments:
         logger.error(f'❌ {mid} No audio segments found after splitting.')
-        await info_message.edit_text(f'❌ Error: No audio segments found after processing.')
+        await progress.finish(f'❌ Error: No audio segments found after processing.')
         return
 
     logger.info(f'🎰 Segments. Make Split: {segments}')
 
-    await info_message.edit_text('⌛🚀 Uploading to Telegram…')
-
-    for idx, segment in enumerate(segments):
-        logger.info(f'💚 {mid} [{idx} of {len(segments)}] Uploading audio file: {segment.get("path")}')
-        segment_start = segment.get('start')
-        segment_end = segment.get('end')
-        filtered_timecodes_dict = filter_timecodes_within_bounds(
-            timecodes=timecodes, start_time=segment_start + config.SEGMENT_DURATION_PADDING_SEC, end_time=segment_end - config.SEGMENT_DURATION_PADDING_SEC - 1)
-        timecodes_text = get_timecodes_formatted_text(filtered_timecodes_dict, segment_start)
+    if job_id is not None and not is_stage_reached(resume_stage, JOB_STAGE_SPLIT):
+        await job_store.set_stage(job_id, JOB_STAGE_SPLIT)
 
-        if segment.get('title'):
-            caption_head_additional_output += config.ADDITIONAL_CHAPTER_BLOCK.substitute(
-                time_shift=standardize_time_format(timedelta_from_seconds(segment.get('start'))),
-                title=segment.get('title'))
-            timecodes_text = ''
+    progress.update('⌛🚀 Uploading to Telegram…')
 
+    async def prepare_segment(idx: int, segment: dict) -> dict:
         segment_path = pathlib.Path(segment.get('path'))
 
         duration_measure = await get_duration(segment_path)
-        duration = duration_measure if duration_measure is not None else segment_end - segment_start
+        segment_duration = duration_measure if duration_measure is not None else segment.get('end') - segment.get('start')
+
+        return {
+            'duration': segment_duration,
+            'filename': get_segment_filename(title, segment_path, idx, len(segments)),
+            'caption': get_segment_caption(
+                caption_head_output, segment, idx, len(segments), timecode_index, segment_duration,
+                caption_head_additional_output)}
+
+    async def upload_segment(segment: dict, prepared: dict, chat_id: int | str, reply_to_message_id: int | None = None):
+        logger.info(f'💚 {mid} Uploading audio file to {chat_id}: {segment.get("path")}')
+        async with job_scheduler.stage(STAGE_NETWORK):
+            return await telegram_sender.call(
+                chat_id,
+                bot.send_audio,
+                chat_id=chat_id,
+                audio=get_audio_input_file(segment.get('path'), prepared.get('filename')),
+                duration=prepared.get('duration'),
+                thumbnail=FSInputFile(path=thumbnail_path) if thumbnail_path is not None else None,
+                caption=prepared.get('caption'),
+                reply_to_message_id=reply_to_message_id,
+                parse_mode='HTML',
+                request_timeout=600)
+
+    if uploaded_segments:
+        logger.info(f'💚 {mid} {uploaded_segments} of {len(segments)} parts already uploaded before restart. Skip them.')
+        reply_output = None
 
-        caption_output = Template(caption_head_output).safe_substitute(
-            partition='' if len(segments) == 1 else f'[Part {idx + 1} of {len(segments)}]',
-            duration=standardize_time_format(timedelta_from_seconds(duration + 1)),
-            content=timecodes_text,
-            additional=caption_head_additional_output)
-
-        # todo English filename EX https://www.youtube.com/watch?v=gYeyOZTgf2g
-        fname_suffix = segment_path.name
-        fname_prefix = '' if len(segments) == 1 else f'p{idx + 1}_of{len(segments)}-'
-        fname_title_size = config.TG_MAX_FILENAME_LEN - len(fname_prefix) - len(fname_suffix)
-        fname_title = title[:fname_title_size]+'-' if fname_title_size > 6 else ''
-
-        _MAX_ATTEMPTS = 4
-        for attempt in range(_MAX_ATTEMPTS):
-            try:
-                logger.info(
-                    "Sending audio (%s), attempt %d/%d",
-                    segment.get('path'),
-                    attempt + 1,
-                    _MAX_ATTEMPTS
-                )
-
-                await bot.send_audio(
+    pending_indexes = list(range(uploaded_segments, len(segments)))
+    prepared_segments = {idx: await prepare_segment(idx, segments[idx]) for idx in pending_indexes}
+
+    # With a storage chat all parts are uploaded there concurrently and then re-sent to the user by file_id,
+    # so parts still appear in order while uploads overlap
+    storage_uploads = {}
+    if config.UPLOAD_STORAGE_CHAT_ID:
+        storage_uploads = {
+            idx: asyncio.create_task(upload_segment(segments[idx], prepared_segments[idx], config.UPLOAD_STORAGE_CHAT_ID))
+            for idx in pending_indexes}
+
+    async def send_single(idx: int, reply_to_message_id: int | None):
+        if idx not in storage_uploads:
+            return await upload_segment(segments[idx], prepared_segments[idx], sender_id, reply_to_message_id)
+
+        stored_message = await storage_uploads[idx]
+        return await telegram_sender.call(
+            sender_id,
+            bot.send_audio,
+            chat_id=sender_id,
+            audio=stored_message.audio.file_id,
+            duration=prepared_segments[idx].get('duration'),
+            caption=prepared_segments[idx].get('caption'),
+            reply_to_message_id=reply_to_message_id,
+            parse_mode='HTML')
+
+    async def try_send_album(batch: list, reply_to_message_id: int | None):
+        """Sends parts as one audio album. Returns None if Telegram rejects the album."""
+        media = []
+        for idx in batch:
+            prepared = prepared_segments[idx]
+            if idx in storage_uploads:
+                audio = (await storage_uploads[idx]).audio.file_id
+                thumbnail = None
+            else:
+                audio = get_audio_input_file(segments[idx].get('path'), prepared.get('filename'))
+                thumbnail = FSInputFile(path=thumbnail_path) if thumbnail_path is not None else None
+            media.append(InputMediaAudio(
+                media=audio,
+                thumbnail=thumbnail,
+                duration=prepared.get('duration'),
+                caption=prepared.get('caption'),
+                parse_mode='HTML'))
+
+        logger.info(f'💚 {mid} Sending album of parts {batch[0] + 1}-{batch[-1] + 1} of {len(segments)}')
+        try:
+            async with job_scheduler.stage(STAGE_NETWORK):
+                return await telegram_sender.call(
+                    sender_id,
+                    bot.send_media_group,
                     chat_id=sender_id,
-                    audio=FSInputFile(
-                        path=segment.get('path'),
-                        filename=fname_prefix + fname_title + fname_suffix
-                    ),
-                    duration=duration,
-                    thumbnail=FSInputFile(path=thumbnail_path) if thumbnail_path is not None else None,
-                    caption=(
-                        caption_output
-                        if len(caption_output) < config.TELEGRAM_MAX_CAPTION_TEXT_SIZE
-                        else trim_caption_to_telegram_send(caption_output)
-                    ),
-                    reply_to_message_id=reply_output,
-                    parse_mode='HTML',
-                    request_timeout=600
-                )
-
-                logger.info("Audio sent successfully")
-                break
-
-            except TelegramNetworkError as e:
-                logger.warning(
-                    "TelegramNetworkError on attempt %d/%d: %s",
-                    attempt + 1,
-                    _MAX_ATTEMPTS,
-                    e
-                )
-
-                if attempt == _MAX_ATTEMPTS - 1:
-                    logger.error("All attempts to send audio failed")
-                    raise
+                    media=media,
+                    reply_to_message_id=reply_to_message_id,
+                    request_timeout=600)
+        except (TelegramBadRequest, TelegramEntityTooLarge) as e:
+            logger.error(f'❌ {mid} Album was rejected. Sending parts one by one: {e}')
+            return None
+
+    async def record_sent(idx: int, sent_message: Message):
+        logger.info(f'💚 {mid} [{idx + 1} of {len(segments)}] Audio sent successfully')
+
+        if job_id is not None:
+            await job_store.set_stage(job_id, JOB_STAGE_UPLOADING, uploaded_segments=idx + 1)
+
+        if config.FILE_ID_CACHE_ENABLED and sent_message.audio:
+            segment = segments[idx]
+            await file_id_cache.put_segment(
+                movie_id=movie_id, bitrate=bitrate, plan=plan_key, segment_index=idx, segments_total=len(segments),
+                file_id=sent_message.audio.file_id, duration=prepared_segments[idx].get('duration'),
+                start=segment.get('start'), end=segment.get('end'), title=segment.get('title', ''))
 
-                await asyncio.sleep(2 * (attempt + 1))  # backoff
-
-        reply_output = None
+    try:
+        batch_size = config.TELEGRAM_MEDIA_GROUP_MAX_SIZE if config.UPLOAD_AS_MEDIA_GROUP else 1
+        for batch_start in range(0, len(pending_indexes), batch_size):
+            batch = pending_indexes[batch_start:batch_start + batch_size]
+
+            if len(batch) > 1 and (album := await try_send_album(batch, reply_output)):
+                reply_output = None
+                for idx, sent_message in zip(batch, album):
+                    await record_sent(idx, sent_message)
+                continue
 
-        # Sleep to avoid flood in Telegram API
-        await magic_sleep_against_flood(idx, len(segments))
+            for idx in batch:
+                sent_message = await send_single(idx, reply_output)
+                reply_output = None
+                await record_sent(idx, sent_message)
+    finally:
+        for task in storage_uploads.values():
+            task.cancel()
+        await asyncio.gather(*storage_uploads.values(), return_exceptions=True)
 
-    await info_message.delete()
+    await progress.delete()
     logger.info(f'💚✅ {mid} Done!')
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Union
+
+from ytb2audiobot import config
+from ytb2audiobot.logger import logger
+from ytb2audiobot.utils import get_data_dir
+
+DEFAULT_PATH_NAME = 'jobs.sqlite3'
+
+JOB_STAGE_ACCEPTED = 'accepted'
+JOB_STAGE_STARTED = 'started'
+JOB_STAGE_DOWNLOADED = 'downloaded'
+JOB_STAGE_SPLIT = 'split'
+JOB_STAGE_UPLOADING = 'uploading'
+
+JOB_STAGES_ORDER = [JOB_STAGE_ACCEPTED, JOB_STAGE_STARTED, JOB_STAGE_DOWNLOADED, JOB_STAGE_SPLIT, JOB_STAGE_UPLOADING]
+
+_CREATE_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sender_id INTEGER NOT NULL,
+    reply_to_message_id INTEGER,
+    info_message_id INTEGER,
+    message_text TEXT NOT NULL DEFAULT '',
+    configurations TEXT NOT NULL DEFAULT '{}',
+    stage TEXT NOT NULL,
+    uploaded_segments INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+)'''
+
+
+def is_stage_reached(current_stage: str, stage: str) -> bool:
+    """Check if `current_stage` is the same as or later than `stage`."""
+    if current_stage not in JOB_STAGES_ORDER or stage not in JOB_STAGES_ORDER:
+        return False
+    return JOB_STAGES_ORDER.index(current_stage) >= JOB_STAGES_ORDER.index(stage)
+
+
+class JobStore:
+    """Durable SQLite store of accepted download jobs and the last stage each of them completed."""
+
+    def __init__(self, path: Union[Path, str] = DEFAULT_PATH_NAME):
+        """
+        Initialize the store. The SQLite file is opened and the table is created on first use,
+        so importing the module creates no files.
+
+        Args:
+            path (Union[Path, str]): Path to the SQLite file. A relative one is taken inside the data dir.
+        """
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the SQLite file if not yet. Called under the lock."""
+        if self._connection is None:
+            # Resolved once, so the file does not move if the working directory changes later
+            data_dir = get_data_dir().resolve()
+            if not self.path.is_absolute():
+                self.path = data_dir / self.path
+            if not self.path.parent.exists():
+                self.path = data_dir / DEFAULT_PATH_NAME
+
+            self._connection = sqlite3.connect(self.path.as_posix(), check_same_thread=False)
+            self._connection.row_factory = sqlite3.Row
+            with self._connection:
+                self._connection.execute('PRAGMA journal_mode=WAL')
+                self._connection.execute(_CREATE_TABLE_SQL)
+        return self._connection
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[dict]:
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                cursor = connection.execute(sql, params)
+                if cursor.description is None:
+                    return [{'lastrowid': cursor.lastrowid}]
+                return [dict(row) for row in cursor.fetchall()]
+
+    async def _execute_async(self, sql: str, params: tuple = ()) -> List[dict]:
+        return await asyncio.to_thread(self._execute, sql, params)
+
+    async def add_job(
+            self,
+            sender_id: int,
+            reply_to_message_id: Optional[int] = None,
+            message_text: str = '',
+            configurations: Optional[dict] = None) -> int:
+        """Record an accepted job and return its ID."""
+        now = time.time()
+        rows = await self._execute_async(
+            'INSERT INTO jobs (sender_id, reply_to_message_id, message_text, configurations, stage, created_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (sender_id, reply_to_message_id, message_text, json.dumps(configurations or {}), JOB_STAGE_ACCEPTED, now, now))
+        return rows[0]['lastrowid']
+
+    async def get_job(self, job_id: int) -> Optional[dict]:
+        """Return the job record or None if it does not exist."""
+        rows = await self._execute_async('SELECT * FROM jobs WHERE id = ?', (job_id,))
+        if not rows:
+            return None
+        job = rows[0]
+        job['configurations'] = json.loads(job.get('configurations') or '{}')
+        return job
+
+    async def get_unfinished_jobs(self) -> List[dict]:
+        """Return all jobs left from the previous run, oldest first."""
+        rows = await self._execute_async('SELECT id FROM jobs ORDER BY id')
+        jobs = [await self.get_job(row['id']) for row in rows]
+        return [job for job in jobs if job is not None]
+
+    async def mark_started(self, job_id: int) -> None:
+        """Count one more execution attempt of the job."""
+        await self._execute_async(
+            'UPDATE jobs SET attempts = attempts + 1, updated_at = ? WHERE id = ?', (time.time(), job_id))
+
+    async def set_info_message_id(self, job_id: int, info_message_id: int) -> None:
+        """Remember the progress message so a resumed job edits it instead of posting a new one."""
+        await self._execute_async(
+            'UPDATE jobs SET info_message_id = ?, updated_at = ? WHERE id = ?', (info_message_id, time.time(), job_id))
+
+    async def set_stage(self, job_id: int, stage: str, uploaded_segments: Optional[int] = None) -> None:
+        """Record the last completed stage and, for uploads, how many segments are already sent."""
+        if uploaded_segments is None:
+            await self._execute_async(
+                'UPDATE jobs SET stage = ?, updated_at = ? WHERE id = ?', (stage, time.time(), job_id))
+        else:
+            await self._execute_async(
+                'UPDATE jobs SET stage = ?, uploaded_segments = ?, updated_at = ? WHERE id = ?',
+                (stage, uploaded_segments, time.time(), job_id))
+
+    async def remove_job(self, job_id: int) -> None:
+        """Forget a finished or abandoned job."""
+        await self._execute_async('DELETE FROM jobs WHERE id = ?', (job_id,))
+        logger.debug(f'🗄 Job {job_id} removed from job store.')
+
+
+job_store = JobStore(path=config.JOB_STORE_FILENAME)
@@ -0,0 +1,202 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Union
+
+from ytb2audiobot import config
+from ytb2audiobot.logger import logger
+
+ERROR_UNAVAILABLE = 'unavailable'
+ERROR_NO_TITLE_OR_DURATION = 'no_title_or_duration'
+
+
+class MovieMetadata:
+    """Fields of yt-dlp info which the bot uses. Formats, thumbnails and caption URLs are not kept."""
+
+    __slots__ = (
+        'movie_id', 'title', 'uploader', 'duration', 'language', 'description', 'chapters',
+        'is_live', 'filesize_approx', 'has_format_filesize', 'audio_formats', 'error', 'created_at')
+
+    def __init__(
+            self,
+            movie_id: str,
+            title: str = '',
+            uploader: str = '',
+            duration: Optional[int] = None,
+            language: str = '',
+            description: str = '',
+            chapters: Optional[list] = None,
+            is_live: bool = False,
+            filesize_approx: Optional[int] = None,
+            has_format_filesize: bool = False,
+            audio_formats: Optional[list] = None,
+            error: str = '',
+            created_at: Optional[float] = None):
+        self.movie_id = movie_id
+        self.title = title or ''
+        self.uploader = uploader or ''
+        self.duration = duration
+        self.language = language or ''
+        self.description = description or ''
+        self.chapters = chapters or []
+        self.is_live = bool(is_live)
+        self.filesize_approx = filesize_approx
+        self.has_format_filesize = has_format_filesize
+        # Audio-only formats: [{'format_id', 'acodec', 'abr', 'ext'}]
+        self.audio_formats = audio_formats or []
+        self.error = error
+        self.created_at = created_at if created_at is not None else time.time()
+
+    @classmethod
+    def from_yt_info(cls, movie_id: str, yt_info: dict) -> 'MovieMetadata':
+        metadata = cls(
+            movie_id=movie_id,
+            title=yt_info.get('title', ''),
+            uploader=yt_info.get('uploader', ''),
+            duration=yt_info.get('duration'),
+            language=yt_info.get('language', ''),
+            description=yt_info.get('description', ''),
+            chapters=[
+                {'title': chapter.get('title', ''), 'start_time': chapter.get('start_time')}
+                for chapter in yt_info.get('chapters') or []],
+            is_live=yt_info.get('is_live', False),
+            filesize_approx=yt_info.get('filesize_approx'),
+            has_format_filesize=any(item.get('filesize') is not None for item in yt_info.get('formats') or []),
+            audio_formats=[
+                {key: item.get(key) for key in ('format_id', 'acodec', 'abr', 'ext')}
+                for item in yt_info.get('formats') or []
+                if item.get('vcodec') == 'none' and item.get('acodec') not in (None, 'none')])
+
+        if not metadata.title or not metadata.duration:
+            metadata.error = ERROR_NO_TITLE_OR_DURATION
+        return metadata
+
+    @property
+    def is_negative(self) -> bool:
+        """Result which may change soon: the movie is unavailable or live right now."""
+        return bool(self.error) or self.is_live
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class MetadataCache:
+    """LRU cache of movie metadata with TTL.
+
+    Repeated and near-simultaneous requests for a movie reuse one extraction. Negative results
+    (extraction failed, no title or duration, live stream) are cached too, but with a short TTL,
+    so a failing movie is not extracted again for every request, yet recovers soon.
+    The cache is optionally persisted into a JSON file and restored on startup.
+    """
+
+    def __init__(
+            self,
+            max_items: int = config.METADATA_CACHE_MAX_ITEMS,
+            ttl: float = config.METADATA_CACHE_TTL_SEC,
+            negative_ttl: float = config.METADATA_CACHE_NEGATIVE_TTL_SEC,
+            path: Union[Path, str, None] = config.METADATA_CACHE_FILENAME):
+        """
+        Initialize the cache.
+
+        Args:
+            max_items (int): Maximal number of records. 0 disables the cache.
+            ttl (float): Lifetime of a record in seconds.
+            negative_ttl (float): Lifetime of a negative record in seconds.
+            path (Union[Path, str, None]): JSON file to persist records. Empty to keep them in memory only.
+        """
+        self.max_items = max_items
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.path = Path(path) if path else None
+        self._records: OrderedDict[str, MovieMetadata] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def _is_expired(self, record: MovieMetadata, now: float) -> bool:
+        ttl = self.negative_ttl if record.is_negative else self.ttl
+        return record.created_at + ttl <= now
+
+    def get(self, movie_id: str) -> Optional[MovieMetadata]:
+        """Return a fresh record of the movie or None."""
+        record = self._records.get(movie_id)
+        if record is None:
+            self.misses += 1
+            return None
+
+        if self._is_expired(record, time.time()):
+            del self._records[movie_id]
+            self.misses += 1
+            return None
+
+        self._records.move_to_end(movie_id)
+        self.hits += 1
+        return record
+
+    def put(self, record: MovieMetadata) -> None:
+        if not self.max_items:
+            return
+        self._records[record.movie_id] = record
+        self._records.move_to_end(record.movie_id)
+        while len(self._records) > self.max_items:
+            self._records.popitem(last=False)
+
+    def put_error(self, movie_id: str, error: str = ERROR_UNAVAILABLE) -> MovieMetadata:
+        """Cache a failed extraction for `negative_ttl` seconds."""
+        record = MovieMetadata(movie_id=movie_id, error=error)
+        self.put(record)
+        return record
+
+    def restore(self) -> None:
+        """Load persisted records, skipping expired ones."""
+        if self.path is None or not self.path.exists():
+            return
+
+        try:
+            with self.path.open('r', encoding='utf-8') as file:
+                items = json.load(file)
+            now = time.time()
+            for item in items:
+                record = MovieMetadata(**item)
+                if not self._is_expired(record, now):
+                    self.put(record)
+        except Exception as e:
+            logger.error(f'❌📇 Unable to restore metadata cache {self.path}: {e}')
+            return
+
+        logger.info(f'📇 Metadata cache restored: {len(self._records)} records.')
+
+    def _write(self, items: list) -> None:
+        tmp_path = self.path.with_suffix('.tmp')
+        try:
+            with tmp_path.open('w', encoding='utf-8') as file:
+                json.dump(items, file)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f'❌📇 Unable to save metadata cache {self.path}: {e}')
+
+    def save(self) -> None:
+        if self.path is not None:
+            self._write([record.to_dict() for record in self._records.values()])
+
+    async def save_periodically(self, _params=None) -> None:
+        """Persist records. Signature fits `run_periodically`."""
+        if self.path is not None:
+            # Records are copied in the event loop, only the file is written in a thread
+            await asyncio.to_thread(self._write, [record.to_dict() for record in self._records.values()])
+
+    def stats(self) -> dict:
+        return {
+            'records': len(self._records),
+            'max_items': self.max_items,
+            'hits': self.hits,
+            'misses': self.misses}
+
+
+metadata_cache = MetadataCache()
@@ -0,0 +1,265 @@
+import mmap
+import pathlib
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, chain, repeat
+from typing import Dict, Optional, Tuple, Union
+
+from ytb2audiobot.logger import logger
+
+class Mp4ParseError(ValueError):
+    """Raised when the file is not a plain (non-fragmented) MP4 with an audio track."""
+
+
+def iter_boxes(buffer, start: int, end: int):
+    """
+    Iterate over sibling boxes in `buffer[start:end]`.
+
+    Yields:
+        Tuple[bytes, int, int, int]: Box type, box start, payload start and box end offsets.
+    """
+    position = start
+    while position + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', buffer, position)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', buffer, position + 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - position
+
+        if size < header_size or position + size > end:
+            raise Mp4ParseError(f'Broken box {box_type} at {position}')
+
+        yield box_type, position, position + header_size, position + size
+        position += size
+
+
+def find_box(buffer, start: int, end: int, box_type: bytes) -> Optional[Tuple[int, int, int]]:
+    """Return (box start, payload start, box end) of the first child box of the given type."""
+    for _type, box_start, payload_start, box_end in iter_boxes(buffer, start, end):
+        if _type == box_type:
+            return box_start, payload_start, box_end
+    return None
+
+
+def read_uint_array(buffer, position: int, count: int, typecode: str) -> array:
+    values = array(typecode)
+    values.frombytes(buffer[position:position + count * values.itemsize])
+    if sys.byteorder == 'little':
+        values.byteswap()
+    return values
+
+
+def find_audio_track(buffer, moov: Tuple[int, int, int]) -> Tuple[int, int, int]:
+    """Return the first `trak` box whose handler type is `soun`."""
+    for box_type, box_start, payload_start, box_end in iter_boxes(buffer, moov[1], moov[2]):
+        if box_type != b'trak':
+            continue
+        mdia = find_box(buffer, payload_start, box_end, b'mdia')
+        hdlr = mdia and find_box(buffer, mdia[1], mdia[2], b'hdlr')
+        if hdlr and buffer[hdlr[1] + 8:hdlr[1] + 12] == b'soun':
+            return box_start, payload_start, box_end
+    raise Mp4ParseError('No audio track')
+
+
+class Mp4AudioIndex:
+    """Sample table of the audio track of an MP4 / M4A file.
+
+    Keeps start time, size and file offset of every audio sample in flat arrays plus prefix sums of sizes,
+    so the number of bytes between two moments or the longest piece which fits into a byte budget
+    is answered by binary search without ffprobe and without assuming constant bitrate.
+    """
+
+    __slots__ = ('path', 'timescale', 'sample_times', 'sample_sizes', 'sample_offsets', 'size_prefix', 'boxes')
+
+    def __init__(self, path: Union[pathlib.Path, str]):
+        """
+        Parse the file. The file is memory-mapped only while parsing.
+
+        Args:
+            path (Union[pathlib.Path, str]): Path to the .m4a file.
+
+        Raises:
+            Mp4ParseError: If the file has no parsable audio sample table.
+        """
+        self.path = pathlib.Path(path)
+        # Box locations which are reused when the file is remuxed: name -> (box start, payload start, box end)
+        self.boxes: Dict[str, Tuple[int, int, int]] = {}
+
+        with self.path.open('rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            self._parse(buffer)
+
+    def _parse(self, buffer):
+        moov = find_box(buffer, 0, len(buffer), b'moov')
+        if moov is None:
+            raise Mp4ParseError('No moov box')
+        if find_box(buffer, moov[1], moov[2], b'mvex') is not None:
+            raise Mp4ParseError('Fragmented MP4 is not supported')
+
+        trak = find_audio_track(buffer, moov)
+        mdia = find_box(buffer, trak[1], trak[2], b'mdia')
+        mdhd = find_box(buffer, mdia[1], mdia[2], b'mdhd')
+        minf = find_box(buffer, mdia[1], mdia[2], b'minf')
+        stbl = minf and find_box(buffer, minf[1], minf[2], b'stbl')
+        if not (mdhd and stbl):
+            raise Mp4ParseError('No mdhd or stbl box')
+
+        self.boxes.update({'moov': moov, 'trak': trak, 'mdia': mdia, 'mdhd': mdhd, 'minf': minf, 'stbl': stbl})
+
+        version = buffer[mdhd[1]]
+        self.timescale = struct.unpack_from('>I', buffer, mdhd[1] + (20 if version == 1 else 12))[0]
+        if not self.timescale:
+            raise Mp4ParseError('Zero timescale')
+
+        tables = {}
+        for box_type, box_start, payload_start, box_end in iter_boxes(buffer, stbl[1], stbl[2]):
+            tables[box_type] = (box_start, payload_start, box_end)
+            self.boxes[box_type.decode('latin-1')] = (box_start, payload_start, box_end)
+
+        if b'stts' not in tables or b'stsz' not in tables or b'stsc' not in tables:
+            raise Mp4ParseError('Incomplete sample table')
+
+        # stts: runs of (sample count, sample delta)
+        position = tables[b'stts'][1]
+        entry_count = struct.unpack_from('>I', buffer, position + 4)[0]
+        stts = read_uint_array(buffer, position + 8, 2 * entry_count, 'I')
+        deltas = chain.from_iterable(repeat(stts[i + 1], stts[i]) for i in range(0, len(stts), 2))
+        self.sample_times = array('q', accumulate(deltas, initial=0))
+
+        # stsz: either one size for all samples or a size per sample
+        position = tables[b'stsz'][1]
+        sample_size, sample_count = struct.unpack_from('>II', buffer, position + 4)
+        if sample_size:
+            self.sample_sizes = array('I', repeat(sample_size, sample_count))
+        else:
+            self.sample_sizes = read_uint_array(buffer, position + 12, sample_count, 'I')
+
+        if len(self.sample_times) - 1 != sample_count:
+            raise Mp4ParseError('stts and stsz sample counts differ')
+
+        self.size_prefix = array('q', accumulate(self.sample_sizes, initial=0))
+
+        # stco / co64: chunk offsets
+        if b'stco' in tables:
+            position = tables[b'stco'][1]
+            chunk_count = struct.unpack_from('>I', buffer, position + 4)[0]
+            chunk_offsets = read_uint_array(buffer, position + 8, chunk_count, 'I')
+        elif b'co64' in tables:
+            position = tables[b'co64'][1]
+            chunk_count = struct.unpack_from('>I', buffer, position + 4)[0]
+            chunk_offsets = read_uint_array(buffer, position + 8, chunk_count, 'Q')
+        else:
+            raise Mp4ParseError('No chunk offsets')
+
+        # stsc: runs of (first chunk, samples per chunk, sample description index)
+        position = tables[b'stsc'][1]
+        entry_count = struct.unpack_from('>I', buffer, position + 4)[0]
+        stsc = read_uint_array(buffer, position + 8, 3 * entry_count, 'I')
+
+        self.sample_offsets = array('q')
+        sample_index = 0
+        for entry in range(entry_count):
+            first_chunk = stsc[3 * entry]
+            samples_per_chunk = stsc[3 * entry + 1]
+            last_chunk = stsc[3 * (entry + 1)] - 1 if entry + 1 < entry_count else len(chunk_offsets)
+            for chunk in range(first_chunk - 1, last_chunk):
+                offset = chunk_offsets[chunk]
+                for _ in range(samples_per_chunk):
+                    if sample_index >= sample_count:
+                        break
+                    self.sample_offsets.append(offset)
+                    offset += self.sample_sizes[sample_index]
+                    sample_index += 1
+
+        if sample_index != sample_count:
+            raise Mp4ParseError('stsc and stsz sample counts differ')
+
+    @classmethod
+    def from_file(cls, path: Union[pathlib.Path, str]) -> Optional['Mp4AudioIndex']:
+        """Build the index or return None if the file cannot be parsed."""
+        try:
+            return cls(path)
+        except (OSError, ValueError, struct.error) as e:
+            logger.debug(f'🎞 Unable to build MP4 sample index for {path}: {e}')
+            return None
+
+    @property
+    def sample_count(self) -> int:
+        return len(self.sample_sizes)
+
+    @property
+    def duration(self) -> float:
+        """Duration of the audio track in seconds."""
+        return self.sample_times[-1] / self.timescale
+
+    @property
+    def total_bytes(self) -> int:
+        """Size of all audio samples in bytes, without container overhead."""
+        return self.size_prefix[-1]
+
+    def sample_at(self, seconds: float) -> int:
+        """Index of the sample which plays at the given moment."""
+        index = bisect_right(self.sample_times, int(seconds * self.timescale)) - 1
+        return min(max(index, 0), self.sample_count)
+
+    def bytes_between(self, start: float, end: float) -> int:
+        """
+        Number of audio sample bytes needed to play from `start` to `end`.
+
+        Args:
+            start (float): Start time in seconds.
+            end (float): End time in seconds.
+
+        Returns:
+            int: Bytes of samples overlapping [start, end).
+        """
+        first = self.sample_at(start)
+        last = bisect_left(self.sample_times, int(end * self.timescale), lo=first)
+        last = min(max(last, first), self.sample_count)
+        return self.size_prefix[last] - self.size_prefix[first]
+
+    def end_for_bytes(self, start: float, max_bytes: int) -> float:
+        """
+        The latest moment such that the piece from `start` fits into `max_bytes`.
+
+        Args:
+            start (float): Start time in seconds.
+            max_bytes (int): Byte budget for samples.
+
+        Returns:
+            float: End time in seconds, at most the track duration.
+        """
+        first = self.sample_at(start)
+        last = bisect_right(self.size_prefix, self.size_prefix[first] + max_bytes) - 1
+        return self.sample_times[min(last, self.sample_count)] / self.timescale
+
+    def max_duration_within_bytes(self, max_bytes: int, step_sec: float = 1.0) -> float:
+        """
+        Longest duration such that any piece of this length fits into `max_bytes`.
+
+        The densest part of a VBR file decides, so segments cut by this duration never exceed the budget.
+
+        Args:
+            max_bytes (int): Byte budget for samples.
+            step_sec (float): Distance between probed start moments.
+
+        Returns:
+            float: Duration in seconds. The whole track duration if the whole track fits.
+        """
+        duration = self.duration
+        if self.total_bytes <= max_bytes:
+            return duration
+
+        shortest = duration
+        start = 0.0
+        while start < duration:
+            end = self.end_for_bytes(start, max_bytes)
+            if end >= duration:
+                break
+            shortest = min(shortest, end - start)
+            start += step_sec
+
+        return max(shortest - step_sec, 0.0)
@@ -0,0 +1,259 @@
+import mmap
+import os
+import pathlib
+import struct
+import sys
+from bisect import bisect_left
+from typing import List, Optional, Tuple
+
+from ytb2audiobot.logger import logger
+from ytb2audiobot.mp4_index import Mp4AudioIndex, Mp4ParseError, find_box, iter_boxes, read_uint_array
+
+# Sample table boxes which are rebuilt for every segment. Anything else in stbl is copied as is
+# except the boxes below, which describe sample ranges and are dropped (roll groups, sync samples).
+REBUILT_STBL_BOX_TYPES = {b'stts', b'stsz', b'stz2', b'stsc', b'stco', b'co64'}
+DROPPED_STBL_BOX_TYPES = {b'stss', b'sgpd', b'sbgp', b'sdtp', b'stps'}
+
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def make_box(box_type: bytes, payload: bytes) -> bytes:
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def make_full_box(box_type: bytes, version: int, flags: int, payload: bytes) -> bytes:
+    return make_box(box_type, struct.pack('>I', (version << 24) | flags) + payload)
+
+
+def patch_duration(box: bytes, duration_offset_v0: int, duration_offset_v1: int, duration: int) -> bytes:
+    """Return a copy of mvhd / tkhd / mdhd with the duration field replaced. Offsets are from the box start."""
+    box = bytearray(box)
+    if box[8] == 1:
+        struct.pack_into('>Q', box, duration_offset_v1, duration)
+    else:
+        struct.pack_into('>I', box, duration_offset_v0, min(duration, 0xFFFFFFFF))
+    return bytes(box)
+
+
+def copy_file_range_all(src_fd: int, dst_fd: int, offset: int, count: int) -> None:
+    """Copy `count` bytes from `src_fd` at `offset` to the current position of `dst_fd` inside the kernel if possible."""
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while count > 0:
+                copied = os.copy_file_range(src_fd, dst_fd, count, offset)
+                if copied == 0:
+                    raise OSError('Unexpected end of file')
+                offset += copied
+                count -= copied
+            return
+        except OSError as e:
+            # E.g. EXDEV on old kernels or unsupported file systems
+            logger.debug(f'🎞 copy_file_range failed, fallback to sendfile: {e}')
+
+    if hasattr(os, 'sendfile'):
+        while count > 0:
+            copied = os.sendfile(dst_fd, src_fd, offset, min(count, COPY_CHUNK_SIZE))
+            if copied == 0:
+                raise OSError('Unexpected end of file')
+            offset += copied
+            count -= copied
+        return
+
+    while count > 0:
+        data = os.pread(src_fd, min(count, COPY_CHUNK_SIZE), offset)
+        if not data:
+            raise OSError('Unexpected end of file')
+        os.write(dst_fd, data)
+        offset += len(data)
+        count -= len(data)
+
+
+class Mp4AudioSplitter:
+    """Cuts an AAC-in-MP4 file into pieces without re-encoding and without ffmpeg.
+
+    For every piece a fresh `moov` is written with a sample table covering only its samples,
+    followed by `mdat` with the contiguous byte range of these samples copied from the source file.
+    """
+
+    def __init__(self, path: pathlib.Path, index: Optional[Mp4AudioIndex] = None):
+        """
+        Args:
+            path (pathlib.Path): Source .m4a file.
+            index (Optional[Mp4AudioIndex]): Already built sample index of the file.
+
+        Raises:
+            Mp4ParseError: If the file layout is not supported.
+        """
+        self.path = pathlib.Path(path)
+        self.index = index if index is not None else Mp4AudioIndex(self.path)
+
+        with self.path.open('rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            self._read_boxes(buffer)
+
+    def _read_boxes(self, buffer):
+        boxes = self.index.boxes
+
+        ftyp = find_box(buffer, 0, len(buffer), b'ftyp')
+        self.ftyp = bytes(buffer[ftyp[0]:ftyp[2]]) if ftyp else make_box(b'ftyp', b'M4A \x00\x00\x02\x00isomiso2')
+
+        moov, trak, mdia, minf, stbl = (boxes[name] for name in ('moov', 'trak', 'mdia', 'minf', 'stbl'))
+
+        if b'ctts' in {box_type for box_type, *_ in iter_boxes(buffer, stbl[1], stbl[2])}:
+            raise Mp4ParseError('Composition offsets are not supported')
+
+        stsc = boxes['stsc']
+        entry_count = struct.unpack_from('>I', buffer, stsc[1] + 4)[0]
+        stsc_entries = read_uint_array(buffer, stsc[1] + 8, 3 * entry_count, 'I')
+        if any(stsc_entries[i] != 1 for i in range(2, len(stsc_entries), 3)):
+            raise Mp4ParseError('Several sample descriptions are not supported')
+
+        mvhd = find_box(buffer, moov[1], moov[2], b'mvhd')
+        tkhd = find_box(buffer, trak[1], trak[2], b'tkhd')
+        if not (mvhd and tkhd):
+            raise Mp4ParseError('No mvhd or tkhd box')
+
+        self.mvhd = bytes(buffer[mvhd[0]:mvhd[2]])
+        self.movie_timescale = struct.unpack_from('>I', self.mvhd, 28 if self.mvhd[8] == 1 else 20)[0] or 1
+
+        # moov children except traks: mvhd is patched, other tracks are dropped, udta and the rest are copied
+        self.moov_tail = b''.join(
+            bytes(buffer[box_start:box_end])
+            for box_type, box_start, _payload_start, box_end in iter_boxes(buffer, moov[1], moov[2])
+            if box_type not in (b'mvhd', b'trak', b'mvex'))
+
+        # trak children except tkhd, edts and mdia
+        self.tkhd = bytes(buffer[tkhd[0]:tkhd[2]])
+        self.trak_tail = b''.join(
+            bytes(buffer[box_start:box_end])
+            for box_type, box_start, _payload_start, box_end in iter_boxes(buffer, trak[1], trak[2])
+            if box_type not in (b'tkhd', b'edts', b'mdia'))
+
+        # mdia children: mdhd is patched, minf is rebuilt, hdlr and others are copied
+        self.mdhd = bytes(buffer[boxes['mdhd'][0]:boxes['mdhd'][2]])
+        self.mdia_tail = b''.join(
+            bytes(buffer[box_start:box_end])
+            for box_type, box_start, _payload_start, box_end in iter_boxes(buffer, mdia[1], mdia[2])
+            if box_type not in (b'mdhd', b'minf'))
+
+        # minf children: smhd, dinf, ... are copied, stbl is rebuilt
+        self.minf_head = b''.join(
+            bytes(buffer[box_start:box_end])
+            for box_type, box_start, _payload_start, box_end in iter_boxes(buffer, minf[1], minf[2])
+            if box_type != b'stbl')
+
+        # stbl children which do not depend on sample ranges, stsd first
+        self.stbl_head = b''.join(
+            bytes(buffer[box_start:box_end])
+            for box_type, box_start, _payload_start, box_end in iter_boxes(buffer, stbl[1], stbl[2])
+            if box_type not in REBUILT_STBL_BOX_TYPES | DROPPED_STBL_BOX_TYPES)
+
+    def sample_range(self, start: float, end: float) -> Tuple[int, int]:
+        """Return [first, last) sample indexes which cover the time range."""
+        index = self.index
+        first = index.sample_at(start)
+        last = bisect_left(index.sample_times, int(end * index.timescale), lo=first)
+        return first, min(max(last, first + 1), index.sample_count)
+
+    def _make_moov(self, first: int, last: int, chunk_offset: int) -> bytes:
+        index = self.index
+        media_duration = index.sample_times[last] - index.sample_times[first]
+        movie_duration = media_duration * self.movie_timescale // index.timescale
+
+        # stts: run-length encoded sample deltas
+        stts_entries = []
+        for sample in range(first, last):
+            delta = index.sample_times[sample + 1] - index.sample_times[sample]
+            if stts_entries and stts_entries[-1][1] == delta:
+                stts_entries[-1][0] += 1
+            else:
+                stts_entries.append([1, delta])
+        stts = make_full_box(b'stts', 0, 0, struct.pack('>I', len(stts_entries)) + b''.join(
+            struct.pack('>II', count, delta) for count, delta in stts_entries))
+
+        sizes = index.sample_sizes[first:last]
+        if sys.byteorder == 'little':
+            sizes.byteswap()
+        stsz = make_full_box(b'stsz', 0, 0, struct.pack('>II', 0, last - first) + sizes.tobytes())
+
+        # All samples are one chunk
+        stsc = make_full_box(b'stsc', 0, 0, struct.pack('>IIII', 1, 1, last - first, 1))
+        if chunk_offset > 0xFFFFFFFF:
+            stco = make_full_box(b'co64', 0, 0, struct.pack('>IQ', 1, chunk_offset))
+        else:
+            stco = make_full_box(b'stco', 0, 0, struct.pack('>II', 1, chunk_offset))
+
+        stbl = make_box(b'stbl', self.stbl_head + stts + stsc + stsz + stco)
+        minf = make_box(b'minf', self.minf_head + stbl)
+        mdhd = patch_duration(self.mdhd, 24, 32, media_duration)
+        mdia = make_box(b'mdia', mdhd + self.mdia_tail + minf)
+        tkhd = patch_duration(self.tkhd, 28, 36, movie_duration)
+        trak = make_box(b'trak', tkhd + self.trak_tail + mdia)
+        mvhd = patch_duration(self.mvhd, 24, 32, movie_duration)
+
+        return make_box(b'moov', mvhd + trak + self.moov_tail)
+
+    def write_segment(self, start: float, end: float, output_path: pathlib.Path) -> pathlib.Path:
+        """
+        Write the piece [start, end) of the source into `output_path`.
+
+        The file is written next to the target and renamed when complete, so a present file is always whole.
+
+        Raises:
+            Mp4ParseError: If samples of the range are not stored contiguously.
+        """
+        index = self.index
+        first, last = self.sample_range(start, end)
+
+        data_offset = index.sample_offsets[first]
+        data_size = index.size_prefix[last] - index.size_prefix[first]
+        if index.sample_offsets[last - 1] + index.sample_sizes[last - 1] - data_offset != data_size:
+            raise Mp4ParseError('Samples are interleaved with other data')
+
+        large_mdat = data_size + 8 > 0xFFFFFFFF
+        mdat_header_size = 16 if large_mdat else 8
+
+        # Size of moov does not depend on the chunk offset value except stco / co64, so build it twice
+        moov_size = len(self._make_moov(first, last, 0))
+        chunk_offset = len(self.ftyp) + moov_size + mdat_header_size
+        moov = self._make_moov(first, last, chunk_offset)
+        if len(moov) != moov_size:
+            chunk_offset = len(self.ftyp) + len(moov) + mdat_header_size
+            moov = self._make_moov(first, last, chunk_offset)
+
+        if large_mdat:
+            mdat_header = struct.pack('>I4sQ', 1, b'mdat', data_size + 16)
+        else:
+            mdat_header = struct.pack('>I4s', data_size + 8, b'mdat')
+
+        output_path = pathlib.Path(output_path)
+        part_path = output_path.with_name(output_path.name + '.part')
+        with self.path.open('rb') as source, part_path.open('wb') as target:
+            target.write(self.ftyp + moov + mdat_header)
+            target.flush()
+            copy_file_range_all(source.fileno(), target.fileno(), data_offset, data_size)
+        os.replace(part_path, output_path)
+
+        return output_path
+
+
+def split_m4a_natively(audio_path: pathlib.Path, segments: List[dict], index: Optional[Mp4AudioIndex] = None) -> bool:
+    """
+    Write every segment to its 'path' by copying sample ranges of `audio_path`.
+
+    Args:
+        audio_path (pathlib.Path): Source .m4a file.
+        segments (List[dict]): Segments with 'start', 'end' and target 'path'.
+        index (Optional[Mp4AudioIndex]): Already built sample index of the file.
+
+    Returns:
+        bool: True if all segments were written. False if the file is not supported and ffmpeg should be used.
+    """
+    try:
+        splitter = Mp4AudioSplitter(audio_path, index)
+        for segment in segments:
+            splitter.write_segment(segment['start'], segment['end'], segment['path'])
+    except (OSError, ValueError, KeyError, struct.error) as e:
+        logger.info(f'🎞 Native MP4 split is not possible for {audio_path}: {e}')
+        return False
+
+    return True
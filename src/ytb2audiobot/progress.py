@@ -0,0 +1,117 @@
+import asyncio
+import time
+from typing import Optional
+
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter
+from aiogram.types import Message
+
+from ytb2audiobot import config
+from ytb2audiobot.logger import logger
+
+
+class ProgressReporter:
+    """Progress message of one job, edited in the background.
+
+    Stages call `update` / `update_percent` which only remember the new state and return at once.
+    A background task edits the message not more often than once per `min_interval`, always with
+    the latest state, so rapid updates are coalesced and edits with unchanged text are skipped.
+    The task finishes when the message shows the latest state and is started again by the next update.
+    """
+
+    def __init__(self, message: Message, min_interval: float = config.PROGRESS_EDIT_MIN_INTERVAL_SEC):
+        """
+        Initialize the reporter.
+
+        Args:
+            message (Message): Message which was just sent or edited, so it is not edited again before `min_interval`.
+            min_interval (float): Minimal number of seconds between two edits.
+        """
+        self.message = message
+        self.min_interval = min_interval
+
+        self.stage_text = message.text or ''
+        self.percent: Optional[int] = None
+
+        self._shown_text = self.stage_text
+        self._last_edit_at = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+
+        self.total_edits = 0
+        self.total_updates = 0
+
+    @property
+    def text(self) -> str:
+        if self.percent is None:
+            return self.stage_text
+        return f'{self.stage_text} {self.percent}%'
+
+    def update(self, text: str) -> None:
+        """Show a new stage. The percent of the previous stage is dropped."""
+        self.stage_text = text
+        self.percent = None
+        self._schedule()
+
+    def update_percent(self, percent: float) -> None:
+        """Show progress of the current stage. Fits `on_progress` of `download_audio_from_download`."""
+        percent = min(max(int(percent), 0), 100)
+        if percent == self.percent:
+            return
+        self.percent = percent
+        self._schedule()
+
+    def _schedule(self) -> None:
+        if self._closed:
+            return
+        self.total_updates += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush())
+
+    async def _flush(self) -> None:
+        while not self._closed:
+            text = self.text
+            if text == self._shown_text:
+                return
+
+            delay = self._last_edit_at + self.min_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            await self._edit(text)
+
+    async def _edit(self, text: str) -> None:
+        self._last_edit_at = time.monotonic()
+        try:
+            result = await self.message.edit_text(text)
+            if isinstance(result, Message):
+                self.message = result
+            self.total_edits += 1
+        except TelegramRetryAfter as e:
+            # Next attempt is made with the state actual by then
+            self._last_edit_at = time.monotonic() + e.retry_after
+            return
+        except (TelegramBadRequest, TelegramNetworkError) as e:
+            # E.g. the message was deleted or is not modified. Progress is not worth retrying.
+            logger.debug(f'⏳ Unable to edit progress message: {e}')
+        self._shown_text = text
+
+    async def _stop(self) -> None:
+        self._closed = True
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def finish(self, text: str) -> None:
+        """Stop background edits and show the final text, e.g. an error, right away."""
+        await self._stop()
+        if text != self._shown_text:
+            await self._edit(text)
+
+    async def delete(self) -> None:
+        """Stop background edits and delete the message."""
+        await self._stop()
+        try:
+            await self.message.delete()
+        except (TelegramBadRequest, TelegramNetworkError) as e:
+            logger.debug(f'⏳ Unable to delete progress message: {e}')
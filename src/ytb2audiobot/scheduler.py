@@ -0,0 +1,201 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Union
+
+from ytb2audiobot import config
+from ytb2audiobot.logger import logger
+
+STAGE_CPU = 'cpu'
+STAGE_NETWORK = 'network'
+
+WAIT_TIMES_HISTORY_SIZE = 200
+
+
+class JobScheduler:
+    """Runs jobs with a global concurrency cap and round-robin fairness across senders.
+
+    Every sender has its own FIFO queue. When a worker slot frees up, the next job is taken from
+    the sender that has waited longest for its turn, so one chat flooding links cannot monopolize workers.
+    Heavy stages inside a job are additionally bounded by per-stage semaphores (see `stage`).
+    """
+
+    def __init__(
+            self,
+            max_concurrent_jobs: int = config.SCHEDULER_MAX_CONCURRENT_JOBS,
+            max_cpu_stages: int = config.SCHEDULER_MAX_CPU_STAGES,
+            max_network_stages: int = config.SCHEDULER_MAX_NETWORK_STAGES):
+        """
+        Initialize the scheduler.
+
+        Args:
+            max_concurrent_jobs (int): Maximum number of jobs running at the same time.
+            max_cpu_stages (int): Maximum number of CPU-heavy stages (transcode, split) at the same time.
+            max_network_stages (int): Maximum number of network stages (download, upload) at the same time.
+        """
+        self.max_concurrent_jobs = max(1, max_concurrent_jobs)
+        self.stage_limits = {
+            STAGE_CPU: max(1, max_cpu_stages),
+            STAGE_NETWORK: max(1, max_network_stages)}
+
+        self._stage_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._stage_active = {name: 0 for name in self.stage_limits}
+        self._stage_waiting = {name: 0 for name in self.stage_limits}
+
+        # sender_id -> deque of (future, func, kwargs, enqueued_at). Order of keys is the round-robin order.
+        self._pending: OrderedDict = OrderedDict()
+        self._running_tasks = set()
+
+        self._wait_times = deque(maxlen=WAIT_TIMES_HISTORY_SIZE)
+        self.total_submitted = 0
+        self.total_finished = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of accepted jobs which are still waiting for a worker slot."""
+        return sum(len(queue) for queue in self._pending.values())
+
+    @property
+    def running(self) -> int:
+        """Number of jobs being executed right now."""
+        return len(self._running_tasks)
+
+    def submit(self, sender_id: Union[int, str], func: Callable[..., Awaitable[Any]], **kwargs) -> asyncio.Future:
+        """
+        Enqueue a job for the sender without waiting for it.
+
+        Args:
+            sender_id (Union[int, str]): Chat or user ID the job belongs to. Used for fairness.
+            func (Callable[..., Awaitable[Any]]): Coroutine function to run, e.g. `job_downloading`.
+            **kwargs: Keyword arguments passed to `func`.
+
+        Returns:
+            asyncio.Future: Future resolved with the result of `func`.
+        """
+        future = asyncio.get_running_loop().create_future()
+
+        self._pending.setdefault(sender_id, deque()).append((future, func, kwargs, time.monotonic()))
+        self.total_submitted += 1
+        logger.debug(f'🚦 Job queued for sender {sender_id}. Queue depth: {self.queue_depth}, running: {self.running}')
+
+        self._dispatch()
+
+        return future
+
+    async def run(self, sender_id: Union[int, str], func: Callable[..., Awaitable[Any]], **kwargs) -> Any:
+        """Enqueue a job for the sender and wait until it is finished. See `submit`."""
+        return await self.submit(sender_id, func, **kwargs)
+
+    def _dispatch(self):
+        """Start pending jobs while there are free worker slots, taking senders in round-robin order."""
+        while self._pending and self.running < self.max_concurrent_jobs:
+            sender_id, queue = next(iter(self._pending.items()))
+            future, func, kwargs, enqueued_at = queue.popleft()
+
+            if queue:
+                self._pending.move_to_end(sender_id)
+            else:
+                del self._pending[sender_id]
+
+            if future.cancelled():
+                continue
+
+            self._wait_times.append(time.monotonic() - enqueued_at)
+
+            task = asyncio.create_task(func(**kwargs))
+            self._running_tasks.add(task)
+            task.add_done_callback(lambda _task, _future=future: self._on_job_done(_task, _future))
+
+    def _on_job_done(self, task: asyncio.Task, future: asyncio.Future):
+        self._running_tasks.discard(task)
+        self.total_finished += 1
+
+        if not future.done():
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+
+        self._dispatch()
+
+    async def drain(self, timeout: float) -> None:
+        """
+        Stop starting new jobs and wait for running ones to finish.
+
+        Jobs still queued are cancelled. Jobs still running after `timeout` are cancelled too.
+        Both stay in the job store and are resumed on the next start.
+
+        Args:
+            timeout (float): Seconds to wait for running jobs.
+        """
+        self.max_concurrent_jobs = 0
+
+        for queue in self._pending.values():
+            for future, _func, _kwargs, _enqueued_at in queue:
+                future.cancel()
+        self._pending.clear()
+
+        if not self._running_tasks:
+            return
+
+        logger.info(f'🚦 Draining {self.running} running jobs. Timeout: {timeout} sec.')
+        _done, not_done = await asyncio.wait(set(self._running_tasks), timeout=timeout)
+
+        if not_done:
+            logger.info(f'🚦 {len(not_done)} jobs are still running after drain timeout. Cancelling them.')
+            for task in not_done:
+                task.cancel()
+            await asyncio.gather(*not_done, return_exceptions=True)
+
+    @asynccontextmanager
+    async def stage(self, name: str):
+        """
+        Async context manager that bounds concurrency of a heavy stage inside a job.
+
+        Args:
+            name (str): Stage name: `STAGE_CPU` or `STAGE_NETWORK`.
+        """
+        if name not in self._stage_semaphores:
+            self._stage_semaphores[name] = asyncio.Semaphore(self.stage_limits.get(name, 1))
+
+        self._stage_waiting[name] = self._stage_waiting.get(name, 0) + 1
+        try:
+            await self._stage_semaphores[name].acquire()
+        finally:
+            self._stage_waiting[name] -= 1
+
+        self._stage_active[name] = self._stage_active.get(name, 0) + 1
+        try:
+            yield
+        finally:
+            self._stage_active[name] -= 1
+            self._stage_semaphores[name].release()
+
+    def stats(self) -> dict:
+        """Return a snapshot of queue depth, wait times and stage usage to help with sizing hosts."""
+        wait_times = list(self._wait_times)
+        return {
+            'queue_depth': self.queue_depth,
+            'senders_waiting': len(self._pending),
+            'running': self.running,
+            'max_concurrent_jobs': self.max_concurrent_jobs,
+            'total_submitted': self.total_submitted,
+            'total_finished': self.total_finished,
+            'wait_avg_sec': round(sum(wait_times) / len(wait_times), 2) if wait_times else 0.0,
+            'wait_max_sec': round(max(wait_times), 2) if wait_times else 0.0,
+            'stages': {
+                name: {
+                    'active': self._stage_active.get(name, 0),
+                    'waiting': self._stage_waiting.get(name, 0),
+                    'limit': limit}
+                for name, limit in self.stage_limits.items()}}
+
+    async def log_stats(self, _params=None) -> None:
+        """Log scheduler stats. Signature fits `run_periodically`."""
+        logger.info(f'🚦 Scheduler stats: {self.stats()}')
+
+
+job_scheduler = JobScheduler()
@@ -1,8 +1,9 @@
 import os
 import sys
+from typing import Callable, Optional, Tuple, Union
 
 from ytb2audiobot import config
-from ytb2audiobot.download import filter_timecodes_within_bounds, get_timecodes_formatted_text
+from ytb2audiobot.timecode_index import TimecodeIndex
 DEBUG = False if os.getenv(config.ENV_NAME_DEBUG_MODE, 'false').lower() != 'true' else True
 
 
@@ -55,24 +56,28 @@ def get_segments_by_timecodes(timecodes: list, total_duration: int) -> list:
     return segments
 
 
-def get_segments_by_timecodes_from_dict(timecodes: dict, total_duration: int) -> list:
+def get_segments_by_timecodes_from_dict(timecodes: Union[dict, TimecodeIndex], total_duration: int) -> list:
+    if not isinstance(timecodes, TimecodeIndex):
+        timecodes = TimecodeIndex(timecodes)
+
     # If no timecodes provided, return a single segment covering the entire duration
     if not timecodes:
         return [{'start': 0, 'end': total_duration, 'title': ''}]
 
     # Ensure the list starts with a timecode at 0 seconds
-    if  0 not in timecodes:
-        timecodes[0] = {'title': 'START_TIME', 'type': 'timecodes'}
-
-    sorted_keys = sorted(timecodes.keys())
+    times = list(timecodes.times)
+    titles = list(timecodes.titles)
+    if times[0] != 0:
+        times.insert(0, 0)
+        titles.insert(0, 'START_TIME')
 
     segments = []
 
-    for idx, key in enumerate(sorted_keys):
+    for idx, time in enumerate(times):
         segments.append({
-            'start': key,
-            'end': sorted_keys[idx + 1] if idx < len(timecodes) - 1 else total_duration,
-            'title': timecodes[key].get('title', '')})
+            'start': time,
+            'end': times[idx + 1] if idx < len(times) - 1 else total_duration,
+            'title': titles[idx]})
 
     return segments
 
@@ -117,127 +122,130 @@ def add_paddings_to_segments(input_segments: list, padding_duration: int) -> lis
     return segments
 
 
-def make_magic_tail(segments: list, max_segment_duration: int) -> list:
-    """Merges the last two segments if their duration ratio meets a certain threshold."""
-
-    if len(segments) <= 1:
-        return segments
+# Segment may be longer than SEGMENT_AUDIO_DURATION_SEC by this factor to avoid a short tail part,
+# the golden ratio which was used to merge a short last part into the previous one.
+SEGMENT_DURATION_STRETCH_RATIO = 1.618
 
-    last_duration = segments[-1]['end'] - segments[-1]['start']
-    second_last_duration = segments[-2]['end'] - segments[-2]['start']
-    duration_ratio = second_last_duration / last_duration
-
-    _GOLDEN_RATIO = 1.618
-    if duration_ratio > _GOLDEN_RATIO and (second_last_duration + last_duration) < max_segment_duration:
-        segments[-2]['end'] = segments[-1]['end']
-        segments.pop()  # Remove the last segment after merging
-
-
-    return segments
+# Step of the filler cut points between timecodes
+PLAN_CUT_GRID_STEP_SEC = 30
 
 
-def rebalance_segments_long_timecodes(
-        segments: list,
+def _plan_cheapest(
+        cuts: list,
+        aligned: set,
+        fits: Callable[[int, int], bool],
+        max_duration: int,
+        caption_size: Optional[Callable[[int, int], int]],
+        available_caption_size: int) -> Optional[list]:
+    """
+    Dynamic programming over cut points. Cost of a plan is compared as a tuple:
+    (number of segments, number of cuts not on a timecode, sum of squared segment durations).
+    The last term makes segments of a plan as even as possible.
+    """
+    infinity = (sys.maxsize, sys.maxsize, sys.maxsize)
+    best = [infinity] * len(cuts)
+    previous = [-1] * len(cuts)
+    best[0] = (0, 0, 0)
+
+    for j in range(1, len(cuts)):
+        end = cuts[j]
+        misaligned = 0 if j == len(cuts) - 1 or end in aligned else 1
+        # Constraints are monotone: a segment which does not fit will not fit if it starts earlier
+        for i in range(j - 1, -1, -1):
+            start = cuts[i]
+            if end - start > max_duration or not fits(start, end):
+                break
+            if caption_size is not None and caption_size(start, end) > available_caption_size:
+                break
+            if best[i] == infinity:
+                continue
+
+            cost = (best[i][0] + 1, best[i][1] + misaligned, best[i][2] + (end - start) ** 2)
+            if cost < best[j]:
+                best[j] = cost
+                previous[j] = i
+
+    if best[-1] == infinity:
+        return None
+
+    bounds = []
+    j = len(cuts) - 1
+    while j > 0:
+        bounds.append((cuts[previous[j]], cuts[j]))
+        j = previous[j]
+
+    return list(reversed(bounds))
+
+
+def plan_segments(
+        total_duration: int,
+        timecodes: Union[dict, TimecodeIndex],
+        max_segment_duration: int,
         available_caption_size: int,
-        timecodes_dict: dict,
-        max_audio_len_sec: int = sys.maxsize,
-) -> list:
+        fits: Optional[Callable[[int, int], bool]] = None,
+        padding: int = config.SEGMENT_DURATION_PADDING_SEC) -> list:
     """
-    Rebalance segments based on timecodes and available caption size.
+    Plans audio parts in one pass instead of the chain of paddings, magic tail, verification and rebalance.
+
+    Cut points are timecodes / chapters plus a regular grid. Every part with its paddings must fit the file
+    size limit and, if SEGMENT_REBALANCE_TO_FIT_TIMECODES is on, its timecodes must fit the caption.
+    Among valid plans the one with the fewest parts wins, then the one with most cuts on timecodes,
+    then the most even one.
+
+    Args:
+        total_duration (int): Duration of the audio in seconds.
+        timecodes (Union[dict, TimecodeIndex]): Timecodes and chapters by time in seconds.
+        max_segment_duration (int): Longest part in seconds which is guaranteed to fit the file size limit.
+        available_caption_size (int): Caption characters left for timecodes.
+        fits (Optional[Callable[[int, int], bool]]): Exact size check of a padded part, e.g. from the MP4 index.
+        padding (int): Overlap of neighbour parts in seconds.
+
+    Returns:
+        list: Segments with 'start', 'end' and 'title', paddings included.
     """
+    total_duration = int(total_duration)
+    if total_duration <= 0:
+        return []
+
+    def padded(start: int, end: int) -> Tuple[int, int]:
+        return max(0, start - padding), min(total_duration, end + padding)
+
+    def fits_padded(start: int, end: int) -> bool:
+        padded_start, padded_end = padded(start, end)
+        if fits is not None:
+            return fits(padded_start, padded_end)
+        return padded_end - padded_start <= max_segment_duration
+
+    # Short audio is not split while it fits
+    max_duration = total_duration
+    if total_duration > config.SEGMENT_AUDIO_DURATION_SPLIT_THRESHOLD_SEC:
+        max_duration = int(config.SEGMENT_AUDIO_DURATION_SEC * SEGMENT_DURATION_STRETCH_RATIO)
+
+    if not isinstance(timecodes, TimecodeIndex):
+        timecodes = TimecodeIndex(timecodes)
+
+    first, last = timecodes.bounds(1, total_duration - 1)
+    timecode_times = list(timecodes.times[first:last])
+
+    def caption_size(start: int, end: int) -> int:
+        return timecodes.text_size(start, end - 1)
+
+    step = max(1, min(PLAN_CUT_GRID_STEP_SEC, max_segment_duration // 4))
+    cuts = sorted(set(range(0, total_duration, step)) | set(timecode_times) | {total_duration})
+
+    bounds = None
+    if config.SEGMENT_REBALANCE_TO_FIT_TIMECODES and timecode_times:
+        bounds = _plan_cheapest(cuts, set(timecode_times), fits_padded, max_duration, caption_size, available_caption_size)
+    if bounds is None:
+        bounds = _plan_cheapest(cuts, set(timecode_times), fits_padded, max_duration, None, 0)
+    if bounds is None:
+        # Even one grid step does not fit the limits. Fallback to plain parts by duration.
+        segments = get_segments_by_duration(total_duration, max(1, max_segment_duration - 2 * padding))
+        return add_paddings_to_segments(segments, padding)
 
-    # todo
-
-    # Extract start and end times of the original segments
-    full_start = segments[0].get('start')
-    full_end = segments[-1].get('end')
-
-    # Check if rebalance is needed
-    for segment in segments:
-        timecodes_text = get_timecodes_formatted_text(
-            filter_timecodes_within_bounds(
-                timecodes=timecodes_dict,
-                start_time=segment.get('start') + config.SEGMENT_DURATION_PADDING_SEC,
-                end_time=segment.get('end') - config.SEGMENT_DURATION_PADDING_SEC - 1),
-            full_start)
-
-        if available_caption_size - len(timecodes_text) < 0:
-            break
-    else:
-        return segments
-
-    # Initialize variables for grouping timecodes
-    timecode_groups = []
-    current_group = []
-    current_group_len = 0
-
-    # Group timecodes
-    for time, timecode in timecodes_dict.items():
-        timecode_text = f"00:00:00 - {timecode.get('title')}"
-        proposed_len = current_group_len + len(timecode_text)
-
-        if available_caption_size - proposed_len < 0:
-            timecode_groups.append(current_group)
-            current_group = [time]
-            current_group_len = len(timecode_text)
-            continue
-
-        if current_group and time - current_group[0] > max_audio_len_sec:
-            timecode_groups.append(current_group)
-            current_group = [time]
-            current_group_len = len(timecode_text)
-            continue
-
-        current_group.append(time)
-        current_group_len = proposed_len
-
-    # Add the last group if it exists
-    if current_group:
-        timecode_groups.append(current_group)
-
-
-    # Create new segments from groups
-    new_segments = []
-    for i, group in enumerate(timecode_groups):
-        start_time = group[0]
-        end_time = (
-            timecode_groups[i + 1][0] - 1
-            if i < len(timecode_groups) - 1
-            else full_end
-        )
-
-        new_segments.append({
-            "start": start_time,
-            "end": end_time,
-            "title": ""  # Title can be added dynamically if needed
-        })
-
-        # Check if the last segment can be unified with the second-to-last segment
-    if len(new_segments) > 1:
-        last_segment = new_segments[-1]
-        second_last_segment = new_segments[-2]
-
-        # Get timecodes within the last two segments
-        last_timecodes = filter_timecodes_within_bounds(
-            timecodes=timecodes_dict,
-            start_time=last_segment['start'],
-            end_time=last_segment['end']
-        )
-        second_last_timecodes = filter_timecodes_within_bounds(
-            timecodes=timecodes_dict,
-            start_time=second_last_segment['start'],
-            end_time=second_last_segment['end']
-        )
-
-        # Combine their text lengths
-        combined_text_length = len(get_timecodes_formatted_text(last_timecodes, last_segment['start'])) + \
-                               len(get_timecodes_formatted_text(second_last_timecodes, second_last_segment['start']))
-
-        if combined_text_length <= available_caption_size:
-            # Merge the segments
-            second_last_segment['end'] = last_segment['end']
-            new_segments.pop()  # Remove the last segment
-
-    return new_segments
-
+    segments = []
+    for start, end in bounds:
+        padded_start, padded_end = padded(start, end)
+        segments.append({'start': padded_start, 'end': padded_end, 'title': ''})
 
+    return segments
@@ -0,0 +1,51 @@
+import asyncio
+import copy
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from ytb2audiobot.logger import logger
+
+
+class SingleFlight:
+    """Registry of in-flight pipeline stages keyed by what they produce.
+
+    The first caller with a given key starts the work. Callers arriving with the same key while it is
+    still running attach to the same task and receive a copy of its result, so N simultaneous requests
+    for the same movie cost one download and one split.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, asyncio.Task] = {}
+
+    def is_in_flight(self, key: Hashable) -> bool:
+        """Check if work for the key is running right now."""
+        return key in self._flights
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def run(self, key: Hashable, func: Callable[..., Awaitable[Any]], **kwargs) -> Any:
+        """
+        Run `func(**kwargs)` once per key, attaching concurrent callers to the running task.
+
+        Args:
+            key (Hashable): Identity of the produced artifact, e.g. ('audio', movie_id, bitrate, options).
+            func (Callable[..., Awaitable[Any]]): Coroutine function producing the artifact.
+            **kwargs: Keyword arguments passed to `func`.
+
+        Returns:
+            Any: A deep copy of the result, so callers may mutate it independently.
+        """
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.create_task(func(**kwargs))
+            self._flights[key] = task
+            task.add_done_callback(lambda _task: self._flights.pop(key, None))
+        else:
+            logger.debug(f'🛫 Attached to in-flight work: {key}')
+
+        # Shield: one caller hitting its own timeout must not cancel the work for everybody else.
+        result = await asyncio.shield(task)
+        return copy.deepcopy(result)
+
+
+single_flight = SingleFlight()
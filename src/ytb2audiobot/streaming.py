@@ -0,0 +1,300 @@
+import asyncio
+import os
+import pathlib
+import shutil
+import tempfile
+from typing import List, Optional, Tuple
+
+from ytb2audiobot import config
+from ytb2audiobot.download import is_info_json_fresh
+from ytb2audiobot.logger import logger
+from ytb2audiobot.scheduler import job_scheduler, STAGE_CPU
+from ytb2audiobot.transcode import parse_bitrate
+from ytb2audiobot.utils import get_short_youtube_url_with_http
+
+# Share of the file size limit planned for audio of a streamed part. The encoder is not exactly CBR.
+STREAMING_BITRATE_SHARE_OF_FILE_SIZE = 0.89
+
+# A part closed earlier than its planned end by more than this was cut short by the end of the input
+STREAMING_SEGMENT_END_TOLERANCE_SEC = 1.0
+
+
+def get_streaming_max_segment_duration(bitrate: str) -> Optional[int]:
+    """Longest streamed part which fits the file size limit, estimated from the bitrate. None if it is unknown."""
+    kbit_per_sec = parse_bitrate(bitrate)
+    if not kbit_per_sec:
+        return None
+    return int(STREAMING_BITRATE_SHARE_OF_FILE_SIZE * config.TELEGRAM_MAX_FILE_SIZE_BYTES * 8 / (kbit_per_sec * 1000))
+
+
+def get_streaming_segment_paths(audio_path: pathlib.Path, total: int) -> List[pathlib.Path]:
+    """Same names as parts from `make_split_audio_second`, so the data cache treats them as segments."""
+    return [audio_path.with_stem(f'{audio_path.stem}-p{idx + 1}-of{total}') for idx in range(total)]
+
+
+def get_streaming_part_path(path: pathlib.Path) -> pathlib.Path:
+    return path.with_name(f'{path.stem}.part{path.suffix}')
+
+
+def get_yt_dlp_stream_argv(
+        movie_id: str,
+        info_json_path: Optional[pathlib.Path] = None,
+        audio_format: str = 'bestaudio/best') -> List[str]:
+    argv = ['yt-dlp', '--quiet', '--no-warnings', '--no-progress', '--format', audio_format, '--output', '-']
+    if info_json_path is not None and is_info_json_fresh(info_json_path):
+        return argv + ['--load-info-json', pathlib.Path(info_json_path).as_posix()]
+    return argv + [get_short_youtube_url_with_http(movie_id)]
+
+
+def get_ffmpeg_segment_argv(
+        segments: list,
+        bitrate: str,
+        output_pattern: str,
+        title: str = '',
+        author: str = '') -> List[str]:
+    return [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-i', 'pipe:0',
+        '-vn', '-map', '0:a:0', '-c:a', 'aac', '-b:a', bitrate,
+        '-metadata', f'title={title}', '-metadata', f'artist={author}',
+        '-f', 'segment', '-segment_times', ','.join(str(segment['start']) for segment in segments[1:]),
+        '-segment_start_number', '1', '-reset_timestamps', '1',
+        # Every closed part is reported on stdout as `filename,start,end`
+        '-segment_list', 'pipe:1', '-segment_list_type', 'csv',
+        output_pattern]
+
+
+def get_ffmpeg_memory_argv(codec_args: List[str], title: str = '', author: str = '') -> List[str]:
+    # MP4 is written into a pipe, so it is fragmented: moov first, then fragments of 10 seconds
+    return [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0',
+        '-vn', '-map', '0:a:0', *codec_args,
+        '-metadata', f'title={title}', '-metadata', f'artist={author}',
+        '-f', 'mp4', '-movflags', 'empty_moov+default_base_moof', '-frag_duration', '10000000',
+        'pipe:1']
+
+
+async def start_pipeline(
+        yt_dlp_argv: List[str],
+        ffmpeg_argv: List[str]) -> Tuple[asyncio.subprocess.Process, asyncio.subprocess.Process]:
+    """Start yt-dlp writing into stdin of ffmpeg. Stdout and stderr of ffmpeg and stderr of yt-dlp are pipes."""
+    downloader = None
+    read_fd, write_fd = os.pipe()
+    try:
+        downloader = await asyncio.create_subprocess_exec(
+            *yt_dlp_argv, stdout=write_fd, stderr=asyncio.subprocess.PIPE)
+        encoder = await asyncio.create_subprocess_exec(
+            *ffmpeg_argv, stdin=read_fd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    except Exception:
+        if downloader is not None:
+            downloader.kill()
+            await downloader.wait()
+        raise
+    finally:
+        # Both ends now belong to the processes: ffmpeg gets EOF when yt-dlp exits
+        os.close(read_fd)
+        os.close(write_fd)
+    return downloader, encoder
+
+
+async def stop_pipeline(*processes: asyncio.subprocess.Process) -> None:
+    for process in processes:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+
+def get_pipeline_error(
+        downloader: asyncio.subprocess.Process,
+        downloader_stderr: bytes,
+        encoder: asyncio.subprocess.Process,
+        encoder_stderr: bytes) -> str:
+    """Error text of finished processes, empty if both succeeded."""
+    if downloader.returncode != 0:
+        return f'yt-dlp failed with return code {downloader.returncode}: {downloader_stderr.decode().strip()}'
+    if encoder.returncode != 0:
+        return f'ffmpeg failed with return code {encoder.returncode}: {encoder_stderr.decode().strip()}'
+    return ''
+
+
+async def download_audio_to_memory(
+        movie_id: str,
+        bitrate: str,
+        max_bytes: int,
+        info_json_path: Optional[pathlib.Path] = None,
+        format_id: Optional[str] = None,
+        title: str = '',
+        author: str = '') -> Optional[bytes]:
+    """
+    Downloads the audio into memory as fragmented MP4: yt-dlp writes into a pipe, ffmpeg encodes it
+    and writes into another one. Nothing is written to the data dir.
+
+    The CPU stage is taken here for the whole pipe, so the caller must not hold one of the stages.
+
+    Args:
+        movie_id (str): The YouTube video ID.
+        bitrate (str): AAC bitrate, e.g. '48k'.
+        max_bytes (int): Download is stopped if the audio gets bigger.
+        info_json_path (Optional[pathlib.Path]): Already extracted movie info, see `write_info_json`.
+        format_id (Optional[str]): AAC format of the movie to copy without encoding, see `select_native_audio_format`.
+        title (str): Title tag.
+        author (str): Artist tag.
+
+    Returns:
+        Optional[bytes]: The audio, or None if download failed or the audio is too big.
+    """
+    if format_id is not None:
+        yt_dlp_argv = get_yt_dlp_stream_argv(movie_id, info_json_path, format_id)
+        codec_args = ['-c:a', 'copy']
+    else:
+        yt_dlp_argv = get_yt_dlp_stream_argv(movie_id, info_json_path)
+        codec_args = ['-c:a', 'aac', '-b:a', bitrate]
+
+    async with job_scheduler.stage(STAGE_CPU):
+        downloader, encoder = await start_pipeline(yt_dlp_argv, get_ffmpeg_memory_argv(codec_args, title, author))
+        downloader_stderr = asyncio.create_task(downloader.stderr.read())
+        encoder_stderr = asyncio.create_task(encoder.stderr.read())
+        try:
+            chunks = []
+            size = 0
+            while chunk := await encoder.stdout.read(1 << 16):
+                size += len(chunk)
+                if size > max_bytes:
+                    logger.info(f'🧠 {movie_id} Audio is bigger than {max_bytes} bytes. Stop in-memory download.')
+                    return None
+                chunks.append(chunk)
+
+            await asyncio.gather(downloader.wait(), encoder.wait())
+            if error := get_pipeline_error(downloader, await downloader_stderr, encoder, await encoder_stderr):
+                logger.error(f'❌🧠 {movie_id} In-memory download failed. {error}')
+                return None
+        finally:
+            await stop_pipeline(downloader, encoder)
+            await asyncio.gather(downloader_stderr, encoder_stderr, return_exceptions=True)
+
+    return b''.join(chunks)
+
+
+async def save_memory_audio(audio: bytes, output_path: pathlib.Path) -> Optional[pathlib.Path]:
+    """
+    Saves audio from `download_audio_to_memory` into the data dir. Fragments are remuxed into a plain MP4
+    without encoding, so the duration and sample index can be read from the file later.
+    """
+    output_path = pathlib.Path(output_path)
+    part_path = get_streaming_part_path(output_path)
+    process = await asyncio.create_subprocess_exec(
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-i', 'pipe:0', '-c', 'copy', part_path.as_posix(),
+        stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+    _stdout, stderr = await process.communicate(audio)
+
+    if process.returncode != 0 or not part_path.exists():
+        logger.error(f'❌🧠 Unable to save audio to {output_path}: {stderr.decode().strip()}')
+        part_path.unlink(missing_ok=True)
+        return None
+
+    os.replace(part_path, output_path)
+    return output_path
+
+
+async def stream_audio_segments(
+        movie_id: str,
+        audio_path: pathlib.Path,
+        segments: list,
+        bitrate: str,
+        queue: asyncio.Queue,
+        info_json_path: Optional[pathlib.Path] = None,
+        title: str = '',
+        author: str = '') -> None:
+    """
+    Downloads the audio and cuts it into parts on the fly: yt-dlp writes the best audio into a pipe,
+    ffmpeg encodes it and closes a part as soon as the input passes the start of the next one.
+    Every part is put into `queue` right after it is closed, while the rest is still downloading.
+
+    Runs as a task of its own holding the CPU stage, and the consumer uploads parts from the queue
+    in its task, so no stage is ever taken while another is held. See `get_streamed_segment`.
+
+    Parts are cut exactly at segment starts, so paddings are not supported: neighbours must not overlap.
+    The whole rendition is not kept, only the parts.
+
+    Args:
+        movie_id (str): The YouTube video ID.
+        audio_path (pathlib.Path): Rendition path the part names are derived from, e.g. `.../id-48k.m4a`.
+        segments (list): Planned segments with 'start' and 'end', without paddings.
+        bitrate (str): AAC bitrate, e.g. '48k'.
+        queue (asyncio.Queue): Gets `(idx, segment)` of every part with 'path' set.
+        info_json_path (Optional[pathlib.Path]): Already extracted movie info, see `write_info_json`.
+        title (str): Title tag of the parts.
+        author (str): Artist tag of the parts.
+
+    Raises:
+        RuntimeError: If download or encoding failed. Parts queued before stay valid.
+    """
+    audio_path = pathlib.Path(audio_path)
+    paths = get_streaming_segment_paths(audio_path, len(segments))
+    # Jobs of the same movie may stream it at the same time, so every run cuts parts in a directory of its own
+    parts_dir = pathlib.Path(tempfile.mkdtemp(dir=audio_path.parent, prefix=f'{audio_path.stem}-', suffix='.part'))
+    part_paths = [parts_dir / path.name for path in paths]
+    output_pattern = parts_dir / f'{audio_path.stem}-p%d-of{len(segments)}{audio_path.suffix}'
+
+    try:
+        async with job_scheduler.stage(STAGE_CPU):
+            downloader, encoder = await start_pipeline(
+                get_yt_dlp_stream_argv(movie_id, info_json_path),
+                get_ffmpeg_segment_argv(segments, bitrate, output_pattern.as_posix(), title, author))
+
+            downloader_stderr = asyncio.create_task(downloader.stderr.read())
+            encoder_stderr = asyncio.create_task(encoder.stderr.read())
+
+            async def wait_processes() -> str:
+                await asyncio.gather(downloader.wait(), encoder.wait())
+                return get_pipeline_error(downloader, await downloader_stderr, encoder, await encoder_stderr)
+
+            try:
+                idx = 0
+                while idx < len(segments) and (line := await encoder.stdout.readline()):
+                    part_end = float(line.decode().strip().rsplit(',', 2)[-1])
+
+                    if idx == len(segments) - 1:
+                        # The last part is closed by the end of input, which may also be a failed download
+                        if error := await wait_processes():
+                            raise RuntimeError(error)
+                    elif part_end < segments[idx + 1]['start'] - STREAMING_SEGMENT_END_TOLERANCE_SEC:
+                        error = await wait_processes()
+                        raise RuntimeError(error or f'Audio ended at {part_end} sec, before part {idx + 2} of {len(segments)}')
+
+                    os.replace(part_paths[idx], paths[idx])
+                    logger.debug(f'📡 {movie_id} Part {idx + 1} of {len(segments)} is ready: {paths[idx].name}')
+                    queue.put_nowait((idx, dict(segments[idx], path=paths[idx])))
+                    idx += 1
+
+                if idx < len(segments):
+                    error = await wait_processes()
+                    raise RuntimeError(error or f'Only {idx} of {len(segments)} parts were produced')
+
+            finally:
+                await stop_pipeline(downloader, encoder)
+                await asyncio.gather(downloader_stderr, encoder_stderr, return_exceptions=True)
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
+
+async def get_streamed_segment(queue: asyncio.Queue, producer: asyncio.Task) -> Tuple[int, dict]:
+    """
+    Next part put into `queue` by the `stream_audio_segments` task `producer`.
+
+    Raises:
+        RuntimeError: If the producer failed or finished before putting another part.
+    """
+    getter = asyncio.ensure_future(queue.get())
+    try:
+        await asyncio.wait({getter, producer}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        if not getter.done():
+            getter.cancel()
+
+    if getter.done() and not getter.cancelled():
+        return getter.result()
+    if not queue.empty():
+        return queue.get_nowait()
+    if error := producer.exception():
+        raise RuntimeError(str(error)) from error
+    raise RuntimeError('Streaming finished without the next part')
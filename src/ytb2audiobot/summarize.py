@@ -32,6 +32,11 @@ async def format_summary2timecodes(summary: dict) -> dict:
     }
 
 
+def get_summary_path(movie_id: str, dir_path: str | pathlib.Path) -> pathlib.Path:
+    """Returns the path where the summary JSON of the movie is stored."""
+    return pathlib.Path(dir_path) / f'{movie_id}-summary.json'
+
+
 async def download_summary(movie_id: str, dir_path: str | pathlib.Path, language: str = 'en', skip: bool = False) -> dict:
     """Downloads and processes a movie summary.
 
@@ -48,7 +53,7 @@ async def download_summary(movie_id: str, dir_path: str | pathlib.Path, language
         return {}
 
     dir_path = pathlib.Path(dir_path)
-    summarize_path = dir_path / f'{movie_id}-summary.json'
+    summarize_path = get_summary_path(movie_id, dir_path)
 
     # If summary file exists, read it
     if summarize_path.exists():
@@ -0,0 +1,143 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Union
+
+from aiogram.exceptions import TelegramEntityTooLarge, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+from ytb2audiobot import config
+from ytb2audiobot.logger import logger
+
+# Per-chat buckets which are idle and full are dropped when there are more of them than this
+CHAT_BUCKETS_CLEANUP_SIZE = 1000
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts up to `capacity`. Waiters are served in FIFO order."""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        # Moment before which nobody may take a token, set by Telegram's RetryAfter
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def is_idle(self) -> bool:
+        self._refill()
+        return not self._lock.locked() and self.tokens >= self.capacity and self.blocked_until <= time.monotonic()
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if self.blocked_until > now:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class TelegramSender:
+    """Single place to call Telegram send methods under the global and per-chat rate limits.
+
+    Calls of all jobs pass through the same buckets, so uploads of different parts and different jobs overlap
+    as far as Telegram allows instead of sleeping a fixed time between messages. `RetryAfter` blocks
+    the chat bucket for the requested time, network and server errors are retried with backoff.
+    """
+
+    def __init__(
+            self,
+            global_per_sec: float = config.TELEGRAM_GLOBAL_MESSAGES_PER_SEC,
+            chat_per_min: float = config.TELEGRAM_CHAT_MESSAGES_PER_MIN,
+            max_attempts: int = config.TELEGRAM_SEND_MAX_ATTEMPTS):
+        """
+        Initialize the sender.
+
+        Args:
+            global_per_sec (float): Messages per second the bot may send in total.
+            chat_per_min (float): Messages per minute the bot may send into one chat.
+            max_attempts (int): Attempts of one call before the error is raised.
+        """
+        self.global_bucket = TokenBucket(rate=global_per_sec, capacity=global_per_sec)
+        self.chat_rate = chat_per_min / 60
+        # A few messages in a row are fine, the limit is about the average rate
+        self.chat_capacity = max(1.0, chat_per_min / 20)
+        self.max_attempts = max(1, max_attempts)
+        self._chat_buckets: Dict[Union[int, str], TokenBucket] = {}
+
+        self.total_calls = 0
+        self.total_retry_after = 0
+        self.total_network_retries = 0
+
+    def _chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > CHAT_BUCKETS_CLEANUP_SIZE:
+                for idle_chat_id in [key for key, value in self._chat_buckets.items() if value.is_idle()]:
+                    del self._chat_buckets[idle_chat_id]
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate=self.chat_rate, capacity=self.chat_capacity)
+        return bucket
+
+    async def call(self, chat_id: Union[int, str], method: Callable[..., Awaitable[Any]], **kwargs) -> Any:
+        """
+        Call a bot method which sends into `chat_id`, e.g. `bot.send_audio`, under the rate limits.
+
+        Args:
+            chat_id (Union[int, str]): Target chat. Used for the per-chat limit.
+            method (Callable[..., Awaitable[Any]]): Bound bot method.
+            **kwargs: Arguments of the method.
+
+        Returns:
+            Any: Result of the method.
+        """
+        chat_bucket = self._chat_bucket(chat_id)
+
+        for attempt in range(self.max_attempts):
+            await chat_bucket.acquire()
+            await self.global_bucket.acquire()
+            self.total_calls += 1
+
+            try:
+                return await method(**kwargs)
+
+            except TelegramRetryAfter as e:
+                self.total_retry_after += 1
+                logger.warning(f'🚥 RetryAfter {e.retry_after} sec for chat {chat_id}, attempt {attempt + 1}/{self.max_attempts}')
+                if attempt == self.max_attempts - 1:
+                    raise
+                chat_bucket.block(e.retry_after)
+
+            except TelegramEntityTooLarge:
+                # Same request will be too large again
+                raise
+
+            except (TelegramNetworkError, TelegramServerError) as e:
+                self.total_network_retries += 1
+                logger.warning(f'🚥 {type(e).__name__} for chat {chat_id}, attempt {attempt + 1}/{self.max_attempts}: {e}')
+                if attempt == self.max_attempts - 1:
+                    raise
+                await asyncio.sleep(2 * (attempt + 1))  # backoff
+
+    def stats(self) -> dict:
+        return {
+            'total_calls': self.total_calls,
+            'total_retry_after': self.total_retry_after,
+            'total_network_retries': self.total_network_retries,
+            'chats': len(self._chat_buckets)}
+
+
+telegram_sender = TelegramSender()
@@ -0,0 +1,76 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterator, Optional, Tuple
+
+from ytb2audiobot.download import get_timecodes_formatted_text
+
+
+class TimecodeIndex:
+    """Timecodes, chapters or summary items sorted by time with range queries by binary search.
+
+    Times are kept in a sorted array with parallel lists of titles and types. Length of every rendered
+    caption line is computed once, so the caption size of any time range is a difference of prefix sums.
+    """
+
+    __slots__ = ('times', 'titles', 'types', '_line_size_prefix')
+
+    def __init__(self, timecodes: Optional[dict] = None):
+        """
+        Args:
+            timecodes (Optional[dict]): Timecodes by time in seconds: {time: {'title': ..., 'type': ...}}.
+                Items without a numeric time are skipped.
+        """
+        items = sorted(
+            (int(time), value) for time, value in (timecodes or {}).items()
+            if isinstance(time, (int, float)) and not isinstance(time, bool))
+
+        self.times = array('q', (time for time, _value in items))
+        self.titles = [value.get('title', '') for _time, value in items]
+        self.types = [value.get('type', '') for _time, value in items]
+        self._line_size_prefix = None
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def __bool__(self) -> bool:
+        return len(self.times) > 0
+
+    def __iter__(self) -> Iterator[Tuple[int, dict]]:
+        for idx in range(len(self.times)):
+            yield self.times[idx], {'title': self.titles[idx], 'type': self.types[idx]}
+
+    def to_dict(self) -> Dict[int, dict]:
+        return dict(iter(self))
+
+    def bounds(self, start_time: int, end_time: int) -> Tuple[int, int]:
+        """Indexes [first, last) of items with start_time <= time <= end_time."""
+        first = bisect_left(self.times, start_time)
+        last = bisect_right(self.times, end_time, lo=first)
+        return first, last
+
+    def within(self, start_time: int, end_time: int) -> Dict[int, dict]:
+        """Same result as `filter_timecodes_within_bounds` in O(log n + k)."""
+        first, last = self.bounds(start_time, end_time)
+        return {
+            self.times[idx]: {'title': self.titles[idx], 'type': self.types[idx]}
+            for idx in range(first, last)}
+
+    def formatted_text(self, start_time: int, end_time: int, shift: int = 0) -> str:
+        """Caption lines of items within the range, times shown relative to `shift`."""
+        return get_timecodes_formatted_text(self.within(start_time, end_time), shift)
+
+    def text_size(self, start_time: int, end_time: int) -> int:
+        """
+        Upper bound of `len(formatted_text(start_time, end_time, shift))` for any shift.
+
+        Each line is measured with its absolute time, which is never shorter than a time relative to the shift.
+        """
+        if self._line_size_prefix is None:
+            prefix = array('q', [0])
+            for idx in range(len(self.times)):
+                line = get_timecodes_formatted_text({self.times[idx]: {'title': self.titles[idx]}}, 0)
+                prefix.append(prefix[-1] + len(line) + 1)
+            self._line_size_prefix = prefix
+
+        first, last = self.bounds(start_time, end_time)
+        return self._line_size_prefix[last] - self._line_size_prefix[first]
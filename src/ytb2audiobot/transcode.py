@@ -0,0 +1,204 @@
+import asyncio
+import pathlib
+import shlex
+from typing import Dict, List, Optional
+
+from ytb2audiobot import config
+from ytb2audiobot.download_manager import get_existing_artifact, publish_artifact
+from ytb2audiobot.logger import logger
+from ytb2audiobot.scheduler import job_scheduler, STAGE_CPU
+from ytb2audiobot.utils import run_command
+
+
+# Codecs which are kept as is in an .m4a file playable by Telegram clients
+REMUX_AUDIO_CODECS = ('mp4a',)
+
+
+def parse_bitrate(bitrate: str) -> Optional[float]:
+    """'48k' -> 48.0 kbit/s"""
+    try:
+        return float(str(bitrate).lower().rstrip('k'))
+    except ValueError:
+        return None
+
+
+def select_native_audio_format(
+        audio_formats: List[dict],
+        bitrate: str,
+        tolerance: float = config.REMUX_BITRATE_TOLERANCE) -> Optional[dict]:
+    """
+    Pick the audio-only format which can be copied into the .m4a without re-encoding.
+
+    Args:
+        audio_formats (List[dict]): Audio-only formats with 'format_id', 'acodec', 'abr' and 'ext'.
+        bitrate (str): Requested bitrate, e.g. '48k'.
+        tolerance (float): Allowed relative difference between the format's and the requested bitrate.
+
+    Returns:
+        Optional[dict]: The format with the closest bitrate within tolerance, or None if encoding is needed.
+    """
+    target = parse_bitrate(bitrate)
+    if not target or tolerance <= 0:
+        return None
+
+    candidates = [
+        item for item in audio_formats
+        if str(item.get('acodec') or '').startswith(REMUX_AUDIO_CODECS) and item.get('ext') == 'm4a'
+        and item.get('abr') and abs(item.get('abr') - target) <= tolerance * target]
+    if not candidates:
+        return None
+
+    return min(candidates, key=lambda item: abs(item.get('abr') - target))
+
+
+def get_rendition_path(movie_id: str, bitrate: str, dir_path: pathlib.Path) -> pathlib.Path:
+    return pathlib.Path(dir_path) / f'{movie_id}-{bitrate}.m4a'
+
+
+def get_prepared_bitrates() -> List[str]:
+    """Bitrates from Y2A_TRANSCODE_PREPARE_BITRATES which are derived along with the requested one."""
+    return [
+        bitrate.strip() for bitrate in config.TRANSCODE_PREPARE_BITRATES.split(',')
+        if bitrate.strip() in config.BITRATE_VALUES]
+
+
+def get_renditions(movie_id: str, bitrate: str, dir_path: pathlib.Path) -> Dict[str, pathlib.Path]:
+    """Requested rendition plus prepared ones which are not in the data dir yet."""
+    renditions = {bitrate: get_rendition_path(movie_id, bitrate, dir_path)}
+    for prepared_bitrate in get_prepared_bitrates():
+        path = get_rendition_path(movie_id, prepared_bitrate, dir_path)
+        if get_existing_artifact(path) is None:
+            renditions.setdefault(prepared_bitrate, path)
+    return renditions
+
+
+def get_chunk_count(duration: Optional[float]) -> int:
+    """Number of pieces to encode in parallel: one per CPU stage, each at least TRANSCODE_CHUNK_MIN_SEC long."""
+    if not duration or config.TRANSCODE_PARALLEL_CHUNKS <= 1:
+        return 1
+    return max(1, min(config.TRANSCODE_PARALLEL_CHUNKS, int(duration // config.TRANSCODE_CHUNK_MIN_SEC)))
+
+
+def get_part_path(path: pathlib.Path, name: str = 'part') -> pathlib.Path:
+    """Temporary file next to the target with the same extension, so ffmpeg picks the same muxer."""
+    return path.with_name(f'{path.stem}.{name}{path.suffix}')
+
+
+def get_metadata_args(tags: Optional[Dict[str, str]]) -> str:
+    return ''.join(f'-metadata {shlex.quote(f"{key}={value}")} ' for key, value in (tags or {}).items())
+
+
+def get_encode_outputs(part_paths: Dict[str, pathlib.Path], tags: Optional[Dict[str, str]] = None) -> str:
+    return ' '.join(
+        f'-map 0:a:0 -c:a aac -b:a {bitrate} {get_metadata_args(tags)}"{part_path.as_posix()}"'
+        for bitrate, part_path in part_paths.items())
+
+
+async def run_ffmpeg(command: str) -> bool:
+    logger.debug(f'🎚 Transcode command: {command}')
+    stdout, stderr, return_code = await run_command(command)
+    if return_code != 0:
+        logger.error(f'❌🎚 ffmpeg failed with return code {return_code}: {command}')
+    return return_code == 0
+
+
+async def encode_whole(
+        master_path: pathlib.Path,
+        part_paths: Dict[str, pathlib.Path],
+        tags: Optional[Dict[str, str]] = None) -> bool:
+    async with job_scheduler.stage(STAGE_CPU):
+        return await run_ffmpeg(
+            f'ffmpeg -hide_banner -loglevel error -y -i "{master_path.as_posix()}" -vn '
+            f'{get_encode_outputs(part_paths, tags)}')
+
+
+async def encode_chunked(
+        master_path: pathlib.Path,
+        part_paths: Dict[str, pathlib.Path],
+        duration: float,
+        chunk_count: int,
+        tags: Optional[Dict[str, str]] = None) -> bool:
+    """
+    Encodes time chunks of the master concurrently, each in its own ffmpeg process and CPU stage,
+    then joins chunks of every rendition with the concat demuxer without re-encoding.
+
+    AAC works in frames of 1024 samples, so a join may add up to one frame (~21 ms) of silence.
+    """
+    bounds = [round(duration * idx / chunk_count, 3) for idx in range(chunk_count + 1)]
+    bounds[-1] = duration + 1  # Metadata duration is rounded, so the last chunk reads to the end of the file
+    chunk_paths = [
+        {bitrate: get_part_path(part_path, f'chunk{idx}') for bitrate, part_path in part_paths.items()}
+        for idx in range(chunk_count)]
+
+    async def encode_chunk(idx: int) -> bool:
+        async with job_scheduler.stage(STAGE_CPU):
+            return await run_ffmpeg(
+                f'ffmpeg -hide_banner -loglevel error -y -ss {bounds[idx]} -t {bounds[idx + 1] - bounds[idx]} '
+                f'-i "{master_path.as_posix()}" -vn {get_encode_outputs(chunk_paths[idx])}')
+
+    try:
+        if not all(await asyncio.gather(*(encode_chunk(idx) for idx in range(chunk_count)))):
+            return False
+
+        for bitrate, part_path in part_paths.items():
+            list_path = part_path.with_name(f'{part_path.name}.txt')
+            list_path.write_text(''.join(f"file '{chunks[bitrate].as_posix()}'\n" for chunks in chunk_paths))
+            try:
+                # Master is the second input only to copy its tags
+                if not await run_ffmpeg(
+                        f'ffmpeg -hide_banner -loglevel error -y -f concat -safe 0 -i "{list_path.as_posix()}" '
+                        f'-i "{master_path.as_posix()}" -map 0:a -map_metadata 1 -c copy '
+                        f'{get_metadata_args(tags)}"{part_path.as_posix()}"'):
+                    return False
+            finally:
+                list_path.unlink(missing_ok=True)
+        return True
+    finally:
+        for chunks in chunk_paths:
+            for chunk_path in chunks.values():
+                chunk_path.unlink(missing_ok=True)
+
+
+async def transcode_renditions(
+        master_path: pathlib.Path,
+        renditions: Dict[str, pathlib.Path],
+        duration: Optional[float] = None,
+        tags: Optional[Dict[str, str]] = None) -> Dict[str, pathlib.Path]:
+    """
+    Encodes AAC renditions of the master audio. The master is decoded once for all renditions:
+    every output of an ffmpeg run gets its own encoder.
+
+    Long audio is cut into time chunks which are encoded in parallel, because one AAC encoder uses one core.
+    CPU stages are taken here per ffmpeg process, so the caller must not hold one.
+
+    Args:
+        master_path (pathlib.Path): Best quality audio downloaded once per movie.
+        renditions (Dict[str, pathlib.Path]): Output path by bitrate, e.g. {'48k': '.../id-48k.m4a'}.
+        duration (Optional[float]): Duration of the audio in seconds. Without it the audio is encoded in one piece.
+        tags (Optional[Dict[str, str]]): Tags of the renditions, e.g. {'title': ...}, over those of the master.
+
+    Returns:
+        Dict[str, pathlib.Path]: Paths of valid renditions after the run, by bitrate. A broken one is encoded again.
+    """
+    master_path = pathlib.Path(master_path)
+    todo = {bitrate: pathlib.Path(path) for bitrate, path in renditions.items() if get_existing_artifact(path) is None}
+
+    if todo:
+        # Outputs are written next to the targets and renamed when complete, so a present rendition is always whole
+        part_paths = {bitrate: get_part_path(path) for bitrate, path in todo.items()}
+
+        chunk_count = get_chunk_count(duration)
+        if chunk_count > 1:
+            logger.info(f'🎚 Encoding {master_path.name} in {chunk_count} parallel chunks')
+            success = await encode_chunked(master_path, part_paths, duration, chunk_count, tags)
+        else:
+            success = await encode_whole(master_path, part_paths, tags)
+
+        for bitrate, part_path in part_paths.items():
+            if success and part_path.exists():
+                publish_artifact(part_path, todo[bitrate])
+            else:
+                part_path.unlink(missing_ok=True)
+
+    existing = {bitrate: get_existing_artifact(path) for bitrate, path in renditions.items()}
+    return {bitrate: path for bitrate, path in existing.items() if path is not None}
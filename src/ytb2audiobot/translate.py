@@ -2,6 +2,7 @@ import os
 import pathlib
 from typing import Optional
 from ytb2audiobot import config
+from ytb2audiobot.download_manager import get_existing_artifact, get_staging_path, publish_artifact
 from ytb2audiobot.logger import logger
 from ytb2audiobot.utils import get_short_youtube_url_with_http, run_command
 
@@ -24,15 +25,16 @@ async def make_translate(movie_id: str, output_path: pathlib.Path, timeout: int
     """
     logger.debug(f"🌎 Translating movie with ID: {movie_id}", )
     output_path = pathlib.Path(output_path)
-    if output_path.exists():
+    if get_existing_artifact(output_path) is not None:
         logger.info(f"⚠️📣 Audio file already exists at: {output_path}", )
         return output_path
 
     mp3_output_path = output_path.with_suffix('.mp3')
+    staging_path = get_staging_path(output_path)
     url = get_short_youtube_url_with_http(movie_id)
     command = (f'vot-cli --output="{output_path.parent}" --output-file="{mp3_output_path.stem}" {url} '
                f'&& '
-               f'ffmpeg -i {mp3_output_path} -c:a aac -b:a 48k {output_path}')
+               f'ffmpeg -y -i {mp3_output_path} -c:a aac -b:a 48k {staging_path}')
 
     stdout, stderr, return_code = await run_command(command, timeout=timeout, throttle_delay=10)
 
@@ -46,8 +48,8 @@ async def make_translate(movie_id: str, output_path: pathlib.Path, timeout: int
     if return_code != 0:
         logger.error(f"❌📣 Download failed with return code: {return_code}")
         return None
-    if not output_path.exists():
-        logger.error(f"❌📣 Audio file not found at the expected location: {output_path}")
+    if publish_artifact(staging_path, output_path) is None:
+        logger.error(f"❌📣 Audio file not found at the expected location: {staging_path}")
         return None
 
     logger.info(f"📣 Audio file successfully downloaded to: {output_path}")
@@ -7,7 +7,7 @@ import pathlib
 import datetime
 import shutil
 import time
-from typing import Union
+from typing import Callable, Union
 
 import aiofiles
 import aiofiles.os
@@ -233,13 +233,14 @@ async def run_command_old(cmd):
     return stdout.decode(), stderr.decode(), process.returncode
 
 
-async def run_command(cmd: str, timeout: int = None, throttle_delay: int = 0):
+async def run_command(cmd: str, timeout: int = None, throttle_delay: int = 0, on_line: Callable[[str], None] = None):
     """
     Run a command asynchronously with a timeout option and log output in real-time.
 
     Args:
         cmd (str): The shell command to execute.
         timeout (int or None): Timeout in seconds. If None, no timeout is applied.
+        on_line (Callable[[str], None] or None): Called with every stdout line as soon as it is read.
 
     Returns:
         tuple: (stdout, stderr, return_code)
@@ -257,7 +258,7 @@ async def run_command(cmd: str, timeout: int = None, throttle_delay: int = 0):
     stdout_lines = []
     stderr_lines = []
 
-    async def read_stream(stream, log_func, lines, _throttle_delay):
+    async def read_stream(stream, log_func, lines, _throttle_delay, _on_line=None):
         """Helper to read a stream line by line and log each line with a throttle delay."""
         last_log_time = time.time()
 
@@ -273,6 +274,9 @@ async def run_command(cmd: str, timeout: int = None, throttle_delay: int = 0):
                     last_log_time = current_time
 
                 lines.append(decoded_line)  # Store the line for final return
+
+                if _on_line is not None:
+                    _on_line(decoded_line)
             else:
                 break
 
@@ -281,7 +285,7 @@ async def run_command(cmd: str, timeout: int = None, throttle_delay: int = 0):
         if timeout is not None:
             await asyncio.wait_for(
                 asyncio.gather(
-                    read_stream(process.stdout, logger.debug, stdout_lines, throttle_delay),
+                    read_stream(process.stdout, logger.debug, stdout_lines, throttle_delay, on_line),
                     read_stream(process.stderr, logger.error, stderr_lines, throttle_delay)
                 ),
                 timeout=timeout
@@ -291,7 +295,7 @@ async def run_command(cmd: str, timeout: int = None, throttle_delay: int = 0):
         else:
             # No timeout applied
             await asyncio.gather(
-                read_stream(process.stdout, logger.debug, stdout_lines, throttle_delay),
+                read_stream(process.stdout, logger.debug, stdout_lines, throttle_delay, on_line),
                 read_stream(process.stderr, logger.error, stderr_lines, throttle_delay)
             )
             return_code = await process.wait()
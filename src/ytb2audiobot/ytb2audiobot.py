@@ -3,8 +3,6 @@ import logging
 import os
 import argparse
 import asyncio
-import signal
-import sys
 from functools import wraps
 from importlib.metadata import version
 
@@ -12,6 +10,8 @@ from importlib.metadata import version
 
 from aiogram import Bot, Dispatcher, types, Router
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters import CommandStart, Command, StateFilter
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
@@ -20,10 +20,15 @@ from ytb2audiobot import config
 from ytb2audiobot.autodownload_chat_manager import AutodownloadChatManager
 from ytb2audiobot.callback_storage_manager import StorageCallbackManager
 from ytb2audiobot.config import START_AND_HELP_TEXT, TEXT_SAY_HELLO_BOT_OWNER_AT_STARTUP
-from ytb2audiobot.cron import run_periodically, empty_data_dir_by_cron
-from ytb2audiobot.hardworkbot import job_downloading, make_subtitles
+from ytb2audiobot.cron import run_periodically
+from ytb2audiobot.cache_manager import data_cache
+from ytb2audiobot.extractor_pool import extractor_pool
+from ytb2audiobot.metadata_cache import metadata_cache
+from ytb2audiobot.hardworkbot import job_downloading_stored, make_subtitles
+from ytb2audiobot.job_store import job_store
 from ytb2audiobot.logger import logger
-from ytb2audiobot.utils import remove_all_in_dir, get_data_dir, get_big_youtube_move_id, create_inline_keyboard
+from ytb2audiobot.scheduler import job_scheduler
+from ytb2audiobot.utils import get_data_dir, get_big_youtube_move_id, create_inline_keyboard
 from ytb2audiobot.cron import update_pip_package_ytdlp
 
 
@@ -127,6 +132,32 @@ def cli_action_parser(text: str):
     return action, attributes
 
 
+async def submit_job_downloading(
+        sender_id: int,
+        reply_to_message_id: int | None = None,
+        message_text: str = '',
+        configurations: dict | None = None):
+    """Record a download job in the job store and run it through the scheduler."""
+    job_id = await job_store.add_job(
+        sender_id=sender_id,
+        reply_to_message_id=reply_to_message_id,
+        message_text=message_text,
+        configurations=configurations)
+
+    await job_scheduler.run(sender_id, job_downloading_stored, bot=bot, job_id=job_id)
+
+
+async def resume_unfinished_jobs():
+    """Schedule jobs which were accepted but not finished before the last shutdown."""
+    jobs = await job_store.get_unfinished_jobs()
+    if not jobs:
+        return
+
+    logger.info(f'🗄 Resuming {len(jobs)} unfinished jobs from the job store.')
+    for job in jobs:
+        job_scheduler.submit(job.get('sender_id'), job_downloading_stored, bot=bot, job_id=job.get('id'))
+
+
 @dp.message()
 async def handler_message(message: Message):
     cli_action, cli_attributes = cli_action_parser(message.text)
@@ -143,30 +174,30 @@ async def handler_message(message: Message):
                 word=cli_attributes['word'])
 
     elif cli_action == config.ACTION_NAME_MUSIC:
-        await job_downloading(
-            bot=bot, sender_id=message.from_user.id, reply_to_message_id=message.message_id,
+        await submit_job_downloading(
+            sender_id=message.from_user.id, reply_to_message_id=message.message_id,
             message_text=message.text,
             configurations={'action': config.ACTION_NAME_BITRATE_CHANGE, 'bitrate': config.ACTION_MUSIC_HIGH_BITRATE})
 
     elif cli_action == config.ACTION_NAME_TRANSLATE:
-        await job_downloading(
-            bot=bot, sender_id=message.from_user.id, reply_to_message_id=message.message_id,
+        await submit_job_downloading(
+            sender_id=message.from_user.id, reply_to_message_id=message.message_id,
             message_text=message.text, configurations={
                 'action': cli_action,
                 'overlay': cli_attributes.get('overlay', '')
             })
     elif cli_action == config.ACTION_NAME_FORCE_REDOWNLOAD:
-        await job_downloading(
-            bot=bot, sender_id=message.from_user.id, reply_to_message_id=message.message_id,
+        await submit_job_downloading(
+            sender_id=message.from_user.id, reply_to_message_id=message.message_id,
             message_text=message.text, configurations={'action': cli_action})
 
     elif cli_action == config.ACTION_NAME_SUMMARIZE:
-        await job_downloading(
-            bot=bot, sender_id=message.from_user.id, reply_to_message_id=message.message_id,
+        await submit_job_downloading(
+            sender_id=message.from_user.id, reply_to_message_id=message.message_id,
             message_text=message.text, configurations={'action': cli_action})
     else:
-        await job_downloading(
-            bot=bot, sender_id=message.from_user.id, reply_to_message_id=message.message_id,
+        await submit_job_downloading(
+            sender_id=message.from_user.id, reply_to_message_id=message.message_id,
             message_text=message.text)
 
 
@@ -188,20 +219,20 @@ async def handler_channel_post(message: Message):
             return
 
     if cli_action == config.ACTION_NAME_MUSIC:
-        await job_downloading(
-            bot=bot, sender_id=message.sender_chat.id, reply_to_message_id=message.message_id,
+        await submit_job_downloading(
+            sender_id=message.sender_chat.id, reply_to_message_id=message.message_id,
             message_text=message.text, configurations={'action': cli_action, 'bitrate': config.ACTION_MUSIC_HIGH_BITRATE})
         return
 
     if cli_action == config.ACTION_NAME_FORCE_REDOWNLOAD:
-        await job_downloading(
-            bot=bot, sender_id=message.sender_chat.id, reply_to_message_id=message.message_id,
+        await submit_job_downloading(
+            sender_id=message.sender_chat.id, reply_to_message_id=message.message_id,
             message_text=message.text, configurations={'action': cli_action})
         return
 
     if autodownload_chat_manager.is_chat_id_inside(message.sender_chat.id):
-        await job_downloading(
-            bot=bot, sender_id=message.sender_chat.id, reply_to_message_id=message.message_id,
+        await submit_job_downloading(
+            sender_id=message.sender_chat.id, reply_to_message_id=message.message_id,
             message_text=message.text)
         return
 
@@ -240,40 +271,43 @@ async def run_bot_asynchronously():
         except Exception as e:
             logger.error(f'❌ Error with Say hello. Maybe user id is not valid: \n{e}')
 
-    # todo
-    if not (config.KEEP_DATA_FILES or config.DEBUG_MODE):
-        logger.info('♻️🗑 Remove last files in DATA')
-        remove_all_in_dir(data_dir)
+    # Warm cache survives restarts: files in DATA are kept and evicted only over the byte budget
+    data_cache.restore()
+    metadata_cache.restore()
 
-    # todo empty cron
-    await asyncio.gather(
-        run_periodically(30, empty_data_dir_by_cron, {
-            'age': config.REMOVE_AGED_DATA_FILES_SEC,
-            'keep_files': config.KEEP_DATA_FILES,
-            'folder': data_dir,
-        }),
-        run_periodically(43200, update_pip_package_ytdlp, {}),
-        dp.start_polling(bot),
-        run_periodically(600, autodownload_chat_manager.save_hashed_chat_ids, {}))
-
-
-def handle_suspend(_signal, _frame):
-    """Handle the SIGTSTP signal (Ctrl+Z)."""
-    logger.info("🔫 Process suspended. Exiting...")
-    # No need to pause manually; the system handles the suspension
-    sys.exit(0)
-
-
-def handle_interrupt(_signal, _frame):
-    """Handle the SIGINT signal (Ctrl+C)."""
-    logger.info("🔫 Process interrupted by user. Exiting...")
-    sys.exit(0)
+    periodic_tasks = []
+    # Ctrl+C cancels this task at any point, also before polling, and the shutdown below still runs
+    try:
+        await extractor_pool.start()
+
+        await resume_unfinished_jobs()
+
+        periodic_tasks = [
+            asyncio.create_task(run_periodically(30, data_cache.enforce_budget, {})),
+            asyncio.create_task(run_periodically(43200, update_pip_package_ytdlp, {})),
+            asyncio.create_task(run_periodically(600, autodownload_chat_manager.save_hashed_chat_ids, {})),
+            asyncio.create_task(run_periodically(600, metadata_cache.save_periodically, {})),
+            asyncio.create_task(run_periodically(config.SCHEDULER_STATS_LOG_INTERVAL_SEC, job_scheduler.log_stats, {})),
+            asyncio.create_task(run_periodically(config.SCHEDULER_STATS_LOG_INTERVAL_SEC, data_cache.log_stats, {}))]
+
+        # Polling installs its own SIGINT / SIGTERM handlers and stops on them.
+        # Bot session is kept open so that draining jobs can still talk to Telegram.
+        await dp.start_polling(bot, close_bot_session=False)
+    finally:
+        # Let running jobs finish. Whatever is left stays in the job store and is resumed on next start.
+        await job_scheduler.drain(timeout=config.SHUTDOWN_DRAIN_TIMEOUT_SEC)
+
+        for task in periodic_tasks:
+            task.cancel()
+        await autodownload_chat_manager.save_hashed_chat_ids()
+        data_cache.save()
+        metadata_cache.save()
+        extractor_pool.shutdown()
+        await bot.session.close()
 
 
 def main():
-    signal.signal(signal.SIGTSTP, handle_suspend)
-    signal.signal(signal.SIGINT, handle_interrupt)
-    logger.info("Starting ... Press Ctrl+C to stop or Ctrl+Z to suspend.")
+    logger.info("Starting ... Press Ctrl+C to stop.")
 
     _parser = argparse.ArgumentParser(
         description='🥭 Bot. Youtube to audio telegram bot with subtitles',
@@ -297,13 +331,22 @@ def main():
 
     logger.info('🗂 Data Dir: ' + f'{data_dir.resolve().as_posix()}')
 
+    session = None
+    if config.TELEGRAM_API_SERVER_URL:
+        logger.info(f'🛰 Local Bot API server: {config.TELEGRAM_API_SERVER_URL}. '
+                    f'Max file size: {config.TELEGRAM_MAX_FILE_SIZE_BYTES} bytes.')
+        session = AiohttpSession(api=TelegramAPIServer.from_base(
+            config.TELEGRAM_API_SERVER_URL, is_local=config.TELEGRAM_API_SERVER_LOCAL_FILES))
+
     global bot
-    bot = Bot(token=token, default=DefaultBotProperties(parse_mode='HTML'))
+    bot = Bot(token=token, session=session, default=DefaultBotProperties(parse_mode='HTML'))
 
     dp.include_router(router)
 
     try:
         asyncio.run(run_bot_asynchronously())
+    except KeyboardInterrupt:
+        logger.info("🔫 Process interrupted by user. Stopped.")
     except Exception as e:
         logger.error(f'🦀 Error Running asyncio.run: \n{e}')
 
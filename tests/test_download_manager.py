@@ -0,0 +1,155 @@
+import json
+import pathlib
+import tempfile
+import unittest
+
+from aiohttp import web
+
+from ytb2audiobot.download_manager import BandwidthBudget, DownloadManager, get_staging_path, get_state_path
+
+CHUNK_SIZE = 1000
+DATA = bytes(range(256)) * 20
+
+
+class RangeServer:
+    """Local HTTP server of DATA with Range support and switchable faults."""
+
+    def __init__(self):
+        self.requests = []
+        self.ignore_range = False
+        # Number of next requests answered with 503
+        self.fail_next = 0
+        # Number of next range requests answered with half of the range
+        self.short_next = 0
+        # Content-Range without the total size, as `bytes 0-999/*`
+        self.hide_total = False
+        self._runner = None
+        self.url = ''
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        range_header = request.headers.get('Range', '')
+        self.requests.append(range_header)
+
+        if self.fail_next:
+            self.fail_next -= 1
+            return web.Response(status=503)
+
+        if self.ignore_range or not range_header:
+            return web.Response(body=DATA)
+
+        start, end = (int(value) for value in range_header[len('bytes='):].split('-'))
+        end = min(end, len(DATA) - 1)
+        body = DATA[start:end + 1]
+        if self.short_next:
+            self.short_next -= 1
+            body = body[:len(body) // 2]
+        return web.Response(
+            status=206,
+            body=body,
+            headers={'Content-Range': f'bytes {start}-{end}/{"*" if self.hide_total else len(DATA)}'})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/file', self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f'http://127.0.0.1:{port}/file'
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+class DownloadManagerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = RangeServer()
+        await self.server.start()
+        self.dir = pathlib.Path(tempfile.mkdtemp())
+        self.manager = DownloadManager(
+            max_attempts=3, timeout=5, chunk_size=CHUNK_SIZE, max_connections=4, budget=BandwidthBudget(0, 8))
+
+    async def asyncTearDown(self):
+        await self.server.stop()
+
+    async def test_download_in_ranges(self):
+        output_path = self.dir / 'file.bin'
+        progress = []
+
+        path = await self.manager.download(self.server.url, output_path, key='movie', on_progress=progress.append)
+
+        self.assertEqual(path, output_path)
+        self.assertEqual(output_path.read_bytes(), DATA)
+        self.assertEqual(len(self.server.requests), len(DATA) // CHUNK_SIZE + 1)
+        self.assertEqual(progress[-1], 100)
+        self.assertFalse(get_staging_path(output_path).exists())
+        self.assertFalse(get_state_path(get_staging_path(output_path)).exists())
+
+    async def test_resume_fetches_only_missing_chunks(self):
+        output_path = self.dir / 'file.bin'
+        part_path = get_staging_path(output_path)
+        part_path.write_bytes(DATA[:2 * CHUNK_SIZE])
+        get_state_path(part_path).write_text(json.dumps({
+            'key': 'movie', 'size': None, 'chunk_size': CHUNK_SIZE, 'total': len(DATA), 'done': [0, 1]}))
+
+        path = await self.manager.download(self.server.url, output_path, key='movie')
+
+        self.assertEqual(path.read_bytes(), DATA)
+        self.assertNotIn(f'bytes=0-{CHUNK_SIZE - 1}', self.server.requests)
+        self.assertNotIn(f'bytes={CHUNK_SIZE}-{2 * CHUNK_SIZE - 1}', self.server.requests)
+        self.assertEqual(len(self.server.requests), len(DATA) // CHUNK_SIZE - 1)
+
+    async def test_part_of_other_content_is_started_over(self):
+        output_path = self.dir / 'file.bin'
+        part_path = get_staging_path(output_path)
+        part_path.write_bytes(b'x' * CHUNK_SIZE)
+        get_state_path(part_path).write_text(json.dumps({
+            'key': 'other', 'size': None, 'chunk_size': CHUNK_SIZE, 'total': len(DATA), 'done': [0]}))
+
+        path = await self.manager.download(self.server.url, output_path, key='movie')
+
+        self.assertEqual(path.read_bytes(), DATA)
+        self.assertIn(f'bytes=0-{CHUNK_SIZE - 1}', self.server.requests)
+
+    async def test_server_ignoring_range(self):
+        self.server.ignore_range = True
+        output_path = self.dir / 'file.bin'
+
+        path = await self.manager.download(self.server.url, output_path, key='movie')
+
+        self.assertEqual(path.read_bytes(), DATA)
+        self.assertEqual(len(self.server.requests), 1)
+
+    async def test_server_error_is_retried(self):
+        self.server.fail_next = 2
+        output_path = self.dir / 'file.bin'
+
+        path = await self.manager.download(self.server.url, output_path, key='movie', expected_size=len(DATA))
+
+        self.assertEqual(path.read_bytes(), DATA)
+        self.assertEqual(self.server.requests.count(f'bytes=0-{CHUNK_SIZE - 1}'), 3)
+
+    async def test_short_range_without_total_is_retried(self):
+        self.server.hide_total = True
+        self.server.short_next = 1
+        output_path = self.dir / 'file.bin'
+
+        path = await self.manager.download(self.server.url, output_path, key='movie', expected_size=len(DATA))
+
+        self.assertEqual(path.read_bytes(), DATA)
+        self.assertEqual(self.server.requests.count(f'bytes=0-{CHUNK_SIZE - 1}'), 2)
+
+    async def test_server_error_after_all_attempts_keeps_part(self):
+        self.server.fail_next = 3
+        output_path = self.dir / 'file.bin'
+
+        path = await self.manager.download(self.server.url, output_path, key='movie', expected_size=len(DATA))
+
+        self.assertIsNone(path)
+        self.assertFalse(output_path.exists())
+        self.assertTrue(get_state_path(get_staging_path(output_path)).exists())
+
+
+if __name__ == '__main__':
+    unittest.main()